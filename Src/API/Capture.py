@@ -0,0 +1,357 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Capture - 命令输出文件的有界读取
+大文件只读取开头与结尾（seek），中间部分流式扫描，统计总行数/字节数并摘出匹配错误模式的行，
+内存占用与文件大小无关；二进制输出只报告大小，不解码
+扫描结果按文件路径/大小/修改时间缓存，同一文件再次读取（如写入邮件）时不再扫描全文
+"""
+
+import os
+import re
+import sys
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+MODULE_NAME = "Capture"
+
+# 默认保留的开头/结尾字节数
+DEFAULT_HEAD_BYTES = 2048
+DEFAULT_TAIL_BYTES = 2048
+
+# 默认错误模式（不区分大小写）
+DEFAULT_ERROR_PATTERNS = [
+    r"error",
+    r"fail",
+    r"exception",
+    r"traceback",
+    r"fatal",
+    r"panic",
+    r"denied",
+    r"not found",
+    r"错误",
+    r"失败",
+]
+
+# 最多摘出的错误行数与每行最大长度
+DEFAULT_MAX_ERROR_LINES = 20
+ERROR_LINE_LENGTH = 300
+
+# 流式扫描的块大小
+SCAN_CHUNK = 1024 * 1024
+
+# 默认只在开头这么多字节内查找错误行（之后只统计行数，结尾部分本身会完整保留）
+DEFAULT_ERROR_SCAN_BYTES = 64 * 1024 * 1024
+
+# 扫描结果缓存的最大条数
+SCAN_CACHE_SIZE = 64
+
+# 扫描结果缓存 {(realpath, size, mtime_ns, patterns, max_error_lines, error_scan_bytes): (total_lines, error_count, error_lines)}
+_scan_cache = OrderedDict()
+
+# 二进制检测读取的字节数
+BINARY_SAMPLE = 8192
+
+# 文本中允许出现的控制字符（\t \n \r \f \b ESC）
+TEXT_CONTROL = {8, 9, 10, 12, 13, 27}
+
+
+def Is_Binary(sample: bytes) -> bool:
+    """
+    判断数据是否为二进制：包含NUL，或控制字符占比超过30%
+    
+    Args:
+        sample: 文件开头的数据
+    
+    Returns:
+        是否为二进制
+    """
+    if not sample:
+        return False
+    if b"\0" in sample:
+        return True
+    control = sum(1 for byte in sample if byte < 32 and byte not in TEXT_CONTROL)
+    return control / len(sample) > 0.3
+
+
+class _Error_Matcher:
+    """
+    错误模式匹配 - 纯文本模式转小写后用子串查找（bytes.find，远快于大小写不敏感的正则），
+    其余模式合并为一个正则；扫描时先整块判断，只有命中的块才逐行匹配
+    """
+    
+    def __init__(self, patterns: list):
+        literals = [pattern for pattern in patterns if re.escape(pattern) == pattern]
+        expressions = [pattern for pattern in patterns if re.escape(pattern) != pattern]
+        self.literals = [literal.lower().encode("utf-8") for literal in literals]
+        self.regex = None
+        if expressions:
+            joined = "|".join(f"(?:{expression})" for expression in expressions)
+            self.regex = re.compile(joined.encode("utf-8"), re.IGNORECASE)
+    
+    def Search(self, data: bytes) -> bool:
+        """判断数据中是否有匹配的错误模式"""
+        if self.literals:
+            lowered = data.lower()
+            if any(literal in lowered for literal in self.literals):
+                return True
+        return self.regex is not None and self.regex.search(data) is not None
+
+
+def _Compile_Patterns(patterns: list):
+    """构建错误模式匹配器（无模式时返回None）"""
+    if not patterns:
+        return None
+    return _Error_Matcher(patterns)
+
+
+def _Scan(f, pattern, max_error_lines: int, error_scan_bytes: int) -> tuple:
+    """
+    按块流式扫描整个文件，统计行数并收集匹配错误模式的行
+    
+    Args:
+        f: 以二进制方式打开的文件
+        pattern: 错误模式匹配器（None为不收集）
+        max_error_lines: 最多收集的错误行数
+        error_scan_bytes: 只在开头这么多字节内查找错误行
+    
+    Returns:
+        (total_lines, error_count, error_lines) 元组，error_lines为[(行号, bytes), ...]
+    """
+    total_lines = 0
+    error_count = 0
+    error_lines = []
+    carry = b""
+    scanned = 0
+    
+    f.seek(0)
+    while True:
+        chunk = f.read(SCAN_CHUNK)
+        if not chunk:
+            break
+        data = carry + chunk
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            # 超长行：只保留有限长度等待下一块
+            carry = data[-ERROR_LINE_LENGTH * 4:]
+            continue
+        complete, carry = data[:cut + 1], data[cut + 1:]
+        if scanned >= error_scan_bytes:
+            pattern = None
+        scanned += len(complete)
+        
+        if pattern is not None and pattern.Search(complete):
+            for index, line in enumerate(complete.split(b"\n")[:-1]):
+                if pattern.Search(line):
+                    error_count += 1
+                    if len(error_lines) < max_error_lines:
+                        error_lines.append((total_lines + index + 1, line[:ERROR_LINE_LENGTH]))
+        total_lines += complete.count(b"\n")
+    
+    if carry:
+        total_lines += 1
+        if pattern is not None and pattern.Search(carry):
+            error_count += 1
+            if len(error_lines) < max_error_lines:
+                error_lines.append((total_lines, carry[:ERROR_LINE_LENGTH]))
+    
+    return total_lines, error_count, error_lines
+
+
+def _Scan_Cached(f, path: str, error_patterns: list, max_error_lines: int, error_scan_bytes: int) -> tuple:
+    """
+    扫描文件，文件未变化且扫描参数相同时直接返回缓存结果
+    
+    Args:
+        f: 以二进制方式打开的文件
+        path: 文件路径
+        error_patterns: 错误模式列表
+        max_error_lines: 最多收集的错误行数
+        error_scan_bytes: 只在开头这么多字节内查找错误行
+    
+    Returns:
+        _Scan的返回值
+    """
+    stat = os.fstat(f.fileno())
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns, tuple(error_patterns), max_error_lines, error_scan_bytes)
+    result = _scan_cache.get(key)
+    if result is not None:
+        _scan_cache.move_to_end(key)
+        return result
+    
+    result = _Scan(f, _Compile_Patterns(error_patterns), max_error_lines, error_scan_bytes)
+    _scan_cache[key] = result
+    while len(_scan_cache) > SCAN_CACHE_SIZE:
+        _scan_cache.popitem(last=False)
+    return result
+
+
+def Export_Scan_Cache(paths: list) -> list:
+    """
+    导出指定文件的扫描结果（随响应发给Scheduler进程，写邮件时复用）
+    
+    Args:
+        paths: 输出文件路径列表
+    
+    Returns:
+        [(key, result), ...] 列表
+    """
+    wanted = {os.path.realpath(path) for path in paths}
+    return [(key, result) for key, result in _scan_cache.items() if key[0] in wanted]
+
+
+def Import_Scan_Cache(entries: list):
+    """
+    导入其他进程导出的扫描结果（文件此后被修改时键不再匹配，会重新扫描）
+    
+    Args:
+        entries: Export_Scan_Cache的返回值
+    """
+    for key, result in entries or []:
+        _scan_cache[tuple(key)] = result
+        _scan_cache.move_to_end(tuple(key))
+    while len(_scan_cache) > SCAN_CACHE_SIZE:
+        _scan_cache.popitem(last=False)
+
+
+def Capture_Output(path: str, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES,
+                   error_patterns: list = None, max_error_lines: int = DEFAULT_MAX_ERROR_LINES,
+                   error_scan_bytes: int = DEFAULT_ERROR_SCAN_BYTES, encoding: str = "utf-8") -> dict:
+    """
+    有界读取命令输出文件
+    
+    Args:
+        path: 输出文件路径
+        head_bytes: 保留的开头字节数
+        tail_bytes: 保留的结尾字节数
+        error_patterns: 错误模式列表（正则，不区分大小写），None使用默认模式
+        max_error_lines: 最多摘出的错误行数
+        error_scan_bytes: 只在开头这么多字节内查找错误行
+        encoding: 文件编码
+    
+    Returns:
+        {"head", "tail", "truncated", "binary", "total_bytes", "total_lines", "omitted_bytes",
+         "error_scan_bytes", "error_count", "error_lines": [(行号, 文本), ...]}
+    """
+    if error_patterns is None:
+        error_patterns = DEFAULT_ERROR_PATTERNS
+    
+    capture = {
+        "head": "",
+        "tail": "",
+        "truncated": False,
+        "binary": False,
+        "total_bytes": os.path.getsize(path),
+        "total_lines": 0,
+        "omitted_bytes": 0,
+        "error_scan_bytes": error_scan_bytes,
+        "error_count": 0,
+        "error_lines": []
+    }
+    
+    with open(path, "rb") as f:
+        sample = f.read(BINARY_SAMPLE)
+        if Is_Binary(sample):
+            capture["binary"] = True
+            return capture
+        
+        size = capture["total_bytes"]
+        if size <= head_bytes + tail_bytes:
+            data = sample + f.read()
+            capture["head"] = data.decode(encoding, errors="replace")
+            capture["total_lines"] = data.count(b"\n") + (1 if data and not data.endswith(b"\n") else 0)
+            return capture
+        
+        # 开头截到最后一个完整行，结尾从第一个完整行开始
+        f.seek(0)
+        head = f.read(head_bytes)
+        cut = head.rfind(b"\n")
+        if cut > 0:
+            head = head[:cut + 1]
+        f.seek(size - tail_bytes)
+        tail = f.read(tail_bytes)
+        cut = tail.find(b"\n")
+        if 0 <= cut < len(tail) - 1:
+            tail = tail[cut + 1:]
+        
+        total_lines, error_count, error_lines = _Scan_Cached(f, path, error_patterns, max_error_lines, error_scan_bytes)
+    
+    capture.update(
+        head=head.decode(encoding, errors="replace"),
+        tail=tail.decode(encoding, errors="replace"),
+        truncated=True,
+        total_lines=total_lines,
+        omitted_bytes=size - len(head) - len(tail),
+        error_scan_bytes=error_scan_bytes,
+        error_count=error_count,
+        error_lines=[(number, line.decode(encoding, errors="replace").rstrip("\r")) for number, line in error_lines]
+    )
+    return capture
+
+
+def Format_Capture(capture: dict) -> str:
+    """
+    将有界读取结果格式化为文本（未截断时就是文件内容本身）
+    
+    Args:
+        capture: Capture_Output的返回值
+    
+    Returns:
+        文本
+    """
+    if capture["binary"]:
+        return f"[Binary output skipped, {capture['total_bytes']} bytes]"
+    if not capture["truncated"]:
+        return capture["head"]
+    
+    head_lines = capture["head"].count("\n")
+    tail_lines = capture["tail"].count("\n") + (0 if capture["tail"].endswith("\n") else 1)
+    omitted_lines = max(0, capture["total_lines"] - head_lines - tail_lines)
+    
+    parts = [
+        capture["head"].rstrip("\n"),
+        f"... [{omitted_lines} lines / {capture['omitted_bytes']} bytes omitted] ...",
+        capture["tail"].rstrip("\n")
+    ]
+    if capture["error_count"]:
+        scope = f" in first {capture['error_scan_bytes']} bytes" if capture["error_scan_bytes"] < capture["total_bytes"] else ""
+        parts.append(f"[Error lines: {len(capture['error_lines'])} of {capture['error_count']}{scope}]")
+        parts.extend(f"L{number}: {line}" for number, line in capture["error_lines"])
+    parts.append(f"[Total: {capture['total_lines']} lines, {capture['total_bytes']} bytes]")
+    return "\n".join(parts)
+
+
+def Read_Output(path: str, head_bytes: int, tail_bytes: int, config: dict = None, encoding: str = "utf-8") -> str:
+    """
+    有界读取输出文件并格式化（错误模式等取自Output_Capture配置）
+    
+    Args:
+        path: 输出文件路径
+        head_bytes: 保留的开头字节数
+        tail_bytes: 保留的结尾字节数
+        config: Output_Capture配置字典
+        encoding: 文件编码
+    
+    Returns:
+        文本，读取失败时返回错误说明
+    """
+    config = config or {}
+    try:
+        capture = Capture_Output(
+            path,
+            head_bytes=head_bytes,
+            tail_bytes=tail_bytes,
+            error_patterns=config.get("error_patterns"),
+            max_error_lines=config.get("max_error_lines", DEFAULT_MAX_ERROR_LINES),
+            error_scan_bytes=config.get("error_scan_bytes", DEFAULT_ERROR_SCAN_BYTES),
+            encoding=encoding
+        )
+    except OSError as e:
+        Log_Info(MODULE_NAME, f"Error reading output file {path}: {e}")
+        return f"[Error reading output file: {e}]"
+    return Format_Capture(capture)
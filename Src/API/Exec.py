@@ -8,10 +8,12 @@ Exec - 命令执行工具API，使用Agent的持久化Shell执行命令
 
 import os
 import sys
+import threading
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from Log.Log import Log_Info
+from API.Shell import Persistent_Shell
 
 
 MODULE_NAME = "Exec"
@@ -22,6 +24,14 @@ _SHELL = None
 # 命令输出文件列表（供发送邮件时使用）
 _OUTPUT_FILES = []
 
+# 并行执行时使用的额外Shell（主Shell忙碌时按需创建）
+_WORKER_SHELLS = []
+_BUSY_SHELLS = set()
+_SHELL_LOCK = threading.Lock()
+
+# 主Shell最近一次已知的工作目录（额外Shell执行前切换到该目录）
+_LAST_WORKING_DIR = None
+
 
 def Set_Shell(shell):
     """
@@ -45,6 +55,114 @@ def Get_Shell():
     return _SHELL
 
 
+def _Acquire_Shell():
+    """
+    获取一个空闲Shell：优先使用主Shell，忙碌时使用或创建额外Shell
+    
+    Returns:
+        (shell, is_worker) 元组
+    """
+    with _SHELL_LOCK:
+        if id(_SHELL) not in _BUSY_SHELLS:
+            _BUSY_SHELLS.add(id(_SHELL))
+            return (_SHELL, False)
+        
+        for worker in _WORKER_SHELLS:
+            if id(worker) not in _BUSY_SHELLS:
+                _BUSY_SHELLS.add(id(worker))
+                return (worker, True)
+        
+        worker = Persistent_Shell(
+            working_dir=_LAST_WORKING_DIR or _SHELL.initial_working_dir,
+            tmp_workspace=_SHELL.tmp_workspace,
+            timeout=_SHELL.timeout,
+            capture_config=_SHELL.capture_config
+        )
+        _WORKER_SHELLS.append(worker)
+        _BUSY_SHELLS.add(id(worker))
+    
+    worker.Start()
+    Log_Info(MODULE_NAME, f"Worker shell created, total {len(_WORKER_SHELLS)}")
+    return (worker, True)
+
+
+def _Release_Shell(shell):
+    """
+    归还Shell
+    
+    Args:
+        shell: _Acquire_Shell获取的Shell
+    """
+    with _SHELL_LOCK:
+        _BUSY_SHELLS.discard(id(shell))
+
+
+def Stop_Worker_Shells():
+    """
+    停止所有额外Shell（在Agent关闭时调用）
+    """
+    with _SHELL_LOCK:
+        workers = list(_WORKER_SHELLS)
+        _WORKER_SHELLS.clear()
+    
+    for worker in workers:
+        worker.Stop()
+    
+    if workers:
+        Log_Info(MODULE_NAME, f"Stopped {len(workers)} worker shells")
+
+
+def Interrupt_Shells():
+    """
+    中断主Shell和所有额外Shell中正在执行的命令（取消任务时调用）
+    """
+    with _SHELL_LOCK:
+        shells = [_SHELL] + list(_WORKER_SHELLS) if _SHELL is not None else list(_WORKER_SHELLS)
+    
+    for shell in shells:
+        shell.Interrupt()
+
+
+def Clear_Interrupts():
+    """
+    清除所有Shell的中断标记（开始处理新消息前调用）
+    """
+    with _SHELL_LOCK:
+        shells = [_SHELL] + list(_WORKER_SHELLS) if _SHELL is not None else list(_WORKER_SHELLS)
+    
+    for shell in shells:
+        shell.Clear_Interrupt()
+
+
+def Get_Last_Working_Dir() -> str:
+    """
+    获取主Shell最近一次已知的工作目录（随响应发给Scheduler，在Agent与Scheduler的Shell之间同步）
+    
+    Returns:
+        工作目录，Shell未初始化时返回None
+    """
+    if _LAST_WORKING_DIR:
+        return _LAST_WORKING_DIR
+    return _SHELL.Get_Working_Dir() if _SHELL is not None else None
+
+
+def Sync_Working_Dir(path: str):
+    """
+    将主Shell切换到另一个进程中Shell最近的工作目录（目录不存在时忽略）
+    
+    Args:
+        path: 工作目录
+    """
+    global _LAST_WORKING_DIR
+    
+    if not path or _SHELL is None or not os.path.isdir(path):
+        return
+    if _SHELL.Get_Working_Dir() != path:
+        _SHELL.Change_Dir(path)
+        Log_Info(MODULE_NAME, f"Working directory synced to {path}")
+    _LAST_WORKING_DIR = path
+
+
 def Get_Output_Files() -> list:
     """
     获取所有命令输出文件路径
@@ -68,6 +186,7 @@ def Execute_Command(command: str) -> str:
     """
     执行命令（供Agent调用的工具函数）
     通过Agent的持久化Shell执行，输出保存到文件并返回给Agent
+    并行调用时，主Shell忙碌的调用会在额外Shell中（切换到主Shell的工作目录后）执行
     
     Args:
         command: 要执行的命令
@@ -75,7 +194,7 @@ def Execute_Command(command: str) -> str:
     Returns:
         命令执行结果字符串
     """
-    global _OUTPUT_FILES
+    global _OUTPUT_FILES, _LAST_WORKING_DIR
     
     Log_Info(MODULE_NAME, f"Execute_Command called: {command}")
     
@@ -83,21 +202,42 @@ def Execute_Command(command: str) -> str:
         Log_Info(MODULE_NAME, "Error: Shell not initialized")
         return "[Error] Shell not initialized. Agent may not be properly started."
     
-    stdout, stderr, return_code, output_file = _SHELL.Execute(command)
+    shell, is_worker = _Acquire_Shell()
+    try:
+        if is_worker and _LAST_WORKING_DIR:
+            shell.Change_Dir(_LAST_WORKING_DIR)
+        
+        stdout, stderr, return_code, output_file = shell.Execute(command)
+        
+        # 工作目录、耗时与资源占用取自命令的结尾行，无需再次与shell往返
+        working_dir = shell.Get_Working_Dir()
+        command_info = shell.last_command_info
+        duration = command_info.get("duration")
+        if not is_worker:
+            _LAST_WORKING_DIR = working_dir
+    finally:
+        _Release_Shell(shell)
     
     # 记录输出文件
     if output_file and os.path.exists(output_file):
         _OUTPUT_FILES.append(output_file)
         Log_Info(MODULE_NAME, f"Output file recorded: {output_file}")
     
-    # 获取当前工作目录
-    working_dir = _SHELL.Get_Working_Dir()
-    
     # 格式化输出
     result_parts = []
     result_parts.append(f"[Exit Code: {return_code}]")
     result_parts.append(f"[Working Dir: {working_dir}]")
     
+    if duration is not None:
+        result_parts.append(f"[Duration: {duration:.3f}s]")
+    
+    # 子进程CPU时间（bash times，即getrusage(RUSAGE_CHILDREN)之差）与采样得到的峰值内存
+    if "cpu_user" in command_info:
+        result_parts.append(f"[CPU Time: user {command_info['cpu_user']:.3f}s, sys {command_info['cpu_sys']:.3f}s]")
+    
+    if "peak_rss_kb" in command_info:
+        result_parts.append(f"[Peak RSS: {command_info['peak_rss_kb'] / 1024:.1f} MB]")
+    
     if output_file:
         result_parts.append(f"[Output File: {output_file}]")
     
@@ -120,5 +260,10 @@ The shell maintains state across commands (e.g., cd changes persist).
 Command output is saved to a file and also returned.
 Arguments:
 - command (str, required): The command to execute
-Returns: Command output including stdout, stderr, exit code, working directory, and output file path.
+Returns: Command output including stdout, stderr, exit code, working directory, duration, and output file path.
 Example: {"command": "nvidia-smi"} to check GPU status, {"command": "dir"} to list files, {"command": "cd subdir"} to change directory."""
+
+# 工具简介与检索关键词（启用tool_selection时使用）
+API_SUMMARY = "Execute a shell command in the persistent shell (cd and environment changes persist)."
+
+API_KEYWORDS = ["shell", "bash", "terminal", "run", "command", "执行", "命令", "运行", "终端", "查看", "文件", "目录"]
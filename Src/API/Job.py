@@ -0,0 +1,627 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Job - 后台任务工具API
+训练、编译、数据同步等长时间运行的命令脱离持久化Shell，在独立会话中运行，输出逐步写入临时工作目录；
+Agent通过任务ID查询状态、查看输出末尾或取消任务。任务状态全部保存在磁盘上，
+Agent进程退出后任务继续运行，由Scheduler检查已结束的任务并邮件通知用户
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+from API.Exec import Get_Shell
+from API.Shell import Persistent_Shell
+from API.Capture import Is_Binary
+
+
+MODULE_NAME = "Job"
+
+# 任务目录（位于临时工作目录下），每个任务一个子目录：
+#   job.json 任务信息，output.log 输出，exit_code 退出码（任务结束时写入），
+#   cancelled 取消标记，notified 已邮件通知标记
+JOBS_DIR_NAME = "jobs"
+JOB_FILE = "job.json"
+LOG_FILE = "output.log"
+EXIT_FILE = "exit_code"
+CANCELLED_FILE = "cancelled"
+NOTIFIED_FILE = "notified"
+
+# 合法的任务ID（由Start_Job按序号生成）
+JOB_ID_PATTERN = re.compile(r"job\d+")
+
+# 默认最多同时运行的任务数与Tail_Job返回的行数
+DEFAULT_MAX_RUNNING = 4
+DEFAULT_TAIL_LINES = 30
+
+# Tail_Job最多读取的日志结尾字节数
+TAIL_BYTES = 65536
+
+# 取消时SIGTERM后等待任务结束的时间（秒），之后SIGKILL
+CANCEL_GRACE = 2
+
+# POSIX下的任务包装脚本：子shell中执行命令，结束后先写临时文件再改名，保证exit_code完整
+_POSIX_WRAPPER = (
+    '( eval "$COLUMBA_JOB_COMMAND" ); '
+    'printf "%s\\n" "$?" > "$COLUMBA_JOB_DIR/exit_code.tmp" && '
+    'mv "$COLUMBA_JOB_DIR/exit_code.tmp" "$COLUMBA_JOB_DIR/exit_code"'
+)
+
+# 任务配置（Jobs）
+_JOB_CONFIG = {}
+
+# 本进程启动的任务进程（用于回收已结束的子进程）
+_PROCESSES = {}
+
+# 启动任务的锁：并行工具调用时，运行数检查、任务ID分配与job.json写入不能交错
+_START_LOCK = threading.Lock()
+
+
+def Set_Job_Config(config: dict):
+    """
+    设置任务配置（由Agent_Process初始化时调用）
+    
+    Args:
+        config: Jobs配置字典
+    """
+    global _JOB_CONFIG
+    _JOB_CONFIG = config or {}
+
+
+def Get_Jobs_Dir(tmp_workspace: str) -> str:
+    """
+    获取任务目录
+    
+    Args:
+        tmp_workspace: 临时工作目录
+    
+    Returns:
+        任务目录路径
+    """
+    return os.path.join(tmp_workspace, JOBS_DIR_NAME)
+
+
+def _Current_Jobs_Dir() -> str:
+    """获取当前Shell对应的任务目录，Shell未初始化或没有临时工作目录时返回None"""
+    shell = Get_Shell()
+    if shell is None or not shell.tmp_workspace:
+        return None
+    return Get_Jobs_Dir(shell.tmp_workspace)
+
+
+def _Job_Dir(jobs_dir: str, job_id: str) -> str:
+    """
+    校验任务ID并返回任务目录（任务ID来自模型输出，必须是jobN且解析后仍位于任务目录内）
+    
+    Args:
+        jobs_dir: 任务目录
+        job_id: 任务ID
+    
+    Returns:
+        任务目录路径，任务ID不合法时返回None
+    """
+    job_id = job_id.strip()
+    if not JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    root = os.path.realpath(jobs_dir)
+    job_dir = os.path.realpath(os.path.join(root, job_id))
+    if os.path.dirname(job_dir) != root:
+        return None
+    return job_dir
+
+
+def _Is_Alive(pid: int) -> bool:
+    """
+    判断进程是否仍在运行（僵尸进程视为已结束）
+    
+    Args:
+        pid: 进程ID
+    
+    Returns:
+        是否在运行
+    """
+    if os.name == 'nt':
+        # Windows下os.kill(pid, 0)会发送CTRL_C_EVENT，改用tasklist查询
+        try:
+            result = subprocess.run(["tasklist", "/FI", f"PID eq {pid}", "/NH"], capture_output=True, text=True, timeout=5)
+        except Exception:
+            return False
+        return str(pid) in result.stdout
+    
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()[0] != b"Z"
+    except (OSError, IndexError):
+        return True
+
+
+def _Read_Job(job_dir: str) -> dict:
+    """
+    读取任务信息并判断状态
+    
+    Args:
+        job_dir: 任务目录
+    
+    Returns:
+        任务字典，增加status（running/exited/cancelled/lost）、exit_code、finished_at、log_size；
+        任务信息不存在时返回None
+    """
+    try:
+        with open(os.path.join(job_dir, JOB_FILE), "r", encoding="utf-8") as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # 任务信息与目录不符，或进程ID不是正整数（killpg(0)会发给本进程所在的进程组）时视为无效
+    pid = job.get("pid")
+    if job.get("id") != os.path.basename(job_dir) or not (pid is None or (type(pid) is int and pid > 0)):
+        return None
+    
+    # 回收本进程启动的已结束子进程
+    process = _PROCESSES.get(job["id"])
+    if process is not None and process.poll() is not None:
+        del _PROCESSES[job["id"]]
+    
+    exit_path = os.path.join(job_dir, EXIT_FILE)
+    cancelled_path = os.path.join(job_dir, CANCELLED_FILE)
+    job.update(exit_code=None, finished_at=None)
+    if os.path.exists(cancelled_path):
+        job["status"] = "cancelled"
+        job["finished_at"] = os.path.getmtime(cancelled_path)
+    elif os.path.exists(exit_path):
+        job["status"] = "exited"
+        job["finished_at"] = os.path.getmtime(exit_path)
+        try:
+            with open(exit_path, "r", encoding="utf-8", errors="replace") as f:
+                job["exit_code"] = int(f.read().strip())
+        except (OSError, ValueError):
+            pass
+    elif job.get("pid") and _Is_Alive(job["pid"]):
+        job["status"] = "running"
+    else:
+        # 进程已不存在却没有写入退出码（如被系统强制结束）
+        job["status"] = "lost"
+    
+    log_path = os.path.join(job_dir, LOG_FILE)
+    job["log_file"] = log_path
+    job["log_size"] = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    return job
+
+
+def List_Jobs(jobs_dir: str) -> list:
+    """
+    读取所有任务（按任务编号排序）
+    
+    Args:
+        jobs_dir: 任务目录
+    
+    Returns:
+        任务字典列表
+    """
+    if not jobs_dir or not os.path.isdir(jobs_dir):
+        return []
+    names = sorted((name for name in os.listdir(jobs_dir) if name.startswith("job") and name[3:].isdigit()),
+                   key=lambda name: int(name[3:]))
+    jobs = [_Read_Job(os.path.join(jobs_dir, name)) for name in names]
+    return [job for job in jobs if job is not None]
+
+
+def _Format_Job(job: dict) -> str:
+    """
+    格式化单个任务的状态
+    
+    Args:
+        job: 任务字典
+    
+    Returns:
+        状态字符串
+    """
+    end_time = job["finished_at"] or time.time()
+    parts = [
+        f"[Job ID: {job['id']}]",
+        f"[Status: {job['status']}]"
+    ]
+    if job["exit_code"] is not None:
+        parts.append(f"[Exit Code: {job['exit_code']}]")
+    parts.append(f"[Command: {job['command']}]")
+    parts.append(f"[Working Dir: {job['working_dir']}]")
+    parts.append(f"[Duration: {end_time - job['started_at']:.1f}s]")
+    parts.append(f"[Log File: {job['log_file']} ({job['log_size']} bytes)]")
+    return "\n".join(parts)
+
+
+def _Signal_Job(job: dict, sig: int):
+    """
+    向任务的整个进程组发送信号（任务以新会话启动，进程组ID即任务进程ID）
+    
+    Args:
+        job: 任务字典
+        sig: 信号
+    """
+    try:
+        os.killpg(job["pid"], sig)
+    except OSError:
+        pass
+
+
+def _Group_Alive(job: dict) -> bool:
+    """判断任务的进程组中是否还有进程（顺带回收本进程的子进程）"""
+    process = _PROCESSES.get(job["id"])
+    if process is not None:
+        process.poll()
+    try:
+        os.killpg(job["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _Claim_Job_Dir(jobs_dir: str) -> tuple:
+    """
+    分配下一个任务ID并创建任务目录（os.mkdir失败说明ID已被占用，顺延到下一个）
+    
+    Args:
+        jobs_dir: 任务目录
+    
+    Returns:
+        (job_id, job_dir) 元组
+    """
+    os.makedirs(jobs_dir, exist_ok=True)
+    numbers = [int(name[3:]) for name in os.listdir(jobs_dir) if name.startswith("job") and name[3:].isdigit()]
+    number = max(numbers, default=0) + 1
+    while True:
+        job_id = f"job{number}"
+        job_dir = os.path.join(jobs_dir, job_id)
+        try:
+            os.mkdir(job_dir)
+            return job_id, job_dir
+        except FileExistsError:
+            number += 1
+
+
+def _Write_Job(job_dir: str, job: dict):
+    """写入任务信息（先写临时文件再替换，读取方不会看到写了一半的文件）"""
+    tmp_path = os.path.join(job_dir, JOB_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, os.path.join(job_dir, JOB_FILE))
+
+
+def Start_Job(command: str) -> str:
+    """
+    启动后台任务（供Agent调用的工具函数）
+    在主Shell当前的工作目录中以独立会话运行命令，输出逐步写入任务目录下的output.log，立即返回任务ID
+    
+    Args:
+        command: 要执行的命令
+    
+    Returns:
+        任务信息字符串
+    """
+    Log_Info(MODULE_NAME, f"Start_Job called: {command}")
+    
+    shell = Get_Shell()
+    jobs_dir = _Current_Jobs_Dir()
+    if jobs_dir is None:
+        return "[Error] Shell not initialized. Agent may not be properly started."
+    
+    command_lower = command.lower().strip()
+    for blocked in Persistent_Shell.BLOCKED_COMMANDS:
+        if blocked.lower() in command_lower:
+            Log_Info(MODULE_NAME, f"Blocked dangerous command: {command}")
+            return "[Error] Command blocked for security reasons"
+    
+    with _START_LOCK:
+        jobs = List_Jobs(jobs_dir)
+        max_running = _JOB_CONFIG.get("max_running", DEFAULT_MAX_RUNNING)
+        running = [job["id"] for job in jobs if job["status"] == "running"]
+        if len(running) >= max_running:
+            return f"[Error] Too many running jobs ({', '.join(running)}). Wait for one to finish or cancel it with Cancel_Job."
+        
+        job_id, job_dir = _Claim_Job_Dir(jobs_dir)
+        
+        working_dir = shell.Get_Working_Dir()
+        job = {
+            "id": job_id,
+            "command": command,
+            "working_dir": working_dir,
+            "pid": None,
+            "started_at": time.time()
+        }
+        
+        env = dict(os.environ, COLUMBA_JOB_ID=job_id, COLUMBA_JOB_COMMAND=command, COLUMBA_JOB_DIR=job_dir)
+        with open(os.path.join(job_dir, LOG_FILE), "ab") as log_file:
+            try:
+                if os.name == 'nt':
+                    exit_path = os.path.join(job_dir, EXIT_FILE)
+                    process = subprocess.Popen(
+                        f'cmd /v:on /s /c "{command} & echo !ERRORLEVEL!> "{exit_path}""',
+                        cwd=working_dir, env=env, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+                    )
+                else:
+                    process = subprocess.Popen(
+                        ["/bin/bash", "-c", _POSIX_WRAPPER],
+                        cwd=working_dir, env=env, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                        start_new_session=True
+                    )
+            except OSError as e:
+                Log_Info(MODULE_NAME, f"Failed to start job: {e}")
+                return f"[Error] Failed to start job: {e}"
+        
+        # job.json在进程启动后一次性写入：在此之前List_Jobs看不到该任务，不会误判为lost
+        _PROCESSES[job_id] = process
+        job["pid"] = process.pid
+        _Write_Job(job_dir, job)
+    
+    Log_Info(MODULE_NAME, f"Job {job_id} started, PID={process.pid}, working_dir={working_dir}")
+    return _Format_Job(_Read_Job(job_dir)) + "\nThe user will be notified by email when the job finishes."
+
+
+def Job_Status(job_id: str) -> str:
+    """
+    查询后台任务状态（供Agent调用的工具函数）
+    
+    Args:
+        job_id: 任务ID，"all"列出所有任务
+    
+    Returns:
+        状态字符串
+    """
+    Log_Info(MODULE_NAME, f"Job_Status called: {job_id}")
+    
+    jobs_dir = _Current_Jobs_Dir()
+    if jobs_dir is None:
+        return "[Error] Shell not initialized. Agent may not be properly started."
+    
+    if job_id.strip().lower() == "all":
+        jobs = List_Jobs(jobs_dir)
+        if not jobs:
+            return "No background jobs."
+        lines = []
+        for job in jobs:
+            exit_code = f" exit={job['exit_code']}" if job["exit_code"] is not None else ""
+            end_time = job["finished_at"] or time.time()
+            lines.append(f"{job['id']}: {job['status']}{exit_code} {end_time - job['started_at']:.1f}s  {job['command']}")
+        return "\n".join(lines)
+    
+    job_dir = _Job_Dir(jobs_dir, job_id)
+    if job_dir is None:
+        return f"[Error] Invalid job ID '{job_id}', expected an ID like 'job1'."
+    job = _Read_Job(job_dir)
+    if job is None:
+        return f"[Error] Job '{job_id}' not found."
+    return _Format_Job(job)
+
+
+def _Tail_Lines(path: str, lines: int) -> str:
+    """
+    读取文件最后若干行（最多读取结尾TAIL_BYTES字节）
+    
+    Args:
+        path: 文件路径
+        lines: 行数
+    
+    Returns:
+        文本
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TAIL_BYTES))
+        data = f.read()
+    if Is_Binary(data[-8192:]):
+        return f"[Binary output skipped, {size} bytes]"
+    text = data.decode("gbk" if os.name == 'nt' else "utf-8", errors="replace")
+    # 进度条等以\r刷新的输出只保留每行最后一次刷新的内容
+    result = [line.rsplit("\r", 1)[-1] for line in text.rstrip("\n").split("\n")]
+    if size > TAIL_BYTES:
+        # 第一行可能不完整
+        result = result[1:]
+    return "\n".join(result[-lines:])
+
+
+def Tail_Job(job_id: str) -> str:
+    """
+    查看后台任务状态与输出末尾（供Agent调用的工具函数）
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        状态与输出末尾
+    """
+    Log_Info(MODULE_NAME, f"Tail_Job called: {job_id}")
+    
+    jobs_dir = _Current_Jobs_Dir()
+    if jobs_dir is None:
+        return "[Error] Shell not initialized. Agent may not be properly started."
+    
+    job_dir = _Job_Dir(jobs_dir, job_id)
+    if job_dir is None:
+        return f"[Error] Invalid job ID '{job_id}', expected an ID like 'job1'."
+    job = _Read_Job(job_dir)
+    if job is None:
+        return f"[Error] Job '{job_id}' not found."
+    
+    lines = _JOB_CONFIG.get("tail_lines", DEFAULT_TAIL_LINES)
+    try:
+        output = _Tail_Lines(job["log_file"], lines) if job["log_size"] else ""
+    except OSError as e:
+        output = f"[Error reading log file: {e}]"
+    return f"{_Format_Job(job)}\n[Last {lines} lines]\n{output}" if output.strip() else f"{_Format_Job(job)}\n[No output yet]"
+
+
+def _Cancel(jobs_dir: str, job: dict):
+    """
+    取消任务：先写入取消标记，再向进程组发送SIGTERM，CANCEL_GRACE秒内未结束则SIGKILL
+    
+    Args:
+        jobs_dir: 任务目录
+        job: 任务字典（状态为running）
+    """
+    with open(os.path.join(jobs_dir, job["id"], CANCELLED_FILE), "w", encoding="utf-8") as f:
+        f.write(time.strftime("%Y-%m-%d %H:%M:%S"))
+    
+    if os.name == 'nt':
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(job["pid"])], capture_output=True, timeout=10)
+        return
+    
+    _Signal_Job(job, signal.SIGTERM)
+    end_time = time.monotonic() + CANCEL_GRACE
+    while time.monotonic() < end_time:
+        if not _Group_Alive(job):
+            return
+        time.sleep(0.05)
+    _Signal_Job(job, signal.SIGKILL)
+    Log_Info(MODULE_NAME, f"Job {job['id']} did not exit after SIGTERM, killed")
+
+
+def Cancel_Job(job_id: str) -> str:
+    """
+    取消后台任务（供Agent调用的工具函数）
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        取消后的任务状态
+    """
+    Log_Info(MODULE_NAME, f"Cancel_Job called: {job_id}")
+    
+    jobs_dir = _Current_Jobs_Dir()
+    if jobs_dir is None:
+        return "[Error] Shell not initialized. Agent may not be properly started."
+    
+    job_dir = _Job_Dir(jobs_dir, job_id)
+    if job_dir is None:
+        return f"[Error] Invalid job ID '{job_id}', expected an ID like 'job1'."
+    job = _Read_Job(job_dir)
+    if job is None:
+        return f"[Error] Job '{job_id}' not found."
+    if job["status"] != "running":
+        return f"Job is not running.\n{_Format_Job(job)}"
+    
+    _Cancel(jobs_dir, job)
+    Log_Info(MODULE_NAME, f"Job {job['id']} cancelled")
+    return _Format_Job(_Read_Job(job_dir))
+
+
+def Collect_Finished_Jobs(jobs_dir: str) -> list:
+    """
+    获取已结束且尚未通知的任务，并标记为已通知（由Scheduler调用；被取消的任务不通知）
+    
+    Args:
+        jobs_dir: 任务目录
+    
+    Returns:
+        任务字典列表
+    """
+    finished = []
+    for job in List_Jobs(jobs_dir):
+        if job["status"] == "running":
+            continue
+        notified_path = os.path.join(jobs_dir, job["id"], NOTIFIED_FILE)
+        if os.path.exists(notified_path):
+            continue
+        with open(notified_path, "w", encoding="utf-8") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S"))
+        if job["status"] != "cancelled":
+            finished.append(job)
+    return finished
+
+
+def Cancel_Running_Jobs(jobs_dir: str) -> int:
+    """
+    取消所有正在运行的任务（Scheduler退出、临时工作目录即将清理时调用）
+    
+    Args:
+        jobs_dir: 任务目录
+    
+    Returns:
+        取消的任务数
+    """
+    running = [job for job in List_Jobs(jobs_dir) if job["status"] == "running"]
+    for job in running:
+        _Cancel(jobs_dir, job)
+    if running:
+        Log_Info(MODULE_NAME, f"Cancelled {len(running)} running jobs")
+    return len(running)
+
+
+# 工具描述，供Agent注册使用
+START_JOB_DESCRIPTION = """Start a long-running command (training, build, download, data sync) as a background job.
+The job runs detached in the current working directory and keeps running after the agent exits;
+its output is written to a log file incrementally. Returns immediately with a job ID.
+The user is notified by email when the job finishes, so there is no need to wait for it.
+Use Execute_Command instead for commands that finish within 30 seconds.
+Arguments:
+- command (str, required): The command to run
+Returns: Job ID, status, working directory and log file path.
+Example: {"command": "python train.py --epochs 50"}"""
+
+JOB_STATUS_DESCRIPTION = """Get the status of a background job started with Start_Job.
+Arguments:
+- job_id (str, required): The job ID (e.g. "job1"), or "all" to list every job
+Returns: Status (running/exited/cancelled/lost), exit code, duration and log file size.
+Example: {"job_id": "job1"}, {"job_id": "all"}"""
+
+TAIL_JOB_DESCRIPTION = """Show the status and the last lines of output of a background job.
+Arguments:
+- job_id (str, required): The job ID
+Returns: Job status followed by the last lines of the job log.
+Example: {"job_id": "job1"}"""
+
+CANCEL_JOB_DESCRIPTION = """Cancel a running background job (terminates the job and all processes it started).
+Arguments:
+- job_id (str, required): The job ID
+Returns: The job status after cancelling.
+Example: {"job_id": "job1"}"""
+
+# 工具列表（名称、函数、描述、简介与检索关键词），由Agent_Process逐个注册
+JOB_TOOLS = [
+    {
+        "name": "Start_Job",
+        "func": Start_Job,
+        "description": START_JOB_DESCRIPTION,
+        "summary": "Start a long-running command as a background job and return its job ID.",
+        "keywords": ["background", "job", "long", "train", "build", "后台", "任务", "训练", "编译", "下载", "长时间"]
+    },
+    {
+        "name": "Job_Status",
+        "func": Job_Status,
+        "description": JOB_STATUS_DESCRIPTION,
+        "summary": "Get the status of a background job (or all jobs).",
+        "keywords": ["background", "job", "status", "后台", "任务", "状态", "进度", "完成"]
+    },
+    {
+        "name": "Tail_Job",
+        "func": Tail_Job,
+        "description": TAIL_JOB_DESCRIPTION,
+        "summary": "Show the last lines of a background job's output.",
+        "keywords": ["background", "job", "log", "tail", "output", "后台", "任务", "日志", "输出", "进度"]
+    },
+    {
+        "name": "Cancel_Job",
+        "func": Cancel_Job,
+        "description": CANCEL_JOB_DESCRIPTION,
+        "summary": "Cancel a running background job.",
+        "keywords": ["background", "job", "cancel", "stop", "kill", "后台", "任务", "取消", "停止", "终止"]
+    }
+]
@@ -12,11 +12,16 @@ import sys
 import threading
 import queue
 import time
+import signal
 import uuid
+import codecs
+import selectors
+from collections import deque
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from Log.Log import Log_Info
+from API.Capture import Read_Output, DEFAULT_HEAD_BYTES, DEFAULT_TAIL_BYTES
 
 
 class Persistent_Shell:
@@ -37,10 +42,21 @@ class Persistent_Shell:
         ":(){:|:&};:",
     ]
     
-    # 命令结束标记
+    # 命令结束标记（每条命令附加一个随机nonce，结尾行格式见_Frame_Command）
     END_MARKER = "___COLUMBA_CMD_END___"
     
-    def __init__(self, working_dir: str = None, tmp_workspace: str = None, timeout: int = 30):
+    # 标记命令所启动进程的环境变量（值为本条命令的nonce，子进程继承）
+    JOB_ENV = "__COLUMBA_JOB"
+    
+    # 中断后等待SIGTERM生效的时间，以及强制结束后等待结尾行（重新同步）的时间（秒）
+    KILL_GRACE = 2
+    RESYNC_TIMEOUT = 2
+    
+    # 采样进程峰值内存的间隔：从首次间隔开始逐次加倍，直到最大间隔（秒）
+    SAMPLE_FIRST_INTERVAL = 0.02
+    SAMPLE_MAX_INTERVAL = 0.5
+    
+    def __init__(self, working_dir: str = None, tmp_workspace: str = None, timeout: int = 30, capture_config: dict = None):
         """
         初始化持久化Shell
         
@@ -48,6 +64,7 @@ class Persistent_Shell:
             working_dir: 初始工作目录（target_workspace），默认为当前目录
             tmp_workspace: 临时工作目录，用于存储命令输出文件
             timeout: 默认命令超时时间（秒）
+            capture_config: 输出读取配置（Output_Capture：head_bytes、tail_bytes、error_patterns、max_error_lines）
         """
         if working_dir is None:
             working_dir = os.getcwd()
@@ -55,15 +72,42 @@ class Persistent_Shell:
         self.initial_working_dir = working_dir
         self.tmp_workspace = tmp_workspace
         self.timeout = timeout
+        self.capture_config = capture_config or {}
         self.process = None
+        self.running = False
+        
+        # shell输出读取：POSIX下用selector等待输出管道与唤醒管道，在调用线程中按需读取；
+        # Windows管道不支持select，由读取线程逐行放入队列
         self.output_queue = queue.Queue()
         self.reader_thread = None
-        self.running = False
+        self._selector = None
+        self._wake_pipe = None
+        self._decoder = None
+        self._partial = ""
+        self._pending_lines = deque()
         self.command_counter = 0
         
         # 最近一次命令的输出文件路径
         self.last_output_file = None
         
+        # 当前工作目录（由每条命令的结尾行更新，无需额外执行pwd）
+        self.working_dir = working_dir
+        
+        # 最近一次命令的结尾行信息：return_code, working_dir, started_at, finished_at, duration
+        self.last_command_info = {}
+        
+        # 中断标记：置位后正在执行的命令被中断，之后的命令直接返回，直到Clear_Interrupt
+        self._interrupted = threading.Event()
+        
+        # 正在执行的命令的nonce（用于找到该命令启动的进程组）
+        self._job_nonce = None
+        # 是否可以通过/proc查找进程（Linux）
+        self._proc_available = os.path.isdir("/proc/self")
+        # bash子进程累计CPU时间（times输出，即getrusage(RUSAGE_CHILDREN)），用于计算单条命令的CPU时间
+        self._child_times = None
+        # 本条命令进程的峰值内存采样（KB）
+        self._peak_rss_kb = None
+        
         Log_Info(self.MODULE_NAME, f"Initialized with working_dir={working_dir}, tmp_workspace={tmp_workspace}, timeout={timeout}")
     
     def Start(self):
@@ -98,23 +142,18 @@ class Persistent_Shell:
         )
         
         self.running = True
-        
-        # 启动输出读取线程
-        self.reader_thread = threading.Thread(target=self._Read_Output, daemon=True)
-        self.reader_thread.start()
-        
-        # 等待shell启动
-        time.sleep(0.1)
+        self._Init_Reader()
         
         # Windows下设置UTF-8代码页（可选，部分命令可能不支持）
         # if os.name == 'nt':
         #     self._Send_Command('chcp 65001 >nul')
-        #     self._Drain_Queue()
+        #     self._Drain_Output()
         
-        # 进入初始工作目录
-        if self.initial_working_dir:
-            self._Send_Command(f'cd /d "{self.initial_working_dir}"' if os.name == 'nt' else f'cd "{self.initial_working_dir}"')
-            self._Drain_Queue()
+        # 进入初始工作目录，以结尾行确认shell已就绪（无需固定等待）；
+        # bash开启作业控制(set -m)，每条前台管道在独立的进程组中运行，超时/取消时可整组结束
+        self.working_dir = self.initial_working_dir
+        self._child_times = None
+        self._Run_Framed(f'cd /d "{self.initial_working_dir}"' if os.name == 'nt' else f'set -m; cd "{self.initial_working_dir}"', None, self.timeout)
         
         Log_Info(self.MODULE_NAME, f"Shell started, PID={self.process.pid}")
     
@@ -149,21 +188,115 @@ class Persistent_Shell:
         except Exception:
             pass
         
+        self._Close_Reader()
         self.process = None
         Log_Info(self.MODULE_NAME, "Shell stopped")
     
+    def _Init_Reader(self):
+        """
+        初始化输出读取：POSIX下注册输出管道与唤醒管道到selector，Windows下启动读取线程
+        """
+        self._Close_Reader()
+        self._partial = ""
+        self._pending_lines = deque()
+        self._decoder = codecs.getincrementaldecoder(self._encoding)(errors='replace')
+        
+        if os.name == 'nt':
+            self.output_queue = queue.Queue()
+            self.reader_thread = threading.Thread(target=self._Read_Output, daemon=True)
+            self.reader_thread.start()
+            return
+        
+        self._wake_pipe = os.pipe()
+        os.set_blocking(self._wake_pipe[0], False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.process.stdout.fileno(), selectors.EVENT_READ, "output")
+        self._selector.register(self._wake_pipe[0], selectors.EVENT_READ, "wake")
+    
+    def _Close_Reader(self):
+        """关闭selector与唤醒管道"""
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        if self._wake_pipe is not None:
+            for fd in self._wake_pipe:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._wake_pipe = None
+    
     def _Read_Output(self):
-        """后台线程持续读取shell输出"""
+        """读取线程（仅Windows）：逐行读取shell输出，readline阻塞直到有数据，EOF时结束"""
         try:
-            while self.running and self.process and self.process.poll() is None:
+            while self.running and self.process:
                 line = self.process.stdout.readline()
-                if line:
-                    self.output_queue.put(line)
-                else:
-                    time.sleep(0.01)
+                if not line:
+                    break
+                self.output_queue.put(line)
         except Exception as e:
             Log_Info(self.MODULE_NAME, f"Reader thread error: {e}")
     
+    def _Wake(self):
+        """唤醒正在等待输出的线程（用于中断）"""
+        if os.name == 'nt':
+            self.output_queue.put(None)
+        elif self._wake_pipe is not None:
+            try:
+                os.write(self._wake_pipe[1], b"x")
+            except OSError:
+                pass
+    
+    def _Next_Line(self, timeout: float):
+        """
+        获取下一行shell输出，输出到达时立即返回
+        
+        Args:
+            timeout: 最长等待时间（秒）
+        
+        Returns:
+            输出行（含换行符），超时或被唤醒时返回None
+        """
+        if self._pending_lines:
+            return self._pending_lines.popleft()
+        
+        if os.name == 'nt':
+            try:
+                return self.output_queue.get(timeout=max(0.0, timeout))
+            except queue.Empty:
+                return None
+        
+        if self._selector is None:
+            return None
+        
+        end_time = time.monotonic() + timeout
+        while True:
+            woken = False
+            for key, _ in self._selector.select(max(0.0, end_time - time.monotonic())):
+                if key.data == "wake":
+                    try:
+                        os.read(key.fd, 4096)
+                    except OSError:
+                        pass
+                    woken = True
+                    continue
+                
+                data = os.read(key.fd, 65536)
+                if not data:
+                    # shell已退出，不再监听输出管道
+                    self._selector.unregister(key.fd)
+                    woken = True
+                    continue
+                
+                lines = (self._partial + self._decoder.decode(data)).split("\n")
+                self._partial = lines.pop()
+                self._pending_lines.extend(line + "\n" for line in lines)
+            
+            if self._pending_lines:
+                return self._pending_lines.popleft()
+            if woken or time.monotonic() >= end_time:
+                return None
+    
     def _Send_Command(self, command: str):
         """发送命令到shell（不等待输出）"""
         if self.process is None or self.process.poll() is not None:
@@ -172,16 +305,331 @@ class Persistent_Shell:
         self.process.stdin.write(command + "\n")
         self.process.stdin.flush()
     
-    def _Drain_Queue(self, timeout: float = 0.5):
-        """清空输出队列"""
-        end_time = time.time() + timeout
-        while time.time() < end_time:
+    def _Drain_Output(self):
+        """丢弃已经到达但尚未读取的输出（不等待）"""
+        while self._Next_Line(0) is not None:
+            pass
+    
+    def _Job_Processes(self, nonce: str) -> list:
+        """
+        通过/proc查找本条命令启动的进程：shell的后代进程中环境变量JOB_ENV等于nonce的进程
+        （之前命令留在后台的进程nonce不同，不受影响）
+        
+        Args:
+            nonce: 命令的nonce
+        
+        Returns:
+            [(pid, pgid), ...] 列表
+        """
+        if self.process is None or not nonce:
+            return []
+        
+        children = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
             try:
-                self.output_queue.get_nowait()
-            except queue.Empty:
-                time.sleep(0.05)
-                if self.output_queue.empty():
-                    break
+                with open(f"/proc/{name}/stat", "rb") as f:
+                    # comm字段可能包含空格，从最后一个')'之后解析：state ppid pgrp ...
+                    fields = f.read().rsplit(b")", 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            children.setdefault(int(fields[1]), []).append((int(name), int(fields[2])))
+        
+        tag = f"{self.JOB_ENV}={nonce}".encode()
+        processes = []
+        pending = [self.process.pid]
+        while pending:
+            for pid, pgid in children.get(pending.pop(), []):
+                pending.append(pid)
+                try:
+                    with open(f"/proc/{pid}/environ", "rb") as f:
+                        if tag in f.read().split(b"\0"):
+                            processes.append((pid, pgid))
+                except OSError:
+                    continue
+        return processes
+    
+    def _Signal_Job(self, sig: int):
+        """
+        向正在执行的命令的进程组发送信号，shell本身保持运行
+        
+        Args:
+            sig: 信号（signal.SIGTERM/SIGKILL）
+        """
+        if os.name == 'nt' or self.process is None:
+            return
+        
+        if not self._proc_available:
+            # 无/proc时退化为向shell的直接子进程发送信号
+            try:
+                subprocess.run(["pkill", f"-{sig.name[3:]}", "-P", str(self.process.pid)], timeout=2)
+            except Exception as e:
+                Log_Info(self.MODULE_NAME, f"Failed to signal foreground job: {e}")
+            return
+        
+        try:
+            shell_pgid = os.getpgid(self.process.pid)
+        except OSError:
+            return
+        processes = self._Job_Processes(self._job_nonce)
+        for pgid in {pgid for _, pgid in processes if pgid != shell_pgid}:
+            try:
+                os.killpg(pgid, sig)
+            except OSError:
+                pass
+        # 与shell同组的进程（未经作业控制启动）单独发送
+        for pid, pgid in processes:
+            if pgid == shell_pgid:
+                try:
+                    os.kill(pid, sig)
+                except OSError:
+                    pass
+        Log_Info(self.MODULE_NAME, f"Sent {sig.name} to {len(processes)} job processes")
+    
+    def _Sample_Peak_Rss(self):
+        """采样本条命令进程的内存峰值（各进程VmHWM之和），记录最大值"""
+        total = 0
+        for pid, _ in self._Job_Processes(self._job_nonce):
+            try:
+                with open(f"/proc/{pid}/status", "rb") as f:
+                    for line in f:
+                        if line.startswith(b"VmHWM:"):
+                            total += int(line.split()[1])
+                            break
+            except (OSError, ValueError, IndexError):
+                continue
+        if total and (self._peak_rss_kb is None or total > self._peak_rss_kb):
+            self._peak_rss_kb = total
+    
+    def _Restart(self):
+        """
+        结束后仍收不到结尾行（如shell内建命令死循环）时重启shell，并回到原工作目录
+        （shell中的变量等状态会丢失）
+        """
+        working_dir = self.working_dir
+        Log_Info(self.MODULE_NAME, f"Shell did not resynchronize, restarting in {working_dir}")
+        try:
+            self.process.kill()
+            self.process.wait(timeout=2)
+        except Exception:
+            pass
+        self._Close_Reader()
+        self.process = None
+        self.Start()
+        if working_dir and working_dir != self.initial_working_dir:
+            self._Run_Framed(f'cd /d "{working_dir}"' if os.name == 'nt' else f'cd "{working_dir}"', None, self.RESYNC_TIMEOUT)
+    
+    def Interrupt(self):
+        """
+        中断正在执行的前台命令（先向其进程组发送SIGTERM，Execute等待期间仍未结束则SIGKILL；
+        不使用SIGINT：非交互bash的前台子进程因SIGINT退出时bash自身也会退出）
+        """
+        self._interrupted.set()
+        self._Signal_Job(signal.SIGTERM)
+        self._Wake()
+        Log_Info(self.MODULE_NAME, "Foreground job interrupted")
+    
+    def Clear_Interrupt(self):
+        """清除中断标记，允许继续执行命令"""
+        self._interrupted.clear()
+    
+    def _Frame_Command(self, command: str, output_file: str, marker: str) -> str:
+        """
+        构造带结尾行的命令：命令执行完后在同一次发送中输出一行
+            <marker> <退出码> <开始时间> <结束时间> <工作目录>
+        bash下命令放在{ }中执行（整体重定向，cd等状态仍在当前shell中生效），
+        时间取自$EPOCHREALTIME（bash 5+，无需fork）；执行前导出JOB_ENV=nonce标记命令启动的进程，
+        结尾行之后由times输出两行累计CPU时间（shell自身、子进程）；cmd.exe下结尾行单独一行，
+        %ERRORLEVEL%在上一行执行后才展开，时间为"-"（由调用方记录）
+        
+        Args:
+            command: 命令
+            output_file: 输出重定向文件，None为不重定向
+            marker: 结束标记（END_MARKER:nonce）
+        
+        Returns:
+            发送给shell的文本
+        """
+        if os.name == 'nt':
+            line = f'{command} > "{output_file}" 2>&1' if output_file else command
+            return f'{line}\necho {marker} %ERRORLEVEL% - - %CD%'
+        
+        redirect = f' > "{output_file}" 2>&1' if output_file else ''
+        # 不重定向时输出可能不以换行结尾，结尾行前补一个换行
+        prefix = '' if output_file else '\\n'
+        nonce = marker.rsplit(":", 1)[-1]
+        return (f'export {self.JOB_ENV}={nonce}; __columba_start=$EPOCHREALTIME; {{ {command}\n}}{redirect}; '
+                f'printf \'{prefix}%s %s %s %s %s\\n\' "{marker}" "$?" "$__columba_start" "$EPOCHREALTIME" "$PWD"; times')
+    
+    def _Parse_Times(self, line: str) -> tuple:
+        """
+        解析times输出的一行（"0m0.010s 0m0.002s"）
+        
+        Args:
+            line: times输出行
+        
+        Returns:
+            (user, sys) 秒数元组，格式不符时返回None
+        """
+        values = []
+        for part in line.split():
+            minutes, _, seconds = part.rstrip("s").partition("m")
+            try:
+                values.append(int(minutes) * 60 + float(seconds.replace(",", ".")))
+            except ValueError:
+                return None
+        return tuple(values) if len(values) == 2 else None
+    
+    def _Parse_Trailer(self, trailer: list, info: dict):
+        """
+        解析结尾行，更新命令信息与当前工作目录；有times输出时计算本条命令子进程的CPU时间
+        
+        Args:
+            trailer: [结尾行（以结束标记开头）, times输出行...]
+            info: 命令信息字典（原地更新）
+        """
+        parts = trailer[0].rstrip("\r\n").split(" ", 4)
+        if len(parts) < 5:
+            return
+        
+        try:
+            info["return_code"] = int(parts[1])
+        except ValueError:
+            pass
+        for key, value in (("started_at", parts[2]), ("finished_at", parts[3])):
+            try:
+                info[key] = float(value.replace(",", "."))
+            except ValueError:
+                pass
+        if parts[4]:
+            info["working_dir"] = parts[4]
+            self.working_dir = parts[4]
+        
+        # times第二行为已回收子进程的累计CPU时间，与上一条命令之差即本条命令的CPU时间
+        child_times = self._Parse_Times(trailer[2]) if len(trailer) > 2 else None
+        if child_times is None:
+            return
+        if self._child_times is not None:
+            info["cpu_user"] = max(0.0, child_times[0] - self._child_times[0])
+            info["cpu_sys"] = max(0.0, child_times[1] - self._child_times[1])
+        self._child_times = child_times
+    
+    def _Run_Framed(self, command: str, output_file: str, timeout: float, output_lines: list = None) -> str:
+        """
+        发送带结尾行的命令并等待结尾行，一次往返得到退出码、工作目录、起止时间、CPU时间与峰值内存
+        （保存到last_command_info）；超时或取消后收不到结尾行时重启shell
+        
+        Args:
+            command: 命令
+            output_file: 输出重定向文件，None为不重定向
+            timeout: 超时时间（秒）
+            output_lines: 可选，收集结尾行之前的输出行
+        
+        Returns:
+            "done" | "timeout" | "cancelled"
+        """
+        nonce = uuid.uuid4().hex[:12]
+        marker = f"{self.END_MARKER}:{nonce}"
+        info = {"return_code": 0, "working_dir": self.working_dir, "started_at": time.time()}
+        
+        # 丢弃之前残留的输出
+        self._Drain_Output()
+        self._job_nonce = nonce
+        self._peak_rss_kb = None
+        self._Send_Command(self._Frame_Command(command, output_file, marker))
+        try:
+            status, trailer = self._Wait_End_Marker(marker, timeout, output_lines)
+        finally:
+            self._job_nonce = None
+        
+        info["finished_at"] = time.time()
+        if trailer is not None:
+            self._Parse_Trailer(trailer, info)
+        if output_lines and output_file is None and output_lines[-1] == "\n":
+            # 去掉结尾行前补的换行
+            output_lines.pop()
+        info["duration"] = max(0.0, info["finished_at"] - info["started_at"])
+        if self._peak_rss_kb is not None:
+            info["peak_rss_kb"] = self._peak_rss_kb
+        self.last_command_info = info
+        
+        if trailer is None and status != "done":
+            self._Restart()
+            self.last_command_info = info
+        return status
+    
+    def _Wait_End_Marker(self, marker: str, timeout: float, output_lines: list = None) -> tuple:
+        """
+        等待本条命令的结尾行，期间采样峰值内存并响应中断（其他nonce的结尾行是之前命令的残留，忽略）
+        超时时立即SIGKILL命令的进程组；中断时先SIGTERM（由Interrupt发送），KILL_GRACE秒后仍未结束则SIGKILL；
+        结束后再等待RESYNC_TIMEOUT秒，读到结尾行即与shell重新同步
+        
+        Args:
+            marker: 结束标记（END_MARKER:nonce）
+            timeout: 超时时间（秒）
+            output_lines: 可选，收集结尾行之前的输出行
+        
+        Returns:
+            (status, trailer) 元组，status为"done" | "timeout" | "cancelled"，
+            trailer为[结尾行, times输出行...]（未能重新同步时为None）
+        """
+        sampling = self._proc_available and os.name != 'nt'
+        now = time.monotonic()
+        end_time = now + timeout
+        sample_interval = self.SAMPLE_FIRST_INTERVAL
+        sample_time = now + sample_interval
+        status = None
+        kill_time = None
+        resync_time = None
+        while True:
+            now = time.monotonic()
+            if status is None:
+                if self._interrupted.is_set():
+                    status = "cancelled"
+                    kill_time = now + self.KILL_GRACE
+                elif now >= end_time:
+                    status = "timeout"
+                    kill_time = now
+            if kill_time is not None and now >= kill_time:
+                self._Signal_Job(signal.SIGKILL)
+                kill_time = None
+                resync_time = now + self.RESYNC_TIMEOUT
+            if resync_time is not None and now >= resync_time:
+                return (status, None)
+            
+            if sampling and now >= sample_time:
+                self._Sample_Peak_Rss()
+                sample_interval = min(sample_interval * 2, self.SAMPLE_MAX_INTERVAL)
+                sample_time = now + sample_interval
+            
+            deadlines = [kill_time, resync_time, end_time if status is None else None]
+            wait = min(deadline for deadline in deadlines if deadline is not None) - now
+            if sampling:
+                wait = min(wait, sample_time - now)
+            
+            line = self._Next_Line(max(0.0, wait))
+            if line is None:
+                continue
+            position = line.find(marker)
+            if position >= 0:
+                if position > 0 and output_lines is not None:
+                    output_lines.append(line[:position])
+                trailer = [line[position:]]
+                if os.name != 'nt':
+                    # times的两行与结尾行在同一次输出中，几乎立即到达
+                    for _ in range(2):
+                        times_line = self._Next_Line(self.RESYNC_TIMEOUT)
+                        if times_line is None:
+                            break
+                        trailer.append(times_line)
+                if status is None:
+                    status = "cancelled" if self._interrupted.is_set() else "done"
+                return (status, trailer)
+            if self.END_MARKER in line:
+                continue
+            if output_lines is not None:
+                output_lines.append(line)
     
     def _Validate_Command(self, command: str) -> bool:
         """校验命令安全性"""
@@ -239,128 +687,87 @@ class Persistent_Shell:
             self.Start()
         
         Log_Info(self.MODULE_NAME, f"Executing: {command}")
+        self.last_command_info = {}
         
         # 安全检查
         if not self._Validate_Command(command):
             return ("", "Command blocked for security reasons", -1, None)
         
+        if self._interrupted.is_set():
+            return ("", "Command cancelled", -4, None)
+        
         # 生成输出文件路径
         output_file = self._Generate_Output_File()
         self.last_output_file = output_file
         
         try:
-            # 清空之前的输出
-            self._Drain_Queue(0.1)
-            
             if output_file and os.path.isdir(self.tmp_workspace):
-                # 使用文件重定向执行命令
-                # 格式: command > output_file 2>&1
-                if os.name == 'nt':
-                    redirect_cmd = f'{command} > "{output_file}" 2>&1'
-                else:
-                    redirect_cmd = f'{command} > "{output_file}" 2>&1'
-                
-                self._Send_Command(redirect_cmd)
-                
-                # 发送结束标记
-                self._Send_Command(f'echo {self.END_MARKER}' if os.name == 'nt' else f'echo "{self.END_MARKER}"')
-                
-                # 等待结束标记
-                start_time = time.time()
-                while time.time() - start_time < timeout:
-                    try:
-                        line = self.output_queue.get(timeout=0.1)
-                        if self.END_MARKER in line:
-                            break
-                    except queue.Empty:
-                        continue
-                else:
+                # 使用文件重定向执行命令，结尾行与命令在同一次发送中
+                status = self._Run_Framed(command, output_file, timeout)
+                if status == "timeout":
                     Log_Info(self.MODULE_NAME, f"Command timed out after {timeout}s")
                     return ("", f"Command timed out after {timeout} seconds", -2, output_file)
+                if status == "cancelled":
+                    Log_Info(self.MODULE_NAME, "Command cancelled")
+                    return ("", "Command cancelled", -4, output_file)
                 
-                # 等待文件写入完成
-                time.sleep(0.1)
-                
-                # 读取输出文件（使用与shell相同的编码）
+                # 有界读取输出文件：只保留开头与结尾，并摘出错误行（使用与shell相同的编码；
+                # 结尾行在命令退出、重定向关闭之后才输出，无需等待写入）
                 output = ""
                 if os.path.exists(output_file):
-                    try:
-                        # Windows cmd重定向使用系统默认编码(gbk)
-                        file_encoding = self._encoding if hasattr(self, '_encoding') else ('gbk' if os.name == 'nt' else 'utf-8')
-                        with open(output_file, 'r', encoding=file_encoding, errors='replace') as f:
-                            output = f.read()
-                    except Exception as e:
-                        Log_Info(self.MODULE_NAME, f"Error reading output file: {e}")
-                        output = f"[Error reading output file: {e}]"
+                    # Windows cmd重定向使用系统默认编码(gbk)
+                    file_encoding = self._encoding if hasattr(self, '_encoding') else ('gbk' if os.name == 'nt' else 'utf-8')
+                    output = Read_Output(
+                        output_file,
+                        self.capture_config.get("head_bytes", DEFAULT_HEAD_BYTES),
+                        self.capture_config.get("tail_bytes", DEFAULT_TAIL_BYTES),
+                        self.capture_config,
+                        file_encoding
+                    )
                 
-                output = self._Sanitize_Output(output)
-                Log_Info(self.MODULE_NAME, f"Command completed, output saved to {output_file}")
+                return_code = self.last_command_info["return_code"]
+                Log_Info(self.MODULE_NAME, f"Command completed with return_code={return_code}, output saved to {output_file}")
                 
-                return (output, "", 0, output_file)
+                return (output, "", return_code, output_file)
             else:
-                # 无tmp_workspace时使用原始方式
-                self._Send_Command(command)
-                self._Send_Command(f'echo {self.END_MARKER}' if os.name == 'nt' else f'echo "{self.END_MARKER}"')
-                
+                # 无tmp_workspace时直接读取shell输出
                 output_lines = []
-                start_time = time.time()
-                
-                while time.time() - start_time < timeout:
-                    try:
-                        line = self.output_queue.get(timeout=0.1)
-                        if self.END_MARKER in line:
-                            break
-                        output_lines.append(line)
-                    except queue.Empty:
-                        continue
-                else:
+                status = self._Run_Framed(command, None, timeout, output_lines)
+                if status == "timeout":
                     Log_Info(self.MODULE_NAME, f"Command timed out after {timeout}s")
                     return ("".join(output_lines), f"Command timed out after {timeout} seconds", -2, None)
+                if status == "cancelled":
+                    Log_Info(self.MODULE_NAME, "Command cancelled")
+                    return ("".join(output_lines), "Command cancelled", -4, None)
                 
                 output = "".join(output_lines)
                 output = self._Sanitize_Output(output)
+                return_code = self.last_command_info["return_code"]
                 
-                Log_Info(self.MODULE_NAME, f"Command completed successfully")
-                return (output, "", 0, None)
+                Log_Info(self.MODULE_NAME, f"Command completed with return_code={return_code}")
+                return (output, "", return_code, None)
         
         except Exception as e:
             Log_Info(self.MODULE_NAME, f"Command execution error: {e}")
             return ("", str(e), -3, output_file)
     
     def Get_Working_Dir(self) -> str:
-        """获取当前工作目录"""
+        """获取当前工作目录（取自最近一条命令的结尾行，不与shell往返）"""
         if self.process is None or self.process.poll() is not None:
             return self.initial_working_dir
+        return self.working_dir
+    
+    def Change_Dir(self, path: str):
+        """
+        切换工作目录（不产生输出文件）
         
-        try:
-            self._Drain_Queue(0.1)
-            
-            if os.name == 'nt':
-                self._Send_Command('cd')
-            else:
-                self._Send_Command('pwd')
-            
-            self._Send_Command(f'echo {self.END_MARKER}' if os.name == 'nt' else f'echo "{self.END_MARKER}"')
-            
-            output_lines = []
-            start_time = time.time()
-            
-            while time.time() - start_time < 2:
-                try:
-                    line = self.output_queue.get(timeout=0.1)
-                    if self.END_MARKER in line:
-                        break
-                    output_lines.append(line.strip())
-                except queue.Empty:
-                    continue
-            
-            for line in reversed(output_lines):
-                if line and not line.startswith(('cd', 'pwd', 'echo')):
-                    return line
-            
-            return self.initial_working_dir
-        except Exception:
-            return self.initial_working_dir
+        Args:
+            path: 目标目录
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.Start()
+        
+        self._Run_Framed(f'cd /d "{path}"' if os.name == 'nt' else f'cd "{path}"', None, 2)
     
     def Get_Last_Output_File(self) -> str:
         """
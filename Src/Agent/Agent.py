@@ -9,12 +9,26 @@ import json
 import re
 import os
 import sys
+import hashlib
+import time
+import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from llama_cpp import Llama
-from Log.Log import Log_Info
+from Log.Log import Log_Info, Log_Warning
 from API.Shell import Persistent_Shell
+from Agent.Session import LLM_Session
+from Agent.Grammar import Build_Tool_Grammar
+from Agent.Context import Context_Manager, Context_Overflow_Error
+from Agent.Router import Model_Router
+from Agent.Tool_Call_Detector import Tool_Call_Detector
+from Agent.Tool_Registry import Tool_Registry
+from Agent.Plan_Cache import Plan_Cache
+from Agent.Response_Cache import Response_Cache
+from Agent.Tuning import Load_Profile, Build_Llama_Kwargs
+from Agent.Warmup import Import_Llama_Cpp
 
 
 class Agent:
@@ -25,6 +39,9 @@ class Agent:
     
     MODULE_NAME = "Agent"
     
+    # 任务被取消时返回的结果
+    CANCELLED_MESSAGE = "Task cancelled."
+    
     def __init__(self, config: dict, workspace: str = None, target_workspace: str = None):
         """
         初始化Agent
@@ -38,47 +55,318 @@ class Agent:
         
         self.model_path = agent_config.get("model_path", "Model/Qwen3-0.6B-Q8_0.gguf")
         self.n_threads = agent_config.get("n_threads", 4)
+        self.n_batch = agent_config.get("n_batch", 512)
+        self.kv_cache_type = agent_config.get("kv_cache_type", "f16")
+        self.use_mlock = agent_config.get("use_mlock", False)
+        
+        # 自动应用Tool/tune_model.py生成的调优档案（配置中显式设置的参数优先）
+        self.auto_tune = agent_config.get("auto_tune", True)
+        self._tunable_keys = [key for key in ("n_threads", "n_batch", "kv_cache_type") if key not in agent_config]
         self.max_iterations = agent_config.get("max_iterations", 10)
         self.context_length = agent_config.get("context_length", 2048)
+        self.max_tokens = agent_config.get("max_tokens", 1024)
         self.stream = agent_config.get("stream", True)
+        self.early_stop = agent_config.get("early_stop", True)
+        
+        # 并行工具调用：允许模型在一次响应中输出相互独立的工具调用数组，并发执行
+        self.parallel_tool_calls = agent_config.get("parallel_tool_calls", False)
+        self.parallel_max_workers = agent_config.get("parallel_max_workers", 4)
         self.system_prompt = agent_config.get("system_prompt", "You are a helpful AI assistant.")
         
+        # 动态工具描述：提示词中所有工具只列一行简介，与消息相关的top_k个工具附带完整描述
+        self.tool_selection = agent_config.get("tool_selection", False)
+        self.tool_selection_top_k = agent_config.get("tool_selection_top_k", 3)
+        
+        # 计划缓存：相同请求重放上次成功的工具调用序列，只在总结或某一步失败时调用模型
+        self.plan_cache_enabled = agent_config.get("plan_cache", False)
+        self.plan_cache_size = agent_config.get("plan_cache_size", 64)
+        
+        # 答案缓存：没有调用工具的纯知识问答，相同或相近的问题在有效期内直接返回缓存答案
+        self.response_cache = None
+        if agent_config.get("response_cache", False):
+            self.response_cache = Response_Cache(
+                ttl=agent_config.get("response_cache_ttl", 3600),
+                max_entries=agent_config.get("response_cache_size", 128),
+                threshold=agent_config.get("response_cache_threshold", 0.9)
+            )
+        
+        # 会话状态快照配置（跨进程重启恢复已评估的系统提示词前缀）
+        self.state_cache = agent_config.get("state_cache", True)
+        self.state_cache_conversation = agent_config.get("state_cache_conversation", False)
+        self.cache_dir = agent_config.get("cache_dir", ".columba_cache")
+        
+        # 约束解码：根据已注册工具生成GBNF语法，输出只能是工具调用JSON或最终文本
+        self.constrained_decoding = agent_config.get("constrained_decoding", False)
+        self._grammar = None
+        
+        # 投机解码："none" | "draft"（小模型草稿） | "prompt_lookup"（上下文n-gram草稿）
+        self.speculative_mode = agent_config.get("speculative_mode", "none")
+        self.draft_model_path = agent_config.get("draft_model_path", "Model/Qwen3-0.6B-Q8_0.gguf")
+        self.draft_tokens = agent_config.get("draft_tokens", 4)
+        self.draft_model = None
+        
+        # 共享推理服务：启用时通过Model_Client连接Model_Server进程，本进程不加载模型
+        server_config = config.get("Model_Server", {})
+        self.use_model_server = server_config.get("enabled", False)
+        # 只限制等待服务进程开始监听的时间，模型加载期间等待服务端的ready消息
+        self.model_server_timeout = server_config.get("connect_timeout", 30)
+        self._server_config = config
+        
         # 工作目录
         self.workspace = workspace  # 临时目录
         self.target_workspace = target_workspace  # 目标操作目录
         
-        # 构建完整模型路径
-        if not os.path.isabs(self.model_path):
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            self.model_path = os.path.join(base_dir, self.model_path)
+        # 构建完整路径
+        self.model_path = self._Resolve_Path(self.model_path)
+        self.draft_model_path = self._Resolve_Path(self.draft_model_path)
+        self.cache_dir = self._Resolve_Path(self.cache_dir)
+        self.plan_cache = Plan_Cache(self.cache_dir, self.plan_cache_size) if self.plan_cache_enabled else None
+        
+        # 多模型路由：models按从小到大排列，未配置时只使用model_path一个模型
+        model_specs = agent_config.get("models") or [
+            {"name": "default", "model_path": self.model_path, "multi_step": True}
+        ]
+        model_specs = [dict(spec, model_path=self._Resolve_Path(spec["model_path"])) for spec in model_specs]
+        if self.use_model_server:
+            # 推理服务只持有一个模型，不做多模型路由
+            model_specs = [{"name": "server", "model_path": self.model_path, "multi_step": True}]
+        self.default_model = model_specs[0]["name"] if self.use_model_server else agent_config.get("default_model", model_specs[0]["name"])
+        self.context_keep_recent = agent_config.get("context_keep_recent", 2)
+        self.context_shrink_tokens = agent_config.get("context_shrink_tokens", 256)
+        
+        self.model = None
+        self.session = None
+        self.model_settings = None
+        self.context_manager = None
+        self.active_model_name = None
         
         # 注册的工具
-        self.tools = {}
+        self.tools = Tool_Registry()
+        
+        # 最近一次Run的工具选择结果与提示词token节省
+        self.last_tool_selection = {}
+        self._full_prompt_tokens = None
+        
+        # 已编译的系统提示词 {工具描述: 系统提示词}，工具集变化时清空；
+        # token ids由各模型的会话层按消息缓存
+        self._system_prompt_cache = {}
+        
+        # 最近一次Run每轮迭代的prefill统计（复用/评估的token数）
+        self.prefill_stats = []
+        
+        # 最近一次Run的计划重放结果
+        self.last_plan_replay = {}
+        
+        # 最近一次Run的答案缓存命中情况，以及本次答案是否可以缓存（没有调用工具）
+        self.last_response_cache = {}
+        self._answer_cacheable = False
+        
+        # 最近一次Run的计时记录（prefill/decode/TTFT/工具耗时等）
+        self.last_run_telemetry = {}
+        self._run_start_time = 0.0
+        
+        # 取消标记：由Agent_Process在收到cancel消息时置位，生成循环逐token检查
+        self.cancel_event = threading.Event()
+        
+        # 工具调用解析统计（累计），用于对比约束解码开启前后的解析失败率
+        self.parse_stats = {"responses": 0, "failures": 0}
+        
+        # 启动各阶段耗时（秒）
+        self.startup_profile = {}
+        init_start = time.time()
         
         # 初始化持久化Shell，进入target_workspace目录，输出保存到tmp_workspace
+        # Shell在后台线程中启动，与llama_cpp导入和模型加载并行
         Log_Info(self.MODULE_NAME, f"Initializing persistent shell in {self.target_workspace}")
         Log_Info(self.MODULE_NAME, f"Command output will be saved to {self.workspace}")
         self.shell = Persistent_Shell(
             working_dir=self.target_workspace,
-            tmp_workspace=self.workspace
+            tmp_workspace=self.workspace,
+            capture_config=config.get("Output_Capture", {})
         )
-        self.shell.Start()
-        Log_Info(self.MODULE_NAME, "Persistent shell started")
+        self._shell_error = None
+        shell_thread = threading.Thread(target=self._Start_Shell, daemon=True)
+        shell_thread.start()
         
         # 加载模型
-        Log_Info(self.MODULE_NAME, f"Loading model from {self.model_path}")
         Log_Info(self.MODULE_NAME, f"Tmp workspace: {self.workspace}")
         Log_Info(self.MODULE_NAME, f"Target workspace: {self.target_workspace}")
-        self.model = Llama(
-            model_path=self.model_path,
+        if not self.use_model_server:
+            self.startup_profile["import_seconds"] = Import_Llama_Cpp()
+        self.router = Model_Router(
+            model_specs,
+            loader=self._Load_Model,
+            unloader=self._Unload_Model,
+            memory_budget_mb=agent_config.get("model_memory_budget_mb", 0)
+        )
+        model_start = time.time()
+        self._Activate_Model(self.default_model)
+        self.startup_profile["model_seconds"] = time.time() - model_start
+        
+        shell_thread.join()
+        if self._shell_error is not None:
+            raise self._shell_error
+        self.startup_profile["agent_init_seconds"] = time.time() - init_start
+    
+    def _Start_Shell(self):
+        """
+        启动持久化Shell（在后台线程中运行，异常留给主线程抛出）
+        """
+        start_time = time.time()
+        try:
+            self.shell.Start()
+        except Exception as e:
+            self._shell_error = e
+            return
+        self.startup_profile["shell_seconds"] = time.time() - start_time
+        Log_Info(self.MODULE_NAME, f"Persistent shell started in {self.startup_profile['shell_seconds']:.2f}s")
+    
+    def _Resolve_Path(self, path: str) -> str:
+        """
+        将相对路径解析为相对于项目根目录的绝对路径
+        
+        Args:
+            path: 路径
+        
+        Returns:
+            绝对路径
+        """
+        if os.path.isabs(path):
+            return path
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return os.path.join(base_dir, path)
+    
+    def _Load_Model(self, spec: dict) -> dict:
+        """
+        加载模型并创建对应的会话层与上下文管理器（供Model_Router懒加载调用）
+        
+        Args:
+            spec: 模型配置
+        
+        Returns:
+            模型句柄 {"model", "session", "context_manager", "model_path"}
+        """
+        if self.use_model_server:
+            handle = self._Connect_Model_Server(spec)
+            if handle is not None:
+                return handle
+        
+        Log_Info(self.MODULE_NAME, f"Loading model {spec['name']} from {spec['model_path']}")
+        
+        # 草稿模型随第一个主模型一起（重新）加载
+        if self.draft_model is None:
+            self.draft_model = self._Load_Draft_Model()
+        
+        settings = {"n_threads": self.n_threads, "n_batch": self.n_batch, "kv_cache_type": self.kv_cache_type}
+        if self.auto_tune and self._tunable_keys:
+            profile = Load_Profile(self.cache_dir, spec["model_path"])
+            if profile is not None:
+                for key in self._tunable_keys:
+                    if key in profile:
+                        settings[key] = profile[key]
+        Log_Info(self.MODULE_NAME, f"Inference settings: {settings}")
+        
+        # 延迟导入：llama_cpp加载共享库较慢，不在模块导入时进行
+        from llama_cpp import Llama
+        model = Llama(
+            model_path=spec["model_path"],
             n_ctx=self.context_length,
-            n_threads=self.n_threads,
             verbose=False,
-            chat_format="chatml"
+            chat_format="chatml",
+            draft_model=self.draft_model,
+            **Build_Llama_Kwargs(settings["n_threads"], settings["n_batch"], settings["kv_cache_type"], self.use_mlock)
         )
         Log_Info(self.MODULE_NAME, "Model loaded successfully")
+        
+        # 会话层：跨迭代/跨Run复用已评估的token前缀
+        session = LLM_Session(model)
+        
+        # 上下文管理：按token预算压缩历史，保证prompt + max_tokens不超过n_ctx
+        context_manager = Context_Manager(
+            session,
+            n_ctx=self.context_length,
+            keep_recent=self.context_keep_recent,
+            shrink_tokens=self.context_shrink_tokens
+        )
+        
+        return {
+            "model": model,
+            "session": session,
+            "context_manager": context_manager,
+            "model_path": spec["model_path"],
+            "settings": settings
+        }
+    
+    def _Connect_Model_Server(self, spec: dict) -> dict:
+        """
+        连接共享推理服务，会话对象同时作为模型句柄（close即断开连接）
+        
+        Args:
+            spec: 模型配置
+        
+        Returns:
+            模型句柄，连接失败时返回None（回退到本地加载）
+        """
+        from Agent.Model_Client import Remote_Session
+        from Agent.Model_Server import Get_Server_Address
+        
+        address, family, authkey = Get_Server_Address(self._server_config)
+        try:
+            session = Remote_Session(address, family, authkey, timeout=self.model_server_timeout)
+        except Exception as e:
+            Log_Warning(self.MODULE_NAME, f"Model server unavailable ({e}), loading a separate copy of the model locally")
+            self.use_model_server = False
+            self._grammar = None
+            return None
+        
+        context_manager = Context_Manager(
+            session,
+            n_ctx=self.context_length,
+            keep_recent=self.context_keep_recent,
+            shrink_tokens=self.context_shrink_tokens
+        )
+        return {
+            "model": session,
+            "session": session,
+            "context_manager": context_manager,
+            "model_path": spec["model_path"],
+            "settings": None
+        }
     
-    def Register_Tool(self, name: str, func: callable, description: str):
+    def _Unload_Model(self, handle: dict):
+        """
+        释放模型（供Model_Router卸载调用）
+        
+        Args:
+            handle: 模型句柄
+        """
+        model = handle["model"]
+        if handle["model"] is self.model:
+            self.model = None
+            self.session = None
+            self.context_manager = None
+            self.active_model_name = None
+        close = getattr(model, "close", None)
+        if close is not None:
+            close()
+    
+    def _Activate_Model(self, name: str):
+        """
+        切换当前使用的模型（未加载时懒加载）
+        
+        Args:
+            name: 模型名称
+        """
+        handle = self.router.Get(name)
+        self.active_model_name = name
+        self.model = handle["model"]
+        self.session = handle["session"]
+        self.context_manager = handle["context_manager"]
+        self.model_path = handle["model_path"]
+        self.model_settings = handle["settings"]
+    
+    def Register_Tool(self, name: str, func: callable, description: str, summary: str = None,
+                      keywords: list = None, always: bool = False):
         """
         注册工具
         
@@ -86,54 +374,272 @@ class Agent:
             name: 工具名称
             func: 工具函数
             description: 工具描述（JSON格式描述）
+            summary: 一行简介（启用tool_selection时用于未选中的工具），默认取描述第一行
+            keywords: 额外的检索关键词
+            always: 启用tool_selection时是否总是附带完整描述
         """
-        self.tools[name] = {
-            "func": func,
-            "description": description
-        }
+        self.tools.Register(name, func, description, summary=summary, keywords=keywords, always=always)
+        # 工具集变化，语法与完整提示词token数需重新计算
+        self._grammar = None
+        self._full_prompt_tokens = None
+        self._system_prompt_cache.clear()
         Log_Info(self.MODULE_NAME, f"Registered tool: {name}")
     
+    def _Load_Draft_Model(self):
+        """
+        按speculative_mode加载投机解码草稿模型
+        
+        Returns:
+            LlamaDraftModel实例，未启用或加载失败时返回None
+        """
+        if self.speculative_mode == "draft":
+            if not os.path.exists(self.draft_model_path):
+                Log_Info(self.MODULE_NAME, f"Draft model not found: {self.draft_model_path}, speculative decoding disabled")
+                return None
+            from Agent.Speculative import Small_Model_Draft
+            return Small_Model_Draft(
+                self.draft_model_path,
+                n_ctx=self.context_length,
+                n_threads=self.n_threads,
+                num_pred_tokens=self.draft_tokens
+            )
+        
+        if self.speculative_mode == "prompt_lookup":
+            from Agent.Speculative import Prompt_Lookup_Draft
+            Log_Info(self.MODULE_NAME, "Using prompt lookup decoding")
+            return Prompt_Lookup_Draft(num_pred_tokens=self.draft_tokens)
+        
+        return None
+    
     def Run(self, user_message: str) -> str:
         """
         处理用户消息，返回结果
         
         Args:
             user_message: 用户消息
-            stream: 是否启用流式输出（逐token打印）
         
         Returns:
             处理结果字符串
         """
         Log_Info(self.MODULE_NAME, f"Processing message: {user_message[:50]}...")
         
-        # 构建工具描述
-        tool_descriptions = self._Build_Tool_Descriptions()
+        self._run_start_time = time.time()
+        draft_snapshot = self.draft_model.stats.Snapshot() if self.draft_model is not None else None
+        
+        # 答案缓存命中时不调用模型（在路由前查找，不触发模型切换）
+        self.last_response_cache = {}
+        if self.response_cache is not None:
+            answer, similarity = self.response_cache.Lookup(user_message, self.active_model_name, self.session.Tokenize)
+            if answer is not None:
+                self.prefill_stats = []
+                self.last_plan_replay = {}
+                self.last_tool_selection = {}
+                self.last_response_cache = {"hit": True, "similarity": round(similarity, 3)}
+                self.last_run_telemetry = self._Build_Telemetry()
+                Log_Info(self.MODULE_NAME, f"Response cache report: {self.response_cache.Get_Report()}")
+                return answer
         
-        # 构建系统提示词
-        system_content = self._Build_System_Prompt(tool_descriptions)
+        # 路由到最可能成功的最小模型
+        self._Activate_Model(self.router.Route(user_message))
+        
+        result = self._Run_Iterations(user_message)
+        
+        if self.response_cache is not None and self._answer_cacheable:
+            self.response_cache.Store(user_message, result, self.active_model_name, self.session.Tokenize)
+        
+        self.last_run_telemetry = self._Build_Telemetry()
+        Log_Info(self.MODULE_NAME, f"Run telemetry: {json.dumps(self.last_run_telemetry, ensure_ascii=False)}")
+        
+        self._Log_Generation_Stats(draft_snapshot)
+        Log_Info(self.MODULE_NAME, f"Model routing report: {self.router.Get_Report()}")
+        if self.plan_cache is not None:
+            Log_Info(self.MODULE_NAME, f"Plan cache report: {self.plan_cache.Get_Report()}")
+        if self.response_cache is not None:
+            Log_Info(self.MODULE_NAME, f"Response cache report: {self.response_cache.Get_Report()}")
+        return result
+    
+    def _Build_Telemetry(self) -> dict:
+        """
+        汇总最近一次Run的计时记录
+        
+        Returns:
+            计时记录字典（时间单位为毫秒）
+        """
+        iterations = []
+        for stats in self.prefill_stats:
+            prefill_ms = stats["first_token_seconds"] * 1000
+            iterations.append({
+                "iteration": stats["iteration"],
+                "model": stats["model"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "reused_tokens": stats["reused_tokens"],
+                "evaluated_tokens": stats["evaluated_tokens"],
+                "generated_tokens": stats["generated_tokens"],
+                "prefill_ms": round(prefill_ms, 1),
+                "decode_ms": round(stats["generation_seconds"] * 1000 - prefill_ms, 1),
+                "tool_ms": round(stats.get("tool_seconds", 0.0) * 1000, 1)
+            })
+        
+        evaluated_tokens = sum(item["evaluated_tokens"] for item in iterations)
+        generated_tokens = sum(item["generated_tokens"] for item in iterations)
+        prefill_ms = sum(item["prefill_ms"] for item in iterations)
+        decode_ms = sum(item["decode_ms"] for item in iterations)
+        tool_ms = sum(item["tool_ms"] for item in iterations) + self.last_plan_replay.get("tool_ms", 0.0)
+        
+        ttft_ms = 0.0
+        if self.prefill_stats:
+            first = self.prefill_stats[0]
+            ttft_ms = (first["started_at"] + first["first_token_seconds"] - self._run_start_time) * 1000
+        
+        return {
+            "model": self.active_model_name,
+            "iterations": iterations,
+            "prompt_tokens": sum(item["prompt_tokens"] for item in iterations),
+            "evaluated_tokens": evaluated_tokens,
+            "generated_tokens": generated_tokens,
+            "prefill_ms": round(prefill_ms, 1),
+            "decode_ms": round(decode_ms, 1),
+            "ttft_ms": round(ttft_ms, 1),
+            "tool_ms": round(tool_ms, 1),
+            "total_ms": round((time.time() - self._run_start_time) * 1000, 1),
+            "prefill_tokens_per_second": round(evaluated_tokens * 1000 / prefill_ms, 2) if prefill_ms > 0 else 0.0,
+            "decode_tokens_per_second": round(generated_tokens * 1000 / decode_ms, 2) if decode_ms > 0 else 0.0,
+            "tool_selection": self.last_tool_selection,
+            "plan_cache": self.last_plan_replay,
+            "response_cache": self.last_response_cache
+        }
+    
+    def _Escalate_Model(self) -> bool:
+        """
+        当前模型未能给出合法工具调用或答案时，切换到更大的模型
+        
+        Returns:
+            是否已切换
+        """
+        next_name = self.router.Escalate(self.active_model_name)
+        if next_name is None:
+            return False
+        
+        if self.stream:
+            print(f"\n[Escalating to {next_name}]")
+        self._Activate_Model(next_name)
+        return True
+    
+    def _Log_Generation_Stats(self, draft_snapshot: tuple):
+        """
+        记录本次请求的生成速度与投机解码接受率
+        每轮生成中草稿模型调用一次，主模型每轮额外采样一个token，
+        因此接受的草稿token数约为 生成token数 - 草稿调用次数
+        
+        Args:
+            draft_snapshot: Run开始时草稿统计快照，未启用投机解码时为None
+        """
+        generated = sum(stats["generated_tokens"] for stats in self.prefill_stats)
+        seconds = sum(stats["generation_seconds"] for stats in self.prefill_stats)
+        tokens_per_second = generated / seconds if seconds > 0 else 0.0
+        
+        message = f"Generated {generated} tokens in {seconds:.2f}s, effective {tokens_per_second:.2f} tokens/s"
+        
+        if draft_snapshot is not None:
+            calls, proposed = self.draft_model.stats.Snapshot()
+            calls -= draft_snapshot[0]
+            proposed -= draft_snapshot[1]
+            accepted = min(proposed, max(0, generated - calls))
+            acceptance = accepted / proposed if proposed > 0 else 0.0
+            message += f", draft proposed={proposed}, accepted~{accepted}, acceptance={acceptance:.1%}"
+        
+        Log_Info(self.MODULE_NAME, message)
+    
+    def _Run_Iterations(self, user_message: str) -> str:
+        """
+        迭代调用LLM与工具，直到得到最终结果
+        
+        Args:
+            user_message: 用户消息
+        
+        Returns:
+            处理结果字符串
+        """
+        # 构建系统提示词（启用tool_selection时只附带相关工具的完整描述）
+        system_content = self._Get_System_Content(user_message)
         
         messages = [
             {"role": "system", "content": system_content},
             {"role": "user", "content": user_message}
         ]
         
+        self.prefill_stats = []
+        self.last_plan_replay = {}
+        self._answer_cacheable = False
+        
+        # 本次Run执行的工具调用及其推理耗时（成功时记录为计划）
+        plan_steps = []
+        plan_seconds = 0.0
+        plan_failed = False
+        replayed = False
+        
+        # 命中计划缓存时先重放工具调用，之后由模型总结结果（某一步失败时由模型接手）
+        if self.plan_cache is not None:
+            plan = self.plan_cache.Lookup(user_message)
+            if plan is not None:
+                replayed = True
+                plan_failed = self._Replay_Plan(plan, messages)
+                if self.cancel_event.is_set():
+                    Log_Info(self.MODULE_NAME, "Run cancelled during plan replay")
+                    return self.CANCELLED_MESSAGE
+                if plan_failed:
+                    self.plan_cache.Invalidate(user_message)
+                else:
+                    self.plan_cache.Record_Hit(user_message)
+        
         # 迭代处理，支持多轮工具调用
         for iteration in range(self.max_iterations):
+            if self.cancel_event.is_set():
+                Log_Info(self.MODULE_NAME, "Run cancelled")
+                return self.CANCELLED_MESSAGE
+            
             Log_Info(self.MODULE_NAME, f"Iteration {iteration + 1}")
             
             if self.stream :
                 print(f"\n[Iteration {iteration + 1}] ", end="", flush=True)
             
-            response_text = self._Generate_Response(messages, self.stream)
+            # 按token预算压缩历史（压缩结果保留到后续迭代）
+            try:
+                messages, max_tokens = self.context_manager.Fit(messages, self.max_tokens)
+            except Context_Overflow_Error as e:
+                Log_Info(self.MODULE_NAME, f"Context overflow: {e}")
+                return f"[Error] {e}. Shorten the system prompt or the task, or raise n_ctx."
+            
+            generation_start = time.time()
+            response_text = self._Generate_Response(messages, self.stream, max_tokens)
             Log_Info(self.MODULE_NAME, f"Model response: {response_text[:100]}...")
             
+            # 记录本轮prefill统计
+            stats = self.session.Get_Last_Stats()
+            stats["iteration"] = iteration + 1
+            stats["started_at"] = generation_start
+            stats["model"] = self.active_model_name
+            self.prefill_stats.append(stats)
+            self.router.Record_Generation(self.active_model_name, stats["generation_seconds"])
+            Log_Info(self.MODULE_NAME, f"Iteration {iteration + 1} prefill: reused={stats['reused_tokens']}, evaluated={stats['evaluated_tokens']}")
+            
+            if self.cancel_event.is_set():
+                Log_Info(self.MODULE_NAME, "Run cancelled during generation")
+                return self.CANCELLED_MESSAGE
+            
             # 解析工具调用
-            tool_call = self._Parse_Tool_Call(response_text)
+            tool_calls = self._Parse_Tool_Calls(response_text)
+            tool_call = tool_calls[0] if tool_calls else None
+            self._Record_Parse_Result(response_text, tool_call)
             
             if tool_call is None:
                 # 无工具调用，清理并返回最终结果
                 final_result = self._Clean_Response(response_text)
                 
+                # 工具调用无法解析或没有答案时，升级到更大的模型重试本轮
+                if (not final_result.strip() or '"tool"' in final_result) and self._Escalate_Model():
+                    continue
+                
                 # 如果清理后内容为空，说明模型只输出了think但没有答案
                 if not final_result.strip() and iteration < self.max_iterations - 1:
                     Log_Info(self.MODULE_NAME, "Empty response after cleaning, requesting continuation")
@@ -144,16 +650,33 @@ class Agent:
                     messages.append({"role": "user", "content": "Continue with the next step if there are remaining tasks, or provide your final answer. Output only the tool JSON or your response text."})
                     continue
                 
+                if self.plan_cache is not None and not replayed and not plan_failed and final_result.strip():
+                    self.plan_cache.Record(user_message, plan_steps, plan_seconds)
+                
+                # 没有调用任何工具的答案与机器状态无关，可以缓存
+                self._answer_cacheable = bool(final_result.strip()) and not plan_steps and not replayed
+                
                 return final_result if final_result.strip() else response_text
             
-            tool_name, tool_args = tool_call
-            
-            if self.stream:
-                print(f"\n\n[Tool Call] {tool_name} with args: {tool_args}")
+            tool_start = time.time()
+            if len(tool_calls) > 1:
+                # 并发执行相互独立的工具调用，合并为一次工具结果
+                tool_result = self._Execute_Tools_Parallel(tool_calls)
+            else:
+                tool_name, tool_args = tool_call
+                
+                if self.stream:
+                    print(f"\n\n[Tool Call] {tool_name} with args: {tool_args}")
+                
+                # 执行工具
+                tool_result = self._Execute_Tool(tool_name, tool_args)
+                Log_Info(self.MODULE_NAME, f"Tool {tool_name} result: {tool_result}")
+            stats["tool_seconds"] = time.time() - tool_start
             
-            # 执行工具
-            tool_result = self._Execute_Tool(tool_name, tool_args)
-            Log_Info(self.MODULE_NAME, f"Tool {tool_name} result: {tool_result}")
+            plan_steps.append({"response": response_text, "calls": [[name, args] for name, args in tool_calls]})
+            plan_seconds += stats["generation_seconds"]
+            if self.plan_cache is not None and self.plan_cache.Is_Failed_Result(tool_result):
+                plan_failed = True
             
             if self.stream:
                 print(f"\n[Tool Result]\n{tool_result}")
@@ -165,41 +688,276 @@ class Agent:
         Log_Info(self.MODULE_NAME, "Max iterations reached")
         return "Maximum tool call iterations reached."
     
-    def _Generate_Response(self, messages: list, stream: bool = False) -> str:
+    def _Replay_Plan(self, plan: dict, messages: list) -> bool:
+        """
+        重放缓存的工具调用序列，把模型原始输出与工具结果依次追加到消息历史
+        
+        Args:
+            plan: 计划字典
+            messages: 消息列表（原地追加）
+        
+        Returns:
+            是否有步骤失败（失败后停止重放，由模型接手）
+        """
+        Log_Info(self.MODULE_NAME, f"Plan cache hit, replaying {len(plan['steps'])} steps")
+        replay_start = time.time()
+        failed = False
+        steps = 0
+        
+        for step in plan["steps"]:
+            if self.cancel_event.is_set():
+                break
+            
+            tool_calls = [(name, args) for name, args in step["calls"]]
+            if len(tool_calls) > 1:
+                tool_result = self._Execute_Tools_Parallel(tool_calls)
+            else:
+                tool_name, tool_args = tool_calls[0]
+                if self.stream:
+                    print(f"\n[Replay] {tool_name} with args: {tool_args}")
+                tool_result = self._Execute_Tool(tool_name, tool_args)
+                Log_Info(self.MODULE_NAME, f"Replayed tool {tool_name} result: {tool_result}")
+            
+            if self.stream:
+                print(f"\n[Tool Result]\n{tool_result}")
+            
+            messages.append({"role": "assistant", "content": step["response"]})
+            messages.append({"role": "user", "content": f"Tool result: {tool_result}"})
+            steps += 1
+            
+            if self.plan_cache.Is_Failed_Result(tool_result):
+                Log_Info(self.MODULE_NAME, f"Replayed step {steps} failed, handing over to the model")
+                failed = True
+                break
+        
+        self.last_plan_replay = {
+            "hit": True,
+            "steps": steps,
+            "failed": failed,
+            "tool_ms": round((time.time() - replay_start) * 1000, 1),
+            "saved_ms": 0.0 if failed else round(plan["generation_seconds"] * 1000, 1)
+        }
+        return failed
+    
+    def _Generate_Response(self, messages: list, stream: bool = False, max_tokens: int = None) -> str:
         """
         生成LLM响应
         
         Args:
             messages: 消息列表
             stream: 是否启用流式输出
+            max_tokens: 最大生成token数，默认使用配置值
         
         Returns:
             完整响应文本
         """
-        if stream:
-            # 流式生成
-            response_text = ""
-            for chunk in self.model.create_chat_completion(
-                messages=messages,
-                max_tokens=1024,
-                stop=["</s>"],
-                stream=True
-            ):
-                delta = chunk["choices"][0].get("delta", {})
-                content = delta.get("content", "")
-                if content:
+        if max_tokens is None:
+            max_tokens = self.max_tokens
+        
+        kwargs = {}
+        grammar = self._Get_Grammar()
+        if grammar is not None:
+            kwargs["grammar"] = grammar
+        
+        # 增量检测工具调用，JSON闭合后立即停止解码
+        detector = None
+        if self.early_stop and self.tools:
+            detector = Tool_Call_Detector(self.tools.keys(), allow_list=self.parallel_tool_calls)
+        
+        # 统一使用流式生成，stream仅决定是否逐token打印
+        response_text = ""
+        generator = self.session.Generate_Stream(
+            messages,
+            max_tokens=max_tokens,
+            stop=["</s>"],
+            **kwargs
+        )
+        try:
+            for content in generator:
+                if self.cancel_event.is_set():
+                    Log_Info(self.MODULE_NAME, "Generation cancelled")
+                    break
+                if stream:
                     print(content, end="", flush=True)
-                    response_text += content
+                response_text += content
+                if detector is not None and detector.Feed(content):
+                    response_text = detector.text[:detector.end]
+                    Log_Info(self.MODULE_NAME, f"Tool call {detector.tool_call[0]} complete, stopping generation early")
+                    break
+        finally:
+            generator.close()
+        
+        if stream:
             print()  # 换行
-            return response_text.strip()
-        else:
-            # 非流式生成
-            output = self.model.create_chat_completion(
-                messages=messages,
-                max_tokens=1024,
-                stop=["</s>"]
-            )
-            return output["choices"][0]["message"]["content"].strip()
+        return response_text.strip()
+    
+    def _Get_Grammar(self):
+        """
+        获取约束解码语法（按当前工具集缓存）
+        
+        Returns:
+            LlamaGrammar实例（使用推理服务时为语法文本），未启用约束解码时返回None
+        """
+        if not self.constrained_decoding:
+            return None
+        
+        if self._grammar is None:
+            grammar_text = Build_Tool_Grammar(self.tools, allow_list=self.parallel_tool_calls)
+            if self.use_model_server:
+                # 推理服务在服务端编译语法文本
+                self._grammar = grammar_text
+            else:
+                from llama_cpp import LlamaGrammar
+                self._grammar = LlamaGrammar.from_string(grammar_text, verbose=False)
+            Log_Info(self.MODULE_NAME, f"Tool grammar built for {len(self.tools)} tools")
+        
+        return self._grammar
+    
+    def _Record_Parse_Result(self, response: str, tool_call: tuple):
+        """
+        记录工具调用解析结果，响应中出现"tool"键但未能解析出合法调用时计为一次失败
+        
+        Args:
+            response: LLM响应文本
+            tool_call: _Parse_Tool_Call的返回值
+        """
+        self.parse_stats["responses"] += 1
+        if tool_call is None and '"tool"' in response:
+            self.parse_stats["failures"] += 1
+            mode = "constrained" if self.constrained_decoding else "free"
+            Log_Info(self.MODULE_NAME, f"Tool call parse failure ({mode}): total {self.parse_stats['failures']}/{self.parse_stats['responses']}")
+    
+    def _Get_System_Content(self, user_message: str = None) -> str:
+        """
+        构建包含工具描述的完整系统提示词
+        启用tool_selection时，工具列表只有一行简介（与消息无关，前缀可复用），
+        相关工具的完整描述追加在提示词末尾
+        
+        Args:
+            user_message: 用户消息，为None时不附带工具完整描述（用于会话状态快照）
+        
+        Returns:
+            系统提示词
+        """
+        if not self.tool_selection:
+            return self._Compile_System_Prompt(self._Build_Tool_Descriptions())
+        
+        system_content = self._Compile_System_Prompt(self.tools.Build_Summaries() if self.tools else "No tools available.")
+        if user_message is None:
+            return system_content
+        
+        selected = self.tools.Select(user_message, self.tool_selection_top_k)
+        if selected:
+            system_content += f"\n\n## 相关工具详细说明\n{self.tools.Build_Details(selected)}"
+        self._Record_Tool_Selection(selected, system_content)
+        return system_content
+    
+    def _Compile_System_Prompt(self, tool_descriptions: str) -> str:
+        """
+        获取系统提示词（按工具描述缓存，避免每次Run重新拼接）
+        
+        Args:
+            tool_descriptions: 工具描述
+        
+        Returns:
+            系统提示词
+        """
+        system_content = self._system_prompt_cache.get(tool_descriptions)
+        if system_content is None:
+            system_content = self._Build_System_Prompt(tool_descriptions)
+            self._system_prompt_cache[tool_descriptions] = system_content
+        return system_content
+    
+    def _Record_Tool_Selection(self, selected: list, system_content: str):
+        """
+        记录工具选择结果，并与附带全部工具完整描述的提示词比较token数
+        
+        Args:
+            selected: 选中的工具名称列表
+            system_content: 实际使用的系统提示词
+        """
+        if self._full_prompt_tokens is None:
+            full_content = self._Compile_System_Prompt(self._Build_Tool_Descriptions())
+            self._full_prompt_tokens = len(self.session.Tokenize(full_content))
+        prompt_tokens = len(self.session.Tokenize(system_content))
+        
+        self.last_tool_selection = {
+            "selected": selected,
+            "total_tools": len(self.tools),
+            "prompt_tokens": prompt_tokens,
+            "full_prompt_tokens": self._full_prompt_tokens,
+            "saved_tokens": self._full_prompt_tokens - prompt_tokens
+        }
+        Log_Info(self.MODULE_NAME, f"Tool selection: {selected}, system prompt {prompt_tokens} tokens (full {self._full_prompt_tokens}, saved {self._full_prompt_tokens - prompt_tokens})")
+    
+    def _Get_State_Key(self, system_content: str) -> str:
+        """
+        计算会话状态快照的校验键，模型文件、context_length、实际生效的推理设置
+        （n_batch、kv_cache_type决定的type_k/type_v/flash_attn）或系统提示词变化时失效
+        
+        Args:
+            system_content: 系统提示词
+        
+        Returns:
+            校验键
+        """
+        hasher = hashlib.sha1()
+        hasher.update(self.model_path.encode("utf-8"))
+        try:
+            stat = os.stat(self.model_path)
+            hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        except OSError:
+            pass
+        hasher.update(str(self.context_length).encode("utf-8"))
+        settings = self.model_settings or {}
+        hasher.update(f"{settings.get('n_batch')}:{settings.get('kv_cache_type')}".encode("utf-8"))
+        hasher.update(system_content.encode("utf-8"))
+        return hasher.hexdigest()
+    
+    def _Get_State_Path(self) -> str:
+        """获取会话状态快照文件路径（按模型区分，多个模型的快照互不覆盖）"""
+        model_hash = hashlib.sha1(self.model_path.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.cache_dir, f"session_state_{model_hash}.bin")
+    
+    def Restore_Session_State(self):
+        """
+        恢复会话状态快照（需在工具注册完成后调用）
+        快照不存在或已失效时，预先评估系统提示词前缀并保存新快照
+        """
+        if not self.state_cache:
+            return
+        
+        system_content = self._Get_System_Content()
+        key = self._Get_State_Key(system_content)
+        path = self._Get_State_Path()
+        
+        start_time = time.time()
+        if self.session.Load_State(path, key):
+            Log_Info(self.MODULE_NAME, f"Session state restored in {(time.time() - start_time) * 1000:.1f} ms")
+            return
+        
+        self.session.Prefill([{"role": "system", "content": system_content}])
+        Log_Info(self.MODULE_NAME, f"System prompt prefilled in {(time.time() - start_time) * 1000:.1f} ms")
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.session.Save_State(path, key)
+        except Exception as e:
+            Log_Info(self.MODULE_NAME, f"Failed to save session state: {e}")
+    
+    def Save_Session_State(self):
+        """
+        保存当前会话状态快照（包含最近一次对话）
+        """
+        if not self.state_cache or self.model is None:
+            return
+        
+        key = self._Get_State_Key(self._Get_System_Content())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.session.Save_State(self._Get_State_Path(), key)
+        except Exception as e:
+            Log_Info(self.MODULE_NAME, f"Failed to save session state: {e}")
     
     def _Build_Tool_Descriptions(self) -> str:
         """
@@ -227,6 +985,22 @@ class Agent:
         Returns:
             完整系统提示词
         """
+        if self.parallel_tool_calls:
+            rule_one_tool = "每次响应只调用一个工具；多个相互独立的步骤可以用JSON数组一次同时调用"
+            final_reminder = "每次只输出一个JSON（或一个相互独立调用的JSON数组）！"
+            parallel_section = """## 并行调用示例
+用户："查看磁盘、GPU和git状态"
+（三个步骤互不依赖，且都不改变工作目录，一次输出JSON数组）
+[{"tool": "Execute_Command", "args": {"command": "df -h"}}, {"tool": "Execute_Command", "args": {"command": "nvidia-smi"}}, {"tool": "Execute_Command", "args": {"command": "git status"}}]
+
+注意：依赖上一步结果或会改变工作目录（如cd）的步骤不能放在同一个数组中。
+
+"""
+        else:
+            rule_one_tool = "每次响应只调用一个工具"
+            final_reminder = "每次只输出一个JSON！"
+            parallel_section = ""
+        
         prompt = f"""{self.system_prompt}
 
 你可以使用以下工具：
@@ -239,7 +1013,7 @@ class Agent:
 完成所有任务后，直接用中文回复用户（不要JSON）。
 
 ## 核心规则
-1. 每次响应只调用一个工具
+1. {rule_one_tool}
 2. 如果需要调用多个工具，在收到上一次工具结果后，再进行下一步工作
 3. 如果还有步骤未完成，立即输出下一个工具调用的JSON
 4. 只有当所有步骤都完成后，才输出最终的文字总结
@@ -271,10 +1045,30 @@ class Agent:
 用户："2+2等于多少？"
 2+2等于4。
 
-重要：每次只输出一个JSON！收到结果后如果还有步骤，立即输出下一个JSON！
+{parallel_section}重要：{final_reminder}收到结果后如果还有步骤，立即输出下一个JSON！
 """
         return prompt
     
+    def _Parse_Tool_Calls(self, response: str) -> list:
+        """
+        解析LLM输出中的工具调用，并行调用模式下支持工具调用数组
+        
+        Args:
+            response: LLM响应文本
+        
+        Returns:
+            [(tool_name, args), ...] 列表，无工具调用时为空列表
+        """
+        if self.parallel_tool_calls:
+            cleaned = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+            detector = Tool_Call_Detector(self.tools.keys(), allow_list=True)
+            if detector.Feed(cleaned):
+                Log_Info(self.MODULE_NAME, f"Found {len(detector.tool_calls)} tool calls")
+                return detector.tool_calls
+        
+        tool_call = self._Parse_Tool_Call(response)
+        return [tool_call] if tool_call is not None else []
+    
     def _Parse_Tool_Call(self, response: str) -> tuple:
         """
         解析LLM输出中的tool调用
@@ -379,12 +1173,90 @@ class Agent:
             Log_Info(self.MODULE_NAME, f"Tool execution error: {e}")
             return f"Error executing tool: {e}"
     
+    def _Execute_Tools_Parallel(self, tool_calls: list) -> str:
+        """
+        并发执行多个相互独立的工具调用，按调用顺序合并结果
+        
+        Args:
+            tool_calls: [(tool_name, args), ...] 列表
+        
+        Returns:
+            合并后的工具结果字符串
+        """
+        if self.stream:
+            for tool_name, tool_args in tool_calls:
+                print(f"\n[Tool Call] {tool_name} with args: {tool_args}")
+        
+        start_time = time.time()
+        workers = max(1, min(self.parallel_max_workers, len(tool_calls)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda call: self._Execute_Tool(call[0], call[1]), tool_calls))
+        Log_Info(self.MODULE_NAME, f"Executed {len(tool_calls)} tool calls in parallel in {time.time() - start_time:.2f}s")
+        
+        parts = []
+        for index, ((tool_name, tool_args), result) in enumerate(zip(tool_calls, results), 1):
+            parts.append(f"[{index}] {tool_name} {json.dumps(tool_args, ensure_ascii=False)}\n{result}")
+        return "\n\n".join(parts)
+    
+    def Cancel(self):
+        """
+        取消当前任务：生成循环在下一个token处停止，不再开始新的迭代
+        （正在执行的命令由Exec.Interrupt_Shells中断）
+        """
+        self.cancel_event.set()
+        Log_Info(self.MODULE_NAME, "Cancel requested")
+    
+    def Is_Model_Loaded(self) -> bool:
+        """检查是否有已加载的模型"""
+        return self.model is not None
+    
+    def Unload_Models(self):
+        """
+        释放所有模型与KV cache（保留持久化Shell及其工作目录和环境变量）
+        卸载前保存会话状态快照，重新加载后可直接恢复
+        """
+        if self.model is None:
+            return
+        
+        self.Save_Session_State()
+        self.router.Unload_All()
+        
+        if self.draft_model is not None:
+            draft_llama = getattr(self.draft_model, "model", None)
+            close = getattr(draft_llama, "close", None)
+            if close is not None:
+                close()
+            self.draft_model = None
+        
+        self._grammar = None
+        gc.collect()
+        Log_Info(self.MODULE_NAME, "Models unloaded, shell kept alive")
+    
+    def Reload_Models(self):
+        """
+        重新加载默认模型并恢复会话状态快照
+        """
+        self._Activate_Model(self.default_model)
+        self.Restore_Session_State()
+        Log_Info(self.MODULE_NAME, "Models reloaded")
+    
     def Shutdown(self):
         """
         关闭Agent，释放资源（包括持久化Shell）
         """
         Log_Info(self.MODULE_NAME, "Shutting down Agent")
         
+        # 保存包含最近一次对话的会话状态
+        if self.state_cache_conversation:
+            self.Save_Session_State()
+        
+        # 保存计划缓存中尚未写入的查找统计
+        if self.plan_cache is not None:
+            self.plan_cache.Flush()
+        
+        # 释放所有已加载的模型
+        self.router.Unload_All()
+        
         # 关闭持久化Shell
         if self.shell is not None:
             self.shell.Stop()
@@ -9,12 +9,16 @@ Agent_Process - Agent进程管理类
 import time
 import sys
 import os
+import threading
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from Log.Log import Log_Info
 from Agent.Agent import Agent
-from API.Exec import Execute_Command, API_DESCRIPTION, Set_Shell, Get_Output_Files, Clear_Output_Files
+from Agent.Warmup import Get_Model_Paths, Prefetch_File, Import_Llama_Cpp
+from API.Exec import Execute_Command, API_DESCRIPTION, API_SUMMARY, API_KEYWORDS, Set_Shell, Get_Output_Files, Clear_Output_Files, Stop_Worker_Shells, Interrupt_Shells, Clear_Interrupts, Get_Last_Working_Dir, Sync_Working_Dir
+from API.Job import JOB_TOOLS, Set_Job_Config
+from API.Capture import Export_Scan_Cache
 
 
 class Agent_Process:
@@ -39,6 +43,27 @@ class Agent_Process:
         self.running = False
         self.agent = None
         
+        # 待机预热级别："none"不待机，"warm"预先导入llama_cpp并预读模型文件，"full"预先完整加载Agent
+        self.standby = config.get("Scheduler", {}).get("agent_standby", "none")
+        
+        # 分级空闲策略：空闲idle_unload_after秒后释放模型（保留进程与Shell），
+        # 空闲idle_exit_after秒后进程退出；0表示不启用
+        agent_config = config.get("Agent", {})
+        self.idle_unload_after = agent_config.get("idle_unload_after", 0)
+        self.idle_exit_after = agent_config.get("idle_exit_after", 0)
+        self.last_activity_time = time.time()
+        
+        # 冷启动时在后台将模型文件读入页缓存，与Shell启动、模型加载并行
+        # （使用共享推理服务时本进程不加载模型，无需预读）
+        self.prefetch_model = agent_config.get("prefetch_model", True) and not config.get("Model_Server", {}).get("enabled", False)
+        self._prefetch_stop = threading.Event()
+        
+        # 启动各阶段耗时（秒），随ready消息发送给Scheduler
+        self.startup_profile = {}
+        
+        # 处理消息期间由监听线程接收的其他消息，处理完成后再依次处理
+        self._pending_messages = []
+        
         # 获取临时工作目录（存储临时文件）
         tmp_config = config.get("Tmp_WorkingSpace", {})
         tmp_workspace = tmp_config.get("workspace", ".columba_tmp_workspace")
@@ -58,6 +83,7 @@ class Agent_Process:
         加载Agent实例并注册工具
         """
         Log_Info(self.MODULE_NAME, "Loading Agent")
+        load_start = time.time()
         
         self.agent = Agent(
             self.config,
@@ -69,23 +95,144 @@ class Agent_Process:
         Set_Shell(self.agent.shell)
         
         # 注册Execute_Command工具
+        phase_start = time.time()
         self.agent.Register_Tool(
             name="Execute_Command",
             func=Execute_Command,
-            description=API_DESCRIPTION
+            description=API_DESCRIPTION,
+            summary=API_SUMMARY,
+            keywords=API_KEYWORDS,
+            always=True
         )
+        
+        # 注册后台任务工具（Start_Job/Job_Status/Tail_Job/Cancel_Job），默认关闭，避免增大系统提示词
+        job_config = self.config.get("Jobs", {})
+        if job_config.get("enabled", False):
+            Set_Job_Config(job_config)
+            for tool in JOB_TOOLS:
+                self.agent.Register_Tool(**tool)
         Log_Info(self.MODULE_NAME, "Agent loaded and tools registered")
+        register_seconds = time.time() - phase_start
+        
+        # 恢复会话状态快照（系统提示词依赖已注册的工具）
+        phase_start = time.time()
+        self.agent.Restore_Session_State()
+        
+        self.startup_profile.update(self.agent.startup_profile)
+        self.startup_profile["register_tools_seconds"] = register_seconds
+        self.startup_profile["restore_state_seconds"] = time.time() - phase_start
+        self.startup_profile["load_agent_seconds"] = time.time() - load_start
+    
+    def _Start_Prefetch(self):
+        """
+        在后台线程中将模型文件读入页缓存
+        """
+        def Prefetch():
+            start_time = time.time()
+            for model_path in Get_Model_Paths(self.config):
+                Prefetch_File(model_path, self._prefetch_stop)
+            self.startup_profile["prefetch_seconds"] = time.time() - start_time
+        
+        threading.Thread(target=Prefetch, daemon=True).start()
+    
+    def _Warm_Up(self):
+        """
+        按待机级别预热
+        """
+        start_time = time.time()
+        
+        if self.standby == "full":
+            self._Load_Agent()
+        elif self.standby == "warm":
+            Import_Llama_Cpp()
+            for model_path in Get_Model_Paths(self.config):
+                Prefetch_File(model_path)
+        
+        Log_Info(self.MODULE_NAME, f"Standby warm-up ({self.standby}) finished in {time.time() - start_time:.2f}s")
+    
+    def _Wait_Activate(self) -> bool:
+        """
+        待机等待Scheduler的activate消息
+        
+        Returns:
+            True表示被激活，False表示收到shutdown
+        """
+        self.from_agent_queue.put({
+            "type": "standby",
+            "level": self.standby,
+            "timestamp": time.time()
+        })
+        Log_Info(self.MODULE_NAME, "Sent standby message, waiting for activation")
+        
+        while self.running:
+            try:
+                message = self.to_agent_queue.get(timeout=1.0)
+            except Exception:
+                continue
+            
+            msg_type = message.get("type")
+            if msg_type == "activate":
+                Log_Info(self.MODULE_NAME, "Activated")
+                return True
+            if msg_type == "shutdown":
+                Log_Info(self.MODULE_NAME, "Received shutdown command in standby")
+                self.running = False
+                return False
+        
+        return False
+    
+    def _Get_RSS_MB(self) -> float:
+        """
+        获取当前进程的常驻内存（MB），无法获取时返回0
+        """
+        try:
+            with open("/proc/self/status", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+    
+    def _Check_Idle(self):
+        """
+        检查空闲时间，按分级策略释放模型或退出进程
+        """
+        idle = time.time() - self.last_activity_time
+        
+        if self.idle_exit_after > 0 and idle >= self.idle_exit_after:
+            Log_Info(self.MODULE_NAME, f"Idle for {idle:.0f}s, exiting (tier 2), RSS={self._Get_RSS_MB():.1f}MB")
+            self.running = False
+            return
+        
+        if self.idle_unload_after > 0 and idle >= self.idle_unload_after and self.agent.Is_Model_Loaded():
+            rss_before = self._Get_RSS_MB()
+            self.agent.Unload_Models()
+            Log_Info(self.MODULE_NAME, f"Idle for {idle:.0f}s, model unloaded (tier 1), RSS {rss_before:.1f}MB -> {self._Get_RSS_MB():.1f}MB")
+    
+    def _Ensure_Model_Loaded(self):
+        """
+        处理消息前确保模型已加载（空闲释放后按需重新加载）
+        """
+        if self.agent.Is_Model_Loaded():
+            return
+        
+        start_time = time.time()
+        self.agent.Reload_Models()
+        Log_Info(self.MODULE_NAME, f"Model reloaded in {time.time() - start_time:.2f}s, RSS={self._Get_RSS_MB():.1f}MB")
     
     def _Send_Ready(self):
         """
         发送ready消息给Scheduler
         """
+        startup_profile = {key: round(value, 3) for key, value in self.startup_profile.items()}
         message = {
             "type": "ready",
+            "startup_profile": startup_profile,
             "timestamp": time.time()
         }
         self.from_agent_queue.put(message)
-        Log_Info(self.MODULE_NAME, "Sent ready message")
+        Log_Info(self.MODULE_NAME, f"Sent ready message, startup profile: {startup_profile}")
     
     def _Process_Message(self, message: dict):
         """
@@ -100,18 +247,27 @@ class Agent_Process:
             content = message.get("content", "")
             Log_Info(self.MODULE_NAME, f"Processing user message: {content[:50]}...")
             
-            # 调用Agent处理
-            result = self.agent.Run(content)
+            # 空闲释放模型后需重新加载
+            self._Ensure_Model_Loaded()
+            
+            # 先切换到Scheduler记录的最近工作目录（Agent空闲时可能在Scheduler的Shell中执行过cd）
+            Sync_Working_Dir(message.get("working_dir"))
+            
+            # 调用Agent处理，期间由监听线程响应cancel消息
+            result = self._Run_Watched(self.agent.Run, content)
             
             # 获取命令输出文件列表
             output_files = Get_Output_Files()
             Log_Info(self.MODULE_NAME, f"Output files: {len(output_files)} files")
             
-            # 发送响应（包含输出文件列表）
+            # 发送响应（包含输出文件列表、已有的扫描结果与本次请求的计时记录）
             response = {
                 "type": "response",
                 "content": result,
                 "output_files": output_files,
+                "output_scans": Export_Scan_Cache(output_files),
+                "working_dir": Get_Last_Working_Dir(),
+                "telemetry": self.agent.last_run_telemetry,
                 "timestamp": time.time()
             }
             self.from_agent_queue.put(response)
@@ -121,10 +277,86 @@ class Agent_Process:
             
             Log_Info(self.MODULE_NAME, "Sent response with output files")
         
+        elif msg_type == "direct_command":
+            # 直接命令：不经过LLM，在Agent的持久化Shell中执行
+            command = message.get("command", "")
+            Log_Info(self.MODULE_NAME, f"Executing direct command: {command}")
+            Sync_Working_Dir(message.get("working_dir"))
+            result = self._Run_Watched(Execute_Command, command)
+            output_files = Get_Output_Files()
+            
+            self.from_agent_queue.put({
+                "type": "response",
+                "content": result,
+                "output_files": output_files,
+                "output_scans": Export_Scan_Cache(output_files),
+                "working_dir": Get_Last_Working_Dir(),
+                "timestamp": time.time()
+            })
+            Clear_Output_Files()
+        
+        elif msg_type == "cancel":
+            Log_Info(self.MODULE_NAME, "Received cancel with no running task, ignored")
+        
         elif msg_type == "shutdown":
             Log_Info(self.MODULE_NAME, "Received shutdown command")
             self.running = False
     
+    def _Run_Watched(self, func, *args):
+        """
+        执行任务，期间由监听线程响应cancel/shutdown消息
+        
+        Args:
+            func: 要执行的函数（Agent.Run或Execute_Command）
+            *args: 函数参数
+        
+        Returns:
+            函数返回值
+        """
+        self.agent.cancel_event.clear()
+        Clear_Interrupts()
+        watch_stop = threading.Event()
+        watcher = threading.Thread(target=self._Watch_Cancel, args=(watch_stop,), daemon=True)
+        watcher.start()
+        try:
+            return func(*args)
+        finally:
+            watch_stop.set()
+            watcher.join()
+    
+    def _Cancel(self, reason: str):
+        """
+        取消Agent当前任务：停止生成并中断正在执行的命令
+        
+        Args:
+            reason: 取消原因
+        """
+        Log_Info(self.MODULE_NAME, f"Cancelling current task: {reason}")
+        self.agent.Cancel()
+        Interrupt_Shells()
+    
+    def _Watch_Cancel(self, stop_event):
+        """
+        处理消息期间监听消息队列：cancel/shutdown立即取消当前任务，其他消息暂存
+        
+        Args:
+            stop_event: 当前消息处理完成时置位
+        """
+        while not stop_event.is_set():
+            try:
+                message = self.to_agent_queue.get(timeout=0.1)
+            except Exception:
+                continue
+            
+            msg_type = message.get("type")
+            if msg_type == "cancel":
+                self._Cancel(message.get("reason", ""))
+            elif msg_type == "shutdown":
+                self._Cancel("shutdown")
+                self.running = False
+            else:
+                self._pending_messages.append(message)
+    
     def Run(self):
         """
         主循环，接收并处理消息
@@ -132,19 +364,38 @@ class Agent_Process:
         Log_Info(self.MODULE_NAME, "Starting main loop")
         self.running = True
         
-        # 加载Agent
-        self._Load_Agent()
+        # 待机：预热后等待激活
+        if self.standby != "none":
+            self._Warm_Up()
+            if not self._Wait_Activate():
+                Log_Info(self.MODULE_NAME, "Main loop ended")
+                return
+        
+        # 加载Agent（完整待机时已加载）；冷启动时同时在后台预读模型文件
+        ready_start = time.time()
+        if self.agent is None:
+            if self.standby == "none" and self.prefetch_model:
+                self._Start_Prefetch()
+            self._Load_Agent()
+        self.startup_profile["total_seconds"] = time.time() - ready_start
         
         # 发送ready消息
         self._Send_Ready()
         
+        self.last_activity_time = time.time()
+        
         while self.running:
             try:
-                # 阻塞等待消息，超时1秒检查running状态
-                message = self.to_agent_queue.get(timeout=1.0)
+                # 阻塞等待消息，超时1秒检查running状态（优先处理暂存的消息）
+                if self._pending_messages:
+                    message = self._pending_messages.pop(0)
+                else:
+                    message = self.to_agent_queue.get(timeout=1.0)
                 self._Process_Message(message)
+                self.last_activity_time = time.time()
             except Exception:
                 # 队列超时或其他异常，继续循环
+                self._Check_Idle()
                 continue
         
         Log_Info(self.MODULE_NAME, "Main loop ended")
@@ -155,6 +406,10 @@ class Agent_Process:
         """
         Log_Info(self.MODULE_NAME, "Shutting down")
         self.running = False
+        self._prefetch_stop.set()
+        
+        # 关闭并行执行使用的额外Shell
+        Stop_Worker_Shells()
         
         # 关闭Agent（包括持久化Shell）
         if self.agent is not None:
@@ -0,0 +1,215 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Context - 基于token预算的上下文管理器
+按模型分词器精确计算消息token数，超出n_ctx时压缩旧的工具结果，
+保证prompt加上max_tokens的生成空间不超过上下文长度
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+class Context_Overflow_Error(Exception):
+    """压缩并截断后prompt仍无法放入上下文窗口（通常是系统提示词本身过长）"""
+
+
+class Context_Manager:
+    """
+    上下文管理器 - 始终保留系统提示词、用户原始任务和最近若干条消息，
+    依次通过 缩减旧工具结果 → 省略旧工具结果 → 丢弃最旧的中间轮次 → 缩减最近工具结果
+    → 降低max_tokens → 截断最新消息 的顺序使prompt满足预算，仍无法满足时抛出Context_Overflow_Error
+    压缩直接作用于消息列表，之后的迭代保持压缩后的内容，避免反复破坏KV cache前缀
+    """
+    
+    MODULE_NAME = "Context_Manager"
+    
+    TOOL_RESULT_PREFIX = "Tool result:"
+    ELIDED_TOOL_RESULT = "Tool result: [earlier tool output elided to fit the context window]"
+    
+    # 预留的安全余量（token）
+    SAFETY_TOKENS = 16
+    
+    # 降低max_tokens时保留的最小生成空间
+    MIN_GENERATION_TOKENS = 64
+    
+    def __init__(self, session, n_ctx: int, keep_recent: int = 2, shrink_tokens: int = 256):
+        """
+        初始化上下文管理器
+        
+        Args:
+            session: LLM_Session实例（提供分词与chatml渲染）
+            n_ctx: 模型上下文长度
+            keep_recent: 始终完整保留的最近消息条数
+            shrink_tokens: 旧工具结果缩减后的目标token数
+        """
+        self.session = session
+        self.n_ctx = n_ctx
+        self.keep_recent = keep_recent
+        self.shrink_tokens = shrink_tokens
+        self._token_cache = {}
+    
+    def Count_Message(self, message: dict) -> int:
+        """
+        计算单条消息渲染后的token数（带缓存）
+        
+        Args:
+            message: 消息字典
+        
+        Returns:
+            token数
+        """
+        key = (message["role"], message["content"])
+        count = self._token_cache.get(key)
+        if count is None:
+            # 复用会话层的单条消息token缓存，组装prompt时无需再次分词
+            count = len(self.session.Tokenize_Message(message))
+            if len(self._token_cache) > 256:
+                self._token_cache.clear()
+            self._token_cache[key] = count
+        return count
+    
+    def Count_Messages(self, messages: list) -> int:
+        """
+        计算消息列表渲染后的总token数（包含assistant起始标记）
+        
+        Args:
+            messages: 消息列表
+        
+        Returns:
+            token数
+        """
+        total = sum(self.Count_Message(message) for message in messages)
+        total += len(self.session.Tokenize(f"{self.session.IM_START}assistant\n"))
+        return total
+    
+    def _Shrink_Text(self, text: str, tokens: int, target_tokens: int) -> str:
+        """
+        按token比例保留文本的头部和尾部，中间部分省略
+        
+        Args:
+            text: 原文本
+            tokens: 原文本token数
+            target_tokens: 目标token数
+        
+        Returns:
+            缩减后的文本
+        """
+        keep_chars = max(0, int(len(text) * target_tokens / max(tokens, 1)))
+        if keep_chars >= len(text):
+            return text
+        head_chars = keep_chars * 2 // 3
+        tail_chars = keep_chars - head_chars
+        tail = text[len(text) - tail_chars:] if tail_chars > 0 else ""
+        return f"{text[:head_chars]}\n... [elided {len(text) - keep_chars} chars] ...\n{tail}"
+    
+    def _Is_Tool_Result(self, message: dict) -> bool:
+        """判断消息是否为工具结果"""
+        return message["role"] == "user" and message["content"].startswith(self.TOOL_RESULT_PREFIX)
+    
+    def Fit(self, messages: list, max_tokens: int) -> tuple:
+        """
+        使消息列表满足token预算
+        
+        Args:
+            messages: 消息列表（第0条为system，第1条为用户任务）
+            max_tokens: 期望的最大生成token数
+        
+        Returns:
+            (messages, max_tokens) 元组，max_tokens可能被下调，但prompt加max_tokens不会超过n_ctx
+        
+        Raises:
+            Context_Overflow_Error: 截断所有非系统消息后仍留不出MIN_GENERATION_TOKENS的生成空间
+        """
+        budget = self.n_ctx - max_tokens - self.SAFETY_TOKENS
+        total = self.Count_Messages(messages)
+        if total <= budget:
+            return (messages, max_tokens)
+        
+        Log_Info(self.MODULE_NAME, f"Prompt {total} tokens exceeds budget {budget}, compacting")
+        messages = list(messages)
+        
+        def Old_Indices():
+            protected_from = max(2, len(messages) - self.keep_recent)
+            return list(range(2, protected_from))
+        
+        # 1. 缩减旧的工具结果
+        for index in Old_Indices():
+            message = messages[index]
+            count = self.Count_Message(message)
+            if self._Is_Tool_Result(message) and count > self.shrink_tokens:
+                content = self._Shrink_Text(message["content"], count, self.shrink_tokens)
+                messages[index] = {"role": message["role"], "content": content}
+                total = self.Count_Messages(messages)
+                if total <= budget:
+                    return self._Done(messages, max_tokens, total)
+        
+        # 2. 完全省略旧的工具结果
+        for index in Old_Indices():
+            message = messages[index]
+            if self._Is_Tool_Result(message) and message["content"] != self.ELIDED_TOOL_RESULT:
+                messages[index] = {"role": message["role"], "content": self.ELIDED_TOOL_RESULT}
+                total = self.Count_Messages(messages)
+                if total <= budget:
+                    return self._Done(messages, max_tokens, total)
+        
+        # 3. 丢弃最旧的中间轮次（assistant响应与其工具结果成对丢弃）
+        while Old_Indices():
+            del messages[2:2 + min(2, len(Old_Indices()))]
+            total = self.Count_Messages(messages)
+            if total <= budget:
+                return self._Done(messages, max_tokens, total)
+        
+        # 4. 缩减最近的工具结果
+        for index in range(len(messages) - 1, 1, -1):
+            message = messages[index]
+            if not self._Is_Tool_Result(message):
+                continue
+            count = self.Count_Message(message)
+            target = max(self.MIN_GENERATION_TOKENS, count - (total - budget))
+            if target < count:
+                content = self._Shrink_Text(message["content"], count, target)
+                messages[index] = {"role": message["role"], "content": content}
+                total = self.Count_Messages(messages)
+                if total <= budget:
+                    return self._Done(messages, max_tokens, total)
+        
+        # 5. 降低生成空间（至少保留MIN_GENERATION_TOKENS）
+        min_budget = self.n_ctx - self.SAFETY_TOKENS - self.MIN_GENERATION_TOKENS
+        if total <= min_budget:
+            max_tokens = min(max_tokens, self.n_ctx - self.SAFETY_TOKENS - total)
+            Log_Info(self.MODULE_NAME, f"Prompt still {total} tokens after compaction, max_tokens reduced to {max_tokens}")
+            return (messages, max_tokens)
+        
+        # 6. 最后手段：从最新的消息开始截断（包括用户任务），系统提示词不截断
+        for index in range(len(messages) - 1, 0, -1):
+            for _ in range(3):
+                message = messages[index]
+                count = self.Count_Message(message)
+                target = count - (total - min_budget) - self.SAFETY_TOKENS
+                if target >= count or count <= self.SAFETY_TOKENS:
+                    break
+                content = self._Shrink_Text(message["content"], count, max(0, target))
+                messages[index] = {"role": message["role"], "content": content}
+                total = self.Count_Messages(messages)
+                if total <= min_budget:
+                    break
+            if total <= min_budget:
+                max_tokens = min(max_tokens, self.n_ctx - self.SAFETY_TOKENS - total)
+                Log_Info(self.MODULE_NAME, f"Truncated messages to {total} tokens, max_tokens reduced to {max_tokens}")
+                return (messages, max_tokens)
+        
+        raise Context_Overflow_Error(
+            f"Prompt exceeds n_ctx: {total} tokens remain after compaction, "
+            f"but n_ctx={self.n_ctx} leaves at most {min_budget} for the prompt"
+        )
+    
+    def _Done(self, messages: list, max_tokens: int, total: int) -> tuple:
+        """记录压缩结果并返回"""
+        Log_Info(self.MODULE_NAME, f"Compacted prompt to {total} tokens, {len(messages)} messages")
+        return (messages, max_tokens)
@@ -0,0 +1,115 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Grammar - 根据已注册工具生成GBNF语法，用于约束解码
+模型输出只能是合法的工具调用JSON，或以非'{'开头的最终文本，两者之前可以有一段<think>...</think>
+"""
+
+import inspect
+
+
+# JSON基础规则
+_BASE_RULES = r'''ws ::= [ \t\n]*
+string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\""
+number ::= "-"? [0-9]+ ( "." [0-9]+ )?
+integer ::= "-"? [0-9]+
+boolean ::= "true" | "false"
+value ::= string | number | boolean | "null"
+answer ::= [^{[< \t\n] [^\x00]*
+think ::= "<think>" think-body "</think>" ws
+think-body ::= ( [^<] | "<" [^/] | "</" [^t] | "</t" [^h] | "</th" [^i] | "</thi" [^n] | "</thin" [^k] | "</think" [^>] )*'''
+
+# Python类型注解到GBNF规则的映射
+_TYPE_RULES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+}
+
+
+def _Rule_Name(tool_name: str) -> str:
+    """将工具名转换为合法的GBNF规则名（只允许字母、数字和'-'）"""
+    return "call-" + "".join(c if c.isalnum() else "-" for c in tool_name)
+
+
+def _Build_Args_Rule(func: callable) -> str:
+    """
+    根据工具函数签名生成args对象的规则
+    必选参数按签名顺序出现，之后可按签名顺序跟随任意可选参数；无法解析签名时允许任意键值对
+    
+    Args:
+        func: 工具函数
+    
+    Returns:
+        args规则右侧表达式
+    """
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return '"{" ws ( string ws ":" ws value ( ws "," ws string ws ":" ws value )* )? ws "}"'
+    
+    required = []
+    optional = []
+    for param in signature.parameters.values():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        value_rule = _TYPE_RULES.get(param.annotation, "value")
+        field = f'"\\"{param.name}\\"" ws ":" ws {value_rule}'
+        if param.default is param.empty:
+            required.append(field)
+        else:
+            optional.append(field)
+    
+    def Optional_Suffix(fields: list) -> str:
+        return "".join(f' ( ws "," ws {field} )?' for field in fields)
+    
+    if required:
+        body = ' ws "," ws '.join(required) + Optional_Suffix(optional)
+    elif optional:
+        # 没有必选参数时，第一个出现的可选参数前没有逗号
+        alternatives = [field + Optional_Suffix(optional[index + 1:]) for index, field in enumerate(optional)]
+        body = "( " + " | ".join(alternatives) + " )?"
+    else:
+        return '"{" ws "}"'
+    return '"{" ws ' + body + ' ws "}"'
+
+
+def Build_Tool_Grammar(tools: dict, allow_list: bool = False) -> str:
+    """
+    根据已注册工具生成GBNF语法
+    思考模型（如Qwen3）可先输出一段<think>...</think>（think-body逐字符排除"</think>"），
+    之后的最终文本仍不能以'<'开头
+    
+    Args:
+        tools: Agent.tools字典 {name: {"func": func, "description": str}}
+        allow_list: 是否允许输出工具调用数组（并行调用模式）
+    
+    Returns:
+        GBNF语法字符串
+    """
+    call_rules = []
+    for name, tool in tools.items():
+        args_rule = _Build_Args_Rule(tool["func"])
+        call_rules.append(
+            f'{_Rule_Name(name)} ::= "{{" ws "\\"tool\\"" ws ":" ws "\\"{name}\\"" ws "," ws '
+            f'"\\"args\\"" ws ":" ws {args_rule} ws "}}"'
+        )
+    
+    if call_rules:
+        alternatives = " | ".join(_Rule_Name(name) for name in tools)
+        if allow_list:
+            lines = [
+                "root ::= think? ( tool-call | tool-call-list | answer )",
+                'tool-call-list ::= "[" ws tool-call ( ws "," ws tool-call )* ws "]"'
+            ]
+        else:
+            lines = ["root ::= think? ( tool-call | answer )"]
+        lines.append(f"tool-call ::= {alternatives}")
+        lines.extend(call_rules)
+    else:
+        lines = ["root ::= think? answer"]
+    
+    lines.append(_BASE_RULES)
+    return "\n".join(lines)
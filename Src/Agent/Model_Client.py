@@ -0,0 +1,195 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Model_Client - 推理服务客户端
+接口与LLM_Session相同，Agent可以透明地改用共享的推理服务进程生成
+"""
+
+import os
+import sys
+import time
+import threading
+from multiprocessing.connection import Client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+from Agent.Session import LLM_Session
+
+
+class Remote_Session(LLM_Session):
+    """
+    远程会话类 - 通过Unix socket/命名管道把分词、prefill和流式生成转发给Model_Server，
+    KV cache由服务端按连接保存，会话状态快照由服务端负责，本地不读写快照文件
+    """
+    
+    MODULE_NAME = "Remote_Session"
+    
+    # 等待服务端加载模型期间输出日志的间隔（秒）
+    READY_LOG_INTERVAL = 30
+    
+    def __init__(self, address: str, family: str, authkey: bytes, timeout: float = 10.0):
+        """
+        连接推理服务：在超时时间内建立连接，然后等待服务端的ready消息（模型加载完成）
+        
+        Args:
+            address: 服务地址（socket路径或管道名）
+            family: 地址类型（AF_UNIX/AF_PIPE）
+            authkey: 认证密钥
+            timeout: 等待服务进程开始监听的超时时间（秒），不包括模型加载时间
+        """
+        super().__init__(None)
+        self._lock = threading.Lock()
+        
+        end_time = time.time() + timeout
+        while True:
+            try:
+                self.conn = Client(address, family=family, authkey=authkey)
+                break
+            except (OSError, EOFError):
+                if time.time() >= end_time:
+                    raise
+                time.sleep(0.2)
+        
+        # 服务端先监听再加载模型，加载完成后发送ready；服务进程退出时recv抛出EOFError
+        wait_start = time.time()
+        while not self.conn.poll(self.READY_LOG_INTERVAL):
+            Log_Info(self.MODULE_NAME, f"Waiting for model server to load the model ({time.time() - wait_start:.0f}s)")
+        ready = self.conn.recv()
+        if ready.get("type") != "ready":
+            self.conn.close()
+            raise RuntimeError(f"Model server error: {ready.get('error')}")
+        self.n_ctx = ready["n_ctx"]
+        Log_Info(self.MODULE_NAME, f"Connected to model server {address}, model={ready['model_path']}, "
+                                   f"ready after {time.time() - wait_start:.1f}s")
+    
+    def _Call(self, request: dict) -> dict:
+        """
+        发送请求并等待单个结果
+        
+        Args:
+            request: 请求字典
+        
+        Returns:
+            结果字典
+        """
+        with self._lock:
+            self.conn.send(request)
+            reply = self.conn.recv()
+        if reply.get("type") == "error":
+            raise RuntimeError(f"Model server error: {reply['error']}")
+        return reply
+    
+    def Tokenize(self, text: str, add_bos: bool = False) -> list:
+        """
+        分词（识别特殊token）
+        
+        Args:
+            text: 文本
+            add_bos: 是否添加BOS
+        
+        Returns:
+            token id列表
+        """
+        return self._Call({"op": "tokenize", "text": text, "add_bos": add_bos})["tokens"]
+    
+    def Generate(self, messages: list, max_tokens: int = 1024, stop: list = None, **kwargs) -> str:
+        """
+        非流式生成（内部使用流式请求拼接）
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最大生成token数
+            stop: 额外的停止字符串
+        
+        Returns:
+            生成文本
+        """
+        return "".join(self.Generate_Stream(messages, max_tokens=max_tokens, stop=stop, **kwargs))
+    
+    def Generate_Stream(self, messages: list, max_tokens: int = 1024, stop: list = None, **kwargs):
+        """
+        流式生成，逐块返回文本；提前关闭生成器时通知服务端停止解码
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最大生成token数
+            stop: 额外的停止字符串
+            grammar: 可选的GBNF语法文本（在服务端编译）
+        
+        Yields:
+            文本片段
+        """
+        grammar = kwargs.pop("grammar", None)
+        request = {
+            "op": "generate",
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stop": stop,
+            "grammar": grammar,
+            "kwargs": kwargs
+        }
+        
+        with self._lock:
+            self.conn.send(request)
+            finished = False
+            try:
+                while True:
+                    reply = self.conn.recv()
+                    if reply["type"] == "chunk":
+                        yield reply["text"]
+                    elif reply["type"] == "end":
+                        finished = True
+                        self._Record_Stats(reply["stats"])
+                        break
+                    else:
+                        finished = True
+                        raise RuntimeError(f"Model server error: {reply.get('error')}")
+            finally:
+                if not finished:
+                    # 提前停止：通知服务端并读完剩余输出，保持请求/响应同步
+                    self.conn.send({"op": "stop"})
+                    while True:
+                        reply = self.conn.recv()
+                        if reply["type"] == "end":
+                            self._Record_Stats(reply["stats"])
+                            break
+                        if reply["type"] == "error":
+                            break
+    
+    def _Record_Stats(self, stats: dict):
+        """记录服务端返回的生成统计"""
+        self.last_prompt_tokens = stats["prompt_tokens"]
+        self.last_reused_tokens = stats["reused_tokens"]
+        self.last_evaluated_tokens = stats["evaluated_tokens"]
+        self.last_generated_tokens = stats["generated_tokens"]
+        self.last_generation_seconds = stats["generation_seconds"]
+        self.last_first_token_seconds = stats["first_token_seconds"]
+    
+    def Prefill(self, messages: list) -> int:
+        """
+        在服务端预先评估消息列表对应的prompt前缀
+        
+        Args:
+            messages: 消息列表
+        
+        Returns:
+            本次实际评估的token数
+        """
+        return self._Call({"op": "prefill", "messages": messages})["evaluated"]
+    
+    def Save_State(self, path: str, key: str):
+        """KV cache由服务端持有，不保存本地快照"""
+        return
+    
+    def Load_State(self, path: str, key: str) -> bool:
+        """KV cache由服务端持有，不恢复本地快照"""
+        return False
+    
+    def close(self):
+        """断开与推理服务的连接"""
+        try:
+            self.conn.close()
+        except OSError:
+            pass
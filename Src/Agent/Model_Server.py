@@ -0,0 +1,373 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Model_Server - 本地推理服务进程
+由一个进程持有模型，通过Unix socket（Windows下为命名管道）为多个Agent进程提供分词与流式生成，
+多个Agent共享同一份模型权重（节省内存）；生成请求依次执行，不做多序列批处理，
+并发时的吞吐不高于各Agent独立加载模型
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Listener
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+from Agent.Session import LLM_Session
+from Agent.Tuning import Load_Profile, Build_Llama_Kwargs
+
+
+MODULE_NAME = "Model_Server"
+
+
+def Get_Server_Address(config: dict) -> tuple:
+    """
+    获取推理服务地址
+    
+    Args:
+        config: 配置字典
+    
+    Returns:
+        (address, family, authkey)
+    """
+    server_config = config.get("Model_Server", {})
+    authkey = server_config.get("authkey", "columba").encode("utf-8")
+    
+    if os.name == "nt":
+        return server_config.get("address", r"\\.\pipe\columba_model_server"), "AF_PIPE", authkey
+    
+    address = server_config.get("address", ".columba_cache/model_server.sock")
+    if not os.path.isabs(address):
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        address = os.path.join(base_dir, address)
+    return address, "AF_UNIX", authkey
+
+
+class Model_Server:
+    """
+    推理服务类 - 共享一份模型权重，同一时刻只执行一个请求（不做多序列批处理）
+    每个客户端连接占用一个槽位（slot），槽位保存该客户端的llama.cpp状态（KV cache）；
+    切换客户端时按需保存/恢复槽位状态（整份KV拷贝，耗时记录在stats中），不需要时跳过
+    先监听再加载模型：客户端连接后等待服务端发送ready（模型加载完成）或error（加载失败）
+    """
+    
+    MODULE_NAME = "Model_Server"
+    
+    def __init__(self, config: dict):
+        """
+        初始化推理服务
+        
+        Args:
+            config: 配置字典（模型参数取自Agent配置）
+        """
+        agent_config = config.get("Agent", {})
+        server_config = config.get("Model_Server", {})
+        
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.model_path = agent_config.get("model_path", "Model/Qwen3-0.6B-Q8_0.gguf")
+        if not os.path.isabs(self.model_path):
+            self.model_path = os.path.join(base_dir, self.model_path)
+        self.cache_dir = agent_config.get("cache_dir", ".columba_cache")
+        if not os.path.isabs(self.cache_dir):
+            self.cache_dir = os.path.join(base_dir, self.cache_dir)
+        
+        self.context_length = agent_config.get("context_length", 2048)
+        self.settings = {
+            "n_threads": agent_config.get("n_threads", 4),
+            "n_batch": agent_config.get("n_batch", 512),
+            "kv_cache_type": agent_config.get("kv_cache_type", "f16"),
+        }
+        self.use_mlock = agent_config.get("use_mlock", False)
+        self._tunable_keys = [key for key in self.settings if key not in agent_config]
+        self.auto_tune = agent_config.get("auto_tune", True)
+        
+        # 最多保留的槽位状态数（每个状态是一份KV cache拷贝），超出时丢弃最久未使用的
+        self.max_slots = server_config.get("max_slots", 4)
+        
+        self.address, self.family, self.authkey = Get_Server_Address(config)
+        
+        self.model = None
+        self.session = None
+        self.listener = None
+        self.running = False
+        
+        # 推理锁：同一时刻只有一个槽位使用模型
+        self._lock = threading.Lock()
+        self._slot_states = OrderedDict()
+        self._active_slot = None
+        # 当前槽位自上次保存/恢复后是否评估过新token（未评估时切换无需保存）
+        self._active_dirty = False
+        self._slot_counter = 0
+        self._grammars = {}
+        
+        # 模型加载完成（或失败）后置位，客户端连接线程据此发送ready/error
+        self._ready = threading.Event()
+        self._load_error = None
+        
+        # 统计（swap_ms/swap_bytes为切换槽位时保存与恢复KV状态的累计耗时与数据量，
+        # state_saves/state_loads为实际发生的KV拷贝次数）
+        self.stats = {"connections": 0, "requests": 0, "slot_switches": 0, "state_saves": 0, "state_loads": 0,
+                      "swap_ms": 0.0, "swap_bytes": 0}
+    
+    def Load_Model(self):
+        """
+        加载模型（应用调优档案，配置中显式设置的参数优先）
+        """
+        settings = dict(self.settings)
+        if self.auto_tune and self._tunable_keys:
+            profile = Load_Profile(self.cache_dir, self.model_path)
+            if profile is not None:
+                for key in self._tunable_keys:
+                    if key in profile:
+                        settings[key] = profile[key]
+        Log_Info(self.MODULE_NAME, f"Loading model {self.model_path}, settings: {settings}")
+        
+        start_time = time.time()
+        from llama_cpp import Llama
+        self.model = Llama(
+            model_path=self.model_path,
+            n_ctx=self.context_length,
+            verbose=False,
+            **Build_Llama_Kwargs(settings["n_threads"], settings["n_batch"], settings["kv_cache_type"], self.use_mlock)
+        )
+        self.session = LLM_Session(self.model)
+        Log_Info(self.MODULE_NAME, f"Model loaded in {time.time() - start_time:.2f}s")
+    
+    def _Common_Prefix(self, first, second) -> int:
+        """计算两个token序列的最长公共前缀长度"""
+        limit = min(len(first), len(second))
+        prefix = 0
+        while prefix < limit and first[prefix] == second[prefix]:
+            prefix += 1
+        return prefix
+    
+    def _Switch_Slot(self, slot: int):
+        """
+        切换到指定槽位（需持有推理锁），尽量避免整份KV拷贝：
+        当前槽位自上次保存/恢复后没有评估新token时不再保存；
+        模型中的KV已包含目标槽位的全部历史（如只评估过相同的系统提示词）时不恢复；
+        新槽位不重置模型，由LLM_Session按公共前缀复用上一个槽位的KV（如相同的系统提示词）
+        
+        Args:
+            slot: 槽位编号
+        """
+        if self._active_slot == slot:
+            return
+        
+        start_time = time.perf_counter()
+        swap_bytes = 0
+        if self._active_slot is not None and self._active_dirty and self.model.n_tokens > 0:
+            saved = self.model.save_state()
+            swap_bytes += getattr(saved, "llama_state_size", 0)
+            self._slot_states[self._active_slot] = saved
+            self._slot_states.move_to_end(self._active_slot)
+            while len(self._slot_states) > self.max_slots:
+                self._slot_states.popitem(last=False)
+            self.stats["state_saves"] += 1
+        save_ms = (time.perf_counter() - start_time) * 1000
+        
+        state = self._slot_states.get(slot)
+        if state is not None:
+            state_tokens = state.input_ids[:state.n_tokens]
+            if self._Common_Prefix(self.model.input_ids, state_tokens) < len(state_tokens):
+                self.model.load_state(state)
+                swap_bytes += getattr(state, "llama_state_size", 0)
+                self.stats["state_loads"] += 1
+        swap_ms = (time.perf_counter() - start_time) * 1000
+        
+        Log_Info(self.MODULE_NAME, f"Slot switch {self._active_slot} -> {slot}: save {save_ms:.1f}ms, "
+                                   f"load {swap_ms - save_ms:.1f}ms, {swap_bytes / 1048576:.1f}MB")
+        self._active_slot = slot
+        self._active_dirty = False
+        self.stats["slot_switches"] += 1
+        self.stats["swap_ms"] = round(self.stats["swap_ms"] + swap_ms, 1)
+        self.stats["swap_bytes"] += swap_bytes
+    
+    def _Get_Grammar(self, grammar_text: str):
+        """按语法文本缓存LlamaGrammar实例"""
+        if not grammar_text:
+            return None
+        if grammar_text not in self._grammars:
+            from llama_cpp import LlamaGrammar
+            self._grammars[grammar_text] = LlamaGrammar.from_string(grammar_text, verbose=False)
+        return self._grammars[grammar_text]
+    
+    def _Handle_Generate(self, conn, slot: int, request: dict):
+        """
+        处理流式生成请求，逐块发送文本；两块之间检查客户端是否要求停止
+        
+        Args:
+            conn: 客户端连接
+            slot: 槽位编号
+            request: 请求字典
+        """
+        kwargs = dict(request.get("kwargs") or {})
+        grammar = self._Get_Grammar(request.get("grammar"))
+        if grammar is not None:
+            kwargs["grammar"] = grammar
+        
+        with self._lock:
+            self._Switch_Slot(slot)
+            self.stats["requests"] += 1
+            generator = self.session.Generate_Stream(
+                request["messages"],
+                max_tokens=request.get("max_tokens", 1024),
+                stop=request.get("stop"),
+                **kwargs
+            )
+            try:
+                for text in generator:
+                    conn.send({"type": "chunk", "text": text})
+                    if conn.poll() and conn.recv().get("op") == "stop":
+                        break
+            finally:
+                generator.close()
+                self._active_dirty = True
+            conn.send({"type": "end", "stats": self.session.Get_Last_Stats()})
+    
+    def _Handle_Request(self, conn, slot: int, request: dict):
+        """
+        处理一个请求
+        
+        Args:
+            conn: 客户端连接
+            slot: 槽位编号
+            request: 请求字典
+        """
+        op = request.get("op")
+        
+        if op == "generate":
+            self._Handle_Generate(conn, slot, request)
+        elif op == "tokenize":
+            tokens = self.session.Tokenize(request["text"], add_bos=request.get("add_bos", False))
+            conn.send({"type": "result", "tokens": tokens})
+        elif op == "prefill":
+            with self._lock:
+                self._Switch_Slot(slot)
+                evaluated = self.session.Prefill(request["messages"])
+                if evaluated > 0:
+                    self._active_dirty = True
+            conn.send({"type": "result", "evaluated": evaluated})
+        elif op == "info":
+            conn.send({"type": "result", "n_ctx": self.context_length, "model_path": self.model_path, "stats": self.stats})
+        elif op == "stop":
+            # 生成结束后才到达的停止请求，忽略
+            pass
+        else:
+            conn.send({"type": "error", "error": f"Unknown op: {op}"})
+    
+    def _Serve_Client(self, conn, slot: int):
+        """
+        客户端连接处理线程
+        
+        Args:
+            conn: 客户端连接
+            slot: 槽位编号
+        """
+        Log_Info(self.MODULE_NAME, f"Client connected, slot={slot}")
+        try:
+            # 模型加载完成后才通知客户端就绪，加载时间不计入客户端的连接超时
+            self._ready.wait()
+            if self._load_error is not None:
+                conn.send({"type": "error", "error": f"Model load failed: {self._load_error}"})
+                return
+            conn.send({"type": "ready", "n_ctx": self.context_length, "model_path": self.model_path})
+            
+            while self.running:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    self._Handle_Request(conn, slot, request)
+                except (EOFError, OSError, BrokenPipeError):
+                    break
+                except Exception as e:
+                    Log_Info(self.MODULE_NAME, f"Request failed: {e}")
+                    conn.send({"type": "error", "error": str(e)})
+        finally:
+            conn.close()
+            with self._lock:
+                self._slot_states.pop(slot, None)
+                if self._active_slot == slot:
+                    self._active_slot = None
+            Log_Info(self.MODULE_NAME, f"Client disconnected, slot={slot}")
+    
+    def _Load_In_Background(self):
+        """后台线程加载模型，完成或失败后置位_ready；失败时停止监听，之后的客户端直接回退到本地加载"""
+        try:
+            if self.model is None:
+                self.Load_Model()
+        except Exception as e:
+            self._load_error = str(e)
+            Log_Info(self.MODULE_NAME, f"Model load failed: {e}")
+            self.running = False
+            if self.listener is not None:
+                self.listener.close()
+        finally:
+            self._ready.set()
+    
+    def Serve(self):
+        """
+        先开始监听，再在后台加载模型；每个客户端一个处理线程
+        """
+        if self.family == "AF_UNIX":
+            os.makedirs(os.path.dirname(self.address), exist_ok=True)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+        
+        self.listener = Listener(self.address, family=self.family, authkey=self.authkey)
+        self.running = True
+        Log_Info(self.MODULE_NAME, f"Serving on {self.address}")
+        threading.Thread(target=self._Load_In_Background, daemon=True).start()
+        
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.running:
+                    Log_Info(self.MODULE_NAME, f"Accept failed: {e}")
+                continue
+            self._slot_counter += 1
+            self.stats["connections"] += 1
+            threading.Thread(target=self._Serve_Client, args=(conn, self._slot_counter), daemon=True).start()
+    
+    def Shutdown(self):
+        """
+        停止服务并释放模型
+        """
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            os.remove(self.address)
+        if self.model is not None:
+            close = getattr(self.model, "close", None)
+            if close is not None:
+                close()
+            self.model = None
+        Log_Info(self.MODULE_NAME, f"Model server stopped, stats: {self.stats}")
+
+
+def Model_Server_Main(config: dict):
+    """
+    推理服务进程主入口函数
+    
+    Args:
+        config: 配置字典
+    """
+    Log_Info(MODULE_NAME, "Model server process starting")
+    server = Model_Server(config)
+    try:
+        server.Serve()
+    except Exception as e:
+        Log_Info(MODULE_NAME, f"Model server error: {e}")
+    finally:
+        server.Shutdown()
+    Log_Info(MODULE_NAME, "Model server process ended")
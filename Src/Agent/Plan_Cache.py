@@ -0,0 +1,208 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Plan_Cache - 执行计划缓存
+按归一化后的用户消息保存一次成功Run的工具调用序列，相同请求再次到来时直接重放，
+只在总结结果或某一步失败时调用模型
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+# 归一化时去掉的首尾标点与空白
+STRIP_CHARS = " \t\r\n.。!！?？,，;；:：~～"
+
+
+def Normalize_Message(message: str) -> str:
+    """
+    归一化用户消息：转小写、合并空白、去掉首尾标点
+    
+    Args:
+        message: 用户消息
+    
+    Returns:
+        归一化后的消息
+    """
+    return " ".join(message.lower().split()).strip(STRIP_CHARS)
+
+
+class Plan_Cache:
+    """
+    计划缓存类 - {key: {"message", "steps", "generation_seconds", "hits", "created", "last_used"}}
+    steps中每一步为 {"response": 模型原始输出, "calls": [[tool_name, args], ...]}，
+    按最近使用顺序保存到cache_dir下的JSON文件，超出容量时丢弃最久未使用的计划
+    """
+    
+    MODULE_NAME = "Plan_Cache"
+    
+    # 缓存文件名（位于cache_dir下）
+    CACHE_FILE = "plan_cache.json"
+    
+    # 命令执行结果中的退出码
+    EXIT_CODE_PATTERN = re.compile(r"^\[Exit Code: (-?\d+)\]", re.MULTILINE)
+    
+    def __init__(self, cache_dir: str, max_entries: int = 64):
+        """
+        初始化计划缓存并读取已保存的计划
+        
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保存的计划数
+        """
+        self.path = os.path.join(cache_dir, self.CACHE_FILE)
+        self.max_entries = max_entries
+        self.plans = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "failures": 0, "saved_seconds": 0.0}
+        # 未命中只更新内存中的查找次数，由Flush或下一次写入一并保存
+        self._dirty = False
+        self._Load()
+    
+    def _Load(self):
+        """读取缓存文件，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.plans = OrderedDict(data.get("plans", {}))
+            self.stats.update(data.get("stats", {}))
+            Log_Info(self.MODULE_NAME, f"Loaded {len(self.plans)} cached plans")
+        except (OSError, ValueError) as e:
+            Log_Info(self.MODULE_NAME, f"Failed to read plan cache: {e}")
+    
+    def _Save(self):
+        """写入缓存文件（先写临时文件再替换）"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"plans": self.plans, "stats": self.stats}, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            Log_Info(self.MODULE_NAME, f"Failed to save plan cache: {e}")
+    
+    def Normalize(self, message: str) -> str:
+        """
+        归一化用户消息：转小写、合并空白、去掉首尾标点
+        
+        Args:
+            message: 用户消息
+        
+        Returns:
+            缓存键
+        """
+        return Normalize_Message(message)
+    
+    def Lookup(self, message: str) -> dict:
+        """
+        查找消息对应的计划（计入查找次数，不写文件）
+        
+        Args:
+            message: 用户消息
+        
+        Returns:
+            计划字典，不存在时返回None
+        """
+        self.stats["lookups"] += 1
+        self._dirty = True
+        return self.plans.get(self.Normalize(message))
+    
+    def Record(self, message: str, steps: list, generation_seconds: float):
+        """
+        保存一次成功Run的工具调用序列
+        
+        Args:
+            message: 用户消息
+            steps: [{"response", "calls"}, ...] 列表
+            generation_seconds: 生成这些工具调用所用的推理时间（重放时视为节省的时间）
+        """
+        if not steps:
+            return
+        key = self.Normalize(message)
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.plans[key] = {
+            "message": message,
+            "steps": steps,
+            "generation_seconds": round(generation_seconds, 3),
+            "hits": 0,
+            "created": now,
+            "last_used": now
+        }
+        self.plans.move_to_end(key)
+        while len(self.plans) > self.max_entries:
+            self.plans.popitem(last=False)
+        self._Save()
+        Log_Info(self.MODULE_NAME, f"Recorded plan with {len(steps)} steps for: {key[:50]}")
+    
+    def Record_Hit(self, message: str):
+        """
+        记录一次成功重放
+        
+        Args:
+            message: 用户消息
+        """
+        key = self.Normalize(message)
+        plan = self.plans.get(key)
+        if plan is None:
+            return
+        plan["hits"] += 1
+        plan["last_used"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.plans.move_to_end(key)
+        self.stats["hits"] += 1
+        self.stats["saved_seconds"] = round(self.stats["saved_seconds"] + plan["generation_seconds"], 3)
+        self._Save()
+    
+    def Invalidate(self, message: str):
+        """
+        重放失败时删除计划，下次重新由模型推导
+        
+        Args:
+            message: 用户消息
+        """
+        if self.plans.pop(self.Normalize(message), None) is not None:
+            self.stats["failures"] += 1
+            self._Save()
+    
+    def Flush(self):
+        """保存尚未写入文件的统计（Agent关闭时调用）"""
+        if self._dirty:
+            self._Save()
+    
+    def Is_Failed_Result(self, result: str) -> bool:
+        """
+        判断工具结果是否表示失败（工具报错或命令退出码非0）
+        
+        Args:
+            result: 工具结果字符串
+        
+        Returns:
+            是否失败
+        """
+        if result.startswith("Error"):
+            return True
+        return any(int(code) != 0 for code in self.EXIT_CODE_PATTERN.findall(result))
+    
+    def Get_Report(self) -> dict:
+        """
+        获取命中率与节省的推理时间
+        
+        Returns:
+            统计字典
+        """
+        lookups = self.stats["lookups"]
+        return dict(
+            self.stats,
+            plans=len(self.plans),
+            hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        )
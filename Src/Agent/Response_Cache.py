@@ -0,0 +1,161 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Response_Cache - 答案缓存
+缓存没有调用任何工具的纯知识问答结果（与机器状态无关），相同或相近的问题直接返回，
+带TTL过期与LRU淘汰；相似度用当前模型分词后的token n-gram计算
+"""
+
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+from Agent.Plan_Cache import Normalize_Message
+
+
+class Response_Cache:
+    """
+    答案缓存类 - {key: {"message", "answer", "model", "ngrams", "guard", "created"}}
+    先按归一化消息精确匹配，未命中时在同一模型的条目中按token n-gram的Jaccard相似度查找，
+    近似匹配要求两条消息中的数字与否定词完全一致（"3的平方"不能命中"5的平方"）
+    """
+    
+    MODULE_NAME = "Response_Cache"
+    
+    # 近似匹配时必须完全一致的token：数字与否定词
+    GUARD_PATTERN = re.compile(
+        r"\d+(?:\.\d+)?|不|没|别|非|无|未|否|"
+        r"\bnot\b|\bno\b|\bnever\b|\bnone\b|\bwithout\b|n't\b",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, ttl: float = 3600, max_entries: int = 128, threshold: float = 0.9):
+        """
+        初始化答案缓存
+        
+        Args:
+            ttl: 条目有效期（秒）
+            max_entries: 最多保存的条目数
+            threshold: 近似匹配的最低相似度（1.0为只做精确匹配）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "similar_hits": 0, "stores": 0}
+    
+    def _Ngrams(self, tokens: list) -> set:
+        """
+        计算token的一元与二元组集合
+        
+        Args:
+            tokens: token id列表
+        
+        Returns:
+            n-gram集合
+        """
+        grams = {(token,) for token in tokens}
+        grams.update(zip(tokens, tokens[1:]))
+        return grams
+    
+    def _Guard_Tokens(self, key: str) -> tuple:
+        """
+        按出现顺序提取消息中的数字与否定词
+        
+        Args:
+            key: 归一化后的消息
+        
+        Returns:
+            token元组
+        """
+        return tuple(self.GUARD_PATTERN.findall(key))
+    
+    def _Expire(self):
+        """删除超过有效期的条目"""
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            del self.entries[key]
+    
+    def Lookup(self, message: str, model: str, tokenize: callable) -> tuple:
+        """
+        查找缓存的答案
+        
+        Args:
+            message: 用户消息
+            model: 当前模型名称（token n-gram只在同一模型的条目之间比较）
+            tokenize: 当前模型的分词函数
+        
+        Returns:
+            (answer, similarity)，未命中时answer为None
+        """
+        self.stats["lookups"] += 1
+        self._Expire()
+        key = Normalize_Message(message)
+        
+        entry = self.entries.get(key)
+        similarity = 1.0
+        if entry is None and self.threshold < 1.0 and self.entries:
+            ngrams = self._Ngrams(tokenize(key))
+            guard = self._Guard_Tokens(key)
+            best_key, similarity = None, 0.0
+            for other_key, other in self.entries.items():
+                if other["model"] != model or not ngrams or other["guard"] != guard:
+                    continue
+                score = len(ngrams & other["ngrams"]) / len(ngrams | other["ngrams"])
+                if score > similarity:
+                    best_key, similarity = other_key, score
+            if best_key is not None and similarity >= self.threshold:
+                key, entry = best_key, self.entries[best_key]
+                self.stats["similar_hits"] += 1
+        
+        if entry is None:
+            return None, similarity
+        
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        Log_Info(self.MODULE_NAME, f"Cache hit (similarity={similarity:.2f}) for: {key[:50]}")
+        return entry["answer"], similarity
+    
+    def Store(self, message: str, answer: str, model: str, tokenize: callable):
+        """
+        保存答案（调用方需保证本次Run没有调用工具）
+        
+        Args:
+            message: 用户消息
+            answer: 最终答案
+            model: 生成答案的模型名称
+            tokenize: 该模型的分词函数
+        """
+        key = Normalize_Message(message)
+        self.entries[key] = {
+            "message": message,
+            "answer": answer,
+            "model": model,
+            "ngrams": self._Ngrams(tokenize(key)),
+            "guard": self._Guard_Tokens(key),
+            "created": time.time()
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.stats["stores"] += 1
+    
+    def Get_Report(self) -> dict:
+        """
+        获取命中率统计
+        
+        Returns:
+            统计字典
+        """
+        lookups = self.stats["lookups"]
+        return dict(
+            self.stats,
+            entries=len(self.entries),
+            hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        )
@@ -0,0 +1,243 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Router - 多模型路由
+按从小到大的顺序持有多个模型，按需懒加载并受内存预算约束，
+将消息路由到最可能成功的最小模型，失败时升级到更大的模型
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+class Model_Router:
+    """
+    模型路由类 - 管理多个模型实例的加载/卸载、路由选择与统计
+    models配置按从小到大的顺序排列，每项格式：
+        {"name": "small", "model_path": "Model/Qwen3-0.6B-Q8_0.gguf", "multi_step": false}
+    multi_step表示该模型是否能可靠地完成多步骤任务
+    """
+    
+    MODULE_NAME = "Model_Router"
+    
+    # 明确的顺序提示词：出现一个即视为多步骤任务
+    SEQUENCE_PATTERN = re.compile(
+        r"然后|接着|随后|之后再|第[一二三四五六七八九十\d]+步|"
+        r"\bthen\b|\bafterwards?\b|\bafter that\b|\bfinally\b|\bstep\s*\d+",
+        re.IGNORECASE
+    )
+    
+    # 编号步骤（行首的 1. / 2、/ 3) ），至少出现两条才视为多步骤任务
+    NUMBERED_STEP_PATTERN = re.compile(r"(?:^|\n)\s*\d+[.、)]")
+    
+    # 弱提示词：单独出现时常见于单步骤请求（如"列出文件并排序"），需出现两种以上不同的提示词
+    CONJUNCTION_PATTERN = re.compile(
+        r"并且|并|再|同时|之后|最后|首先|步骤|"
+        r"\band\b|\bafter\b|\bfirst\b|\bnext\b|"
+        r"[,，;；]",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, specs: list, loader: callable, unloader: callable, memory_budget_mb: int = 0):
+        """
+        初始化路由
+        
+        Args:
+            specs: 模型配置列表（从小到大）
+            loader: 加载函数 loader(spec) -> 模型句柄
+            unloader: 卸载函数 unloader(handle)
+            memory_budget_mb: 已加载模型的总内存预算（MB），0表示不限制
+        """
+        self.specs = specs
+        self.loader = loader
+        self.unloader = unloader
+        self.memory_budget_mb = memory_budget_mb
+        
+        # 已加载的模型 {name: handle}
+        self.loaded = {}
+        self.last_used = {}
+        
+        # 统计 {name: {...}}
+        self.stats = {
+            spec["name"]: {"requests": 0, "generations": 0, "generation_seconds": 0.0, "escalations": 0, "failures": 0}
+            for spec in specs
+        }
+    
+    def _Estimate_Memory_MB(self, spec: dict) -> float:
+        """按GGUF文件大小估算模型常驻内存（MB）"""
+        try:
+            return os.path.getsize(spec["model_path"]) / (1024 * 1024)
+        except OSError:
+            return 0.0
+    
+    def _Make_Room(self, spec: dict):
+        """
+        按内存预算卸载最久未使用的其他模型，为即将加载的模型腾出空间
+        
+        Args:
+            spec: 即将加载的模型配置
+        """
+        if self.memory_budget_mb <= 0:
+            return
+        
+        needed = self._Estimate_Memory_MB(spec)
+        while self.loaded:
+            used = sum(self._Estimate_Memory_MB(self._Get_Spec(name)) for name in self.loaded)
+            if used + needed <= self.memory_budget_mb:
+                break
+            victim = min(self.loaded, key=lambda name: self.last_used.get(name, 0))
+            Log_Info(self.MODULE_NAME, f"Memory budget {self.memory_budget_mb}MB exceeded, unloading {victim}")
+            self.Unload(victim)
+    
+    def _Get_Spec(self, name: str) -> dict:
+        """按名称获取模型配置"""
+        for spec in self.specs:
+            if spec["name"] == name:
+                return spec
+        raise KeyError(f"Unknown model: {name}")
+    
+    def Get(self, name: str):
+        """
+        获取模型句柄，未加载时懒加载
+        
+        Args:
+            name: 模型名称
+        
+        Returns:
+            模型句柄
+        """
+        if name not in self.loaded:
+            spec = self._Get_Spec(name)
+            self._Make_Room(spec)
+            start_time = time.time()
+            self.loaded[name] = self.loader(spec)
+            Log_Info(self.MODULE_NAME, f"Model {name} loaded in {time.time() - start_time:.2f}s")
+        self.last_used[name] = time.time()
+        return self.loaded[name]
+    
+    def Unload(self, name: str):
+        """
+        卸载模型
+        
+        Args:
+            name: 模型名称
+        """
+        handle = self.loaded.pop(name, None)
+        if handle is not None:
+            self.unloader(handle)
+            Log_Info(self.MODULE_NAME, f"Model {name} unloaded")
+    
+    def Unload_All(self):
+        """卸载所有模型"""
+        for name in list(self.loaded):
+            self.Unload(name)
+    
+    def Is_Multi_Step(self, message: str) -> bool:
+        """
+        粗略判断消息是否为多步骤任务：出现明确的顺序提示词、两条以上编号步骤，
+        或两种以上不同的弱提示词
+        
+        Args:
+            message: 用户消息
+        
+        Returns:
+            是否为多步骤任务
+        """
+        if self.SEQUENCE_PATTERN.search(message):
+            return True
+        if len(self.NUMBERED_STEP_PATTERN.findall(message)) >= 2:
+            return True
+        cues = {cue.lower().replace("，", ",").replace("；", ";") for cue in self.CONJUNCTION_PATTERN.findall(message)}
+        return len(cues) >= 2
+    
+    def Route(self, message: str) -> str:
+        """
+        选择最可能成功的最小模型
+        
+        Args:
+            message: 用户消息
+        
+        Returns:
+            模型名称
+        """
+        multi_step = self.Is_Multi_Step(message)
+        chosen = self.specs[-1]["name"]
+        for spec in self.specs:
+            if not multi_step or spec.get("multi_step", True):
+                chosen = spec["name"]
+                break
+        
+        self.stats[chosen]["requests"] += 1
+        Log_Info(self.MODULE_NAME, f"Routed message to {chosen} (multi_step={multi_step})")
+        return chosen
+    
+    def Next(self, name: str) -> str:
+        """
+        获取比当前模型更大的下一个模型
+        
+        Args:
+            name: 当前模型名称
+        
+        Returns:
+            下一个模型名称，已是最大模型时返回None
+        """
+        names = [spec["name"] for spec in self.specs]
+        index = names.index(name)
+        if index + 1 < len(names):
+            return names[index + 1]
+        return None
+    
+    def Escalate(self, name: str) -> str:
+        """
+        记录一次失败并升级到更大的模型
+        
+        Args:
+            name: 当前模型名称
+        
+        Returns:
+            升级后的模型名称，无法升级时返回None
+        """
+        self.stats[name]["failures"] += 1
+        next_name = self.Next(name)
+        if next_name is not None:
+            self.stats[name]["escalations"] += 1
+            self.stats[next_name]["requests"] += 1
+            Log_Info(self.MODULE_NAME, f"Escalating from {name} to {next_name}")
+        return next_name
+    
+    def Record_Generation(self, name: str, seconds: float):
+        """
+        记录一次生成耗时
+        
+        Args:
+            name: 模型名称
+            seconds: 生成耗时（秒）
+        """
+        self.stats[name]["generations"] += 1
+        self.stats[name]["generation_seconds"] += seconds
+    
+    def Get_Report(self) -> dict:
+        """
+        获取各模型的平均生成延迟与升级率
+        
+        Returns:
+            {name: {"requests", "avg_generation_ms", "escalation_rate", "loaded"}}
+        """
+        report = {}
+        for name, stats in self.stats.items():
+            generations = stats["generations"]
+            requests = stats["requests"]
+            report[name] = {
+                "requests": requests,
+                "avg_generation_ms": stats["generation_seconds"] * 1000 / generations if generations else 0.0,
+                "escalation_rate": stats["escalations"] / requests if requests else 0.0,
+                "loaded": name in self.loaded
+            }
+        return report
@@ -0,0 +1,331 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Session - LLM会话层，在Llama实例之上复用已评估的token前缀（KV cache）
+每次生成只评估与上一次prompt不同的后缀部分
+"""
+
+import os
+import sys
+import time
+import pickle
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+class LLM_Session:
+    """
+    LLM会话类 - 自行渲染chatml模板并分词，与Llama中已评估的token比较，
+    只对新增后缀进行prefill，统计每次生成复用/评估的token数
+    """
+    
+    MODULE_NAME = "LLM_Session"
+    
+    # chatml模板标记
+    IM_START = "<|im_start|>"
+    IM_END = "<|im_end|>"
+    
+    # 单条消息token缓存的最大条数
+    SEGMENT_CACHE_SIZE = 256
+    
+    def __init__(self, model):
+        """
+        初始化会话
+        
+        Args:
+            model: llama_cpp.Llama实例
+        """
+        self.model = model
+        
+        # 最近一次生成的统计
+        self.last_prompt_tokens = 0
+        self.last_reused_tokens = 0
+        self.last_evaluated_tokens = 0
+        self.last_generated_tokens = 0
+        self.last_generation_seconds = 0.0
+        self.last_first_token_seconds = 0.0
+        
+        # 按消息缓存渲染后的token ids：每条消息以特殊token开头和结尾，
+        # 分段分词与整体分词结果一致，每轮迭代只需对新增消息分词
+        self._segment_cache = OrderedDict()
+        self._bos_tokens = None
+        self._generation_prompt_tokens = None
+        
+        # 分段分词是否与整体分词一致（None表示尚未验证）
+        self._segments_verified = None
+    
+    def Format_Messages(self, messages: list, add_generation_prompt: bool = True) -> str:
+        """
+        按chatml格式渲染消息列表，并追加assistant起始标记
+        
+        Args:
+            messages: 消息列表
+            add_generation_prompt: 是否追加assistant起始标记
+        
+        Returns:
+            渲染后的prompt文本
+        """
+        parts = []
+        for message in messages:
+            parts.append(f"{self.IM_START}{message['role']}\n{message['content']}{self.IM_END}\n")
+        if add_generation_prompt:
+            parts.append(f"{self.IM_START}assistant\n")
+        return "".join(parts)
+    
+    def Tokenize(self, text: str, add_bos: bool = False) -> list:
+        """
+        分词（识别特殊token）
+        
+        Args:
+            text: 文本
+            add_bos: 是否添加BOS
+        
+        Returns:
+            token id列表
+        """
+        return self.model.tokenize(text.encode("utf-8"), add_bos=add_bos, special=True)
+    
+    def Tokenize_Message(self, message: dict) -> list:
+        """
+        渲染单条消息并分词（带缓存，不含BOS）
+        
+        Args:
+            message: 消息字典
+        
+        Returns:
+            token id列表
+        """
+        key = (message["role"], message["content"])
+        tokens = self._segment_cache.get(key)
+        if tokens is None:
+            tokens = self.Tokenize(self.Format_Messages([message], add_generation_prompt=False))
+            self._segment_cache[key] = tokens
+            while len(self._segment_cache) > self.SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+        else:
+            self._segment_cache.move_to_end(key)
+        return tokens
+    
+    def Tokenize_Messages(self, messages: list, add_generation_prompt: bool = True) -> list:
+        """
+        将消息列表渲染并分词
+        已分词过的消息（系统提示词、历史轮次）直接使用缓存，只对新增消息分词；
+        首次调用时与整体分词结果比对，不一致（分词器跨特殊token合并）时退回整体分词
+        
+        Args:
+            messages: 消息列表
+            add_generation_prompt: 是否追加assistant起始标记
+        
+        Returns:
+            token id列表
+        """
+        if self._segments_verified is False:
+            return self.Tokenize(self.Format_Messages(messages, add_generation_prompt), add_bos=True)
+        
+        if self._bos_tokens is None:
+            self._bos_tokens = self.Tokenize("", add_bos=True)
+            self._generation_prompt_tokens = self.Tokenize(f"{self.IM_START}assistant\n")
+        
+        tokens = list(self._bos_tokens)
+        for message in messages:
+            tokens.extend(self.Tokenize_Message(message))
+        if add_generation_prompt:
+            tokens.extend(self._generation_prompt_tokens)
+        
+        if self._segments_verified is None:
+            expected = self.Tokenize(self.Format_Messages(messages, add_generation_prompt), add_bos=True)
+            self._segments_verified = tokens == expected
+            if not self._segments_verified:
+                Log_Info(self.MODULE_NAME, "Segment tokenization differs from full tokenization, cache disabled")
+                return expected
+        
+        return tokens
+    
+    def _Match_Prefix(self, tokens: list) -> int:
+        """
+        计算tokens与模型中已评估token的最长公共前缀
+        至少保留最后一个token用于重新评估以得到logits
+        
+        Args:
+            tokens: 新prompt的token id列表
+        
+        Returns:
+            可复用的token数
+        """
+        evaluated = self.model.input_ids
+        limit = min(len(evaluated), len(tokens) - 1)
+        prefix = 0
+        while prefix < limit and evaluated[prefix] == tokens[prefix]:
+            prefix += 1
+        return prefix
+    
+    def _Prepare(self, messages: list) -> list:
+        """
+        分词并记录前缀复用统计
+        
+        Args:
+            messages: 消息列表
+        
+        Returns:
+            prompt的token id列表
+        """
+        tokens = self.Tokenize_Messages(messages)
+        reused = self._Match_Prefix(tokens)
+        
+        self.last_prompt_tokens = len(tokens)
+        self.last_reused_tokens = reused
+        self.last_evaluated_tokens = len(tokens) - reused
+        
+        Log_Info(self.MODULE_NAME, f"Prompt tokens={len(tokens)}, reused={reused}, evaluated={len(tokens) - reused}")
+        return tokens
+    
+    def Generate(self, messages: list, max_tokens: int = 1024, stop: list = None, **kwargs) -> str:
+        """
+        非流式生成
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最大生成token数
+            stop: 额外的停止字符串
+        
+        Returns:
+            生成文本
+        """
+        tokens = self._Prepare(messages)
+        start_time = time.time()
+        # Llama.generate内部会对tokens与已评估token做前缀匹配，只评估后缀
+        output = self.model.create_completion(
+            prompt=tokens,
+            max_tokens=max_tokens,
+            stop=[self.IM_END] + (stop or []),
+            **kwargs
+        )
+        self._Record_Generation(tokens, start_time, None)
+        return output["choices"][0]["text"]
+    
+    def Generate_Stream(self, messages: list, max_tokens: int = 1024, stop: list = None, **kwargs):
+        """
+        流式生成，逐块返回文本
+        
+        Args:
+            messages: 消息列表
+            max_tokens: 最大生成token数
+            stop: 额外的停止字符串
+        
+        Yields:
+            文本片段
+        """
+        tokens = self._Prepare(messages)
+        start_time = time.time()
+        first_token_time = None
+        try:
+            for chunk in self.model.create_completion(
+                prompt=tokens,
+                max_tokens=max_tokens,
+                stop=[self.IM_END] + (stop or []),
+                stream=True,
+                **kwargs
+            ):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                text = chunk["choices"][0].get("text", "")
+                if text:
+                    yield text
+        finally:
+            self._Record_Generation(tokens, start_time, first_token_time)
+    
+    def _Record_Generation(self, tokens: list, start_time: float, first_token_time: float):
+        """
+        记录一次生成的token数与耗时
+        首个token之前的时间视为prefill，之后为decode；非流式生成无法区分，全部计入prefill
+        
+        Args:
+            tokens: prompt的token id列表
+            start_time: 生成开始时间
+            first_token_time: 收到首个token的时间，未知时为None
+        """
+        end_time = time.time()
+        self.last_generated_tokens = max(0, self.model.n_tokens - len(tokens))
+        self.last_generation_seconds = end_time - start_time
+        self.last_first_token_seconds = (first_token_time or end_time) - start_time
+    
+    def Get_Last_Stats(self) -> dict:
+        """
+        获取最近一次生成的prefill统计
+        
+        Returns:
+            统计字典
+        """
+        return {
+            "prompt_tokens": self.last_prompt_tokens,
+            "reused_tokens": self.last_reused_tokens,
+            "evaluated_tokens": self.last_evaluated_tokens,
+            "generated_tokens": self.last_generated_tokens,
+            "generation_seconds": self.last_generation_seconds,
+            "first_token_seconds": self.last_first_token_seconds
+        }
+    
+    def Prefill(self, messages: list) -> int:
+        """
+        只评估消息列表对应的prompt前缀（不生成），用于预热KV cache
+        
+        Args:
+            messages: 消息列表（通常只包含system消息）
+        
+        Returns:
+            本次实际评估的token数
+        """
+        tokens = self.Tokenize_Messages(messages, add_generation_prompt=False)
+        reused = self._Match_Prefix(tokens + [-1])
+        if reused < len(tokens):
+            self.model.n_tokens = reused
+            self.model.eval(tokens[reused:])
+        Log_Info(self.MODULE_NAME, f"Prefilled {len(tokens)} tokens, evaluated={len(tokens) - reused}")
+        return len(tokens) - reused
+    
+    def Save_State(self, path: str, key: str):
+        """
+        将当前llama.cpp状态（已评估的token与KV cache）保存到文件
+        
+        Args:
+            path: 快照文件路径
+            key: 快照校验键（模型、上下文长度、系统提示词等的哈希）
+        """
+        if self.model.n_tokens == 0:
+            return
+        state = self.model.save_state()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"key": key, "state": state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        Log_Info(self.MODULE_NAME, f"State saved to {path}, tokens={self.model.n_tokens}")
+    
+    def Load_State(self, path: str, key: str) -> bool:
+        """
+        从文件恢复llama.cpp状态，校验键不一致时视为失效
+        
+        Args:
+            path: 快照文件路径
+            key: 期望的快照校验键
+        
+        Returns:
+            是否恢复成功
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("key") != key:
+                Log_Info(self.MODULE_NAME, f"State snapshot invalidated: {path}")
+                return False
+            self.model.load_state(snapshot["state"])
+            Log_Info(self.MODULE_NAME, f"State restored from {path}, tokens={self.model.n_tokens}")
+            return True
+        except Exception as e:
+            Log_Info(self.MODULE_NAME, f"Failed to load state snapshot: {e}")
+            return False
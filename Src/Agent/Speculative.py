@@ -0,0 +1,125 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Speculative - 投机解码草稿模型
+提供基于小模型（如Qwen3-0.6B）的草稿模型和带统计的prompt-lookup草稿，
+供主模型Llama(draft_model=...)使用
+"""
+
+import os
+import sys
+
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+class Draft_Stats:
+    """
+    草稿统计 - 记录草稿模型被调用次数与提议的token数
+    """
+    
+    def __init__(self):
+        self.calls = 0
+        self.proposed_tokens = 0
+    
+    def Record(self, draft_tokens):
+        """记录一次草稿提议"""
+        self.calls += 1
+        self.proposed_tokens += len(draft_tokens)
+    
+    def Snapshot(self) -> tuple:
+        """返回(calls, proposed_tokens)快照，用于计算单次请求的增量"""
+        return (self.calls, self.proposed_tokens)
+
+
+class Small_Model_Draft(LlamaDraftModel):
+    """
+    小模型草稿 - 用同词表的小模型贪心生成若干草稿token
+    小模型同样复用已评估的token前缀，只评估新增部分
+    """
+    
+    MODULE_NAME = "Small_Model_Draft"
+    
+    def __init__(self, model_path: str, n_ctx: int, n_threads: int, num_pred_tokens: int = 4):
+        """
+        加载草稿模型
+        
+        Args:
+            model_path: 草稿模型路径（需与主模型同词表）
+            n_ctx: 上下文长度（与主模型一致）
+            n_threads: 推理线程数
+            num_pred_tokens: 每次提议的草稿token数
+        """
+        Log_Info(self.MODULE_NAME, f"Loading draft model from {model_path}")
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            verbose=False
+        )
+        self.num_pred_tokens = num_pred_tokens
+        self.eos_token = self.model.token_eos()
+        self.stats = Draft_Stats()
+        Log_Info(self.MODULE_NAME, "Draft model loaded")
+    
+    def __call__(self, input_ids, **kwargs):
+        """
+        根据主模型当前的token序列提议草稿token
+        
+        Args:
+            input_ids: 主模型已接受的token序列
+        
+        Returns:
+            草稿token数组
+        """
+        tokens = input_ids.tolist()
+        if not tokens:
+            return np.array([], dtype=np.intc)
+        
+        # 复用草稿模型中已评估的前缀
+        evaluated = self.model.input_ids
+        limit = min(len(evaluated), len(tokens) - 1)
+        prefix = 0
+        while prefix < limit and evaluated[prefix] == tokens[prefix]:
+            prefix += 1
+        
+        draft = []
+        try:
+            self.model.n_tokens = prefix
+            self.model.eval(tokens[prefix:])
+            
+            limit = min(self.num_pred_tokens, self.model.n_ctx() - self.model.n_tokens)
+            for _ in range(limit):
+                token = int(np.argmax(self.model.scores[self.model.n_tokens - 1]))
+                if token == self.eos_token:
+                    break
+                draft.append(token)
+                self.model.eval([token])
+        except Exception as e:
+            Log_Info(self.MODULE_NAME, f"Draft generation error: {e}")
+            self.model.n_tokens = 0
+        
+        self.stats.Record(draft)
+        return np.array(draft, dtype=np.intc)
+
+
+class Prompt_Lookup_Draft(LlamaPromptLookupDecoding):
+    """
+    带统计的prompt-lookup草稿 - 从已有上下文中匹配n-gram作为草稿，无需额外模型
+    命令输出等重复内容较多的场景效果较好
+    """
+    
+    def __init__(self, num_pred_tokens: int = 10, max_ngram_size: int = 2):
+        super().__init__(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+        self.stats = Draft_Stats()
+    
+    def __call__(self, input_ids, **kwargs):
+        draft = super().__call__(input_ids, **kwargs)
+        self.stats.Record(draft)
+        return draft
@@ -0,0 +1,144 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Tool_Call_Detector - 流式输出中的增量工具调用检测
+逐块接收模型输出，一旦出现语法完整且调用已注册工具的JSON对象即报告完成，
+供生成循环提前停止解码
+"""
+
+import json
+
+
+class Tool_Call_Detector:
+    """
+    增量工具调用检测类 - 跳过<think>块，跟踪JSON对象的括号深度（忽略字符串内的括号），
+    对象闭合时尝试解析；允许并行调用时也识别工具调用数组
+    """
+    
+    THINK_START = "<think>"
+    THINK_END = "</think>"
+    
+    def __init__(self, tool_names, allow_list: bool = False):
+        """
+        初始化检测器
+        
+        Args:
+            tool_names: 已注册工具名称集合
+            allow_list: 是否识别工具调用数组（并行调用模式）
+        """
+        self.tool_names = set(tool_names)
+        self.allow_list = allow_list
+        self.text = ""
+        self.tool_call = None
+        self.tool_calls = []
+        
+        # 工具调用JSON在text中的结束位置
+        self.end = -1
+        
+        # 扫描状态
+        self._pos = 0
+        self._in_think = False
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+    
+    def Feed(self, chunk: str) -> bool:
+        """
+        输入一段新生成的文本
+        
+        Args:
+            chunk: 文本片段
+        
+        Returns:
+            是否已检测到完整的工具调用
+        """
+        if self.tool_call is not None:
+            return True
+        
+        self.text += chunk
+        text = self.text
+        
+        while self._pos < len(text):
+            if self._start == -1:
+                # 对象外：处理think块并寻找对象起点
+                if self._in_think:
+                    end = text.find(self.THINK_END, self._pos)
+                    if end == -1:
+                        # 保留可能被截断的结束标记
+                        self._pos = max(self._pos, len(text) - len(self.THINK_END) + 1)
+                        return False
+                    self._in_think = False
+                    self._pos = end + len(self.THINK_END)
+                    continue
+                
+                if text.startswith(self.THINK_START, self._pos):
+                    self._in_think = True
+                    self._pos += len(self.THINK_START)
+                    continue
+                if self.THINK_START.startswith(text[self._pos:]):
+                    # 可能是被截断的开始标记，等待更多文本
+                    return False
+                
+                if text[self._pos] == "{" or (self.allow_list and text[self._pos] == "["):
+                    self._start = self._pos
+                    self._depth = 1
+                    self._in_string = False
+                    self._escape = False
+                self._pos += 1
+                continue
+            
+            # 对象内：跟踪括号深度
+            char = text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._Try_Parse(text[self._start:self._pos]):
+                        self.end = self._pos
+                        return True
+                    # 不是合法的工具调用，从对象起点之后继续寻找
+                    self._pos = self._start + 1
+                    self._start = -1
+        
+        return False
+    
+    def _Is_Call(self, parsed) -> bool:
+        """判断解析结果是否为已注册工具的调用"""
+        return isinstance(parsed, dict) and parsed.get("tool") in self.tool_names
+    
+    def _Try_Parse(self, candidate: str) -> bool:
+        """
+        尝试将闭合的对象（或数组）解析为工具调用
+        
+        Args:
+            candidate: JSON对象或数组文本
+        
+        Returns:
+            是否为已注册工具的调用
+        """
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        
+        if self._Is_Call(parsed):
+            parsed = [parsed]
+        elif not (isinstance(parsed, list) and parsed and all(self._Is_Call(item) for item in parsed)):
+            return False
+        
+        self.tool_calls = [(item["tool"], item.get("args", {})) for item in parsed]
+        self.tool_call = self.tool_calls[0]
+        return True
@@ -0,0 +1,145 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Tool_Registry - 工具注册表
+每个工具保存完整描述与简短描述，按用户消息用BM25挑选相关工具，
+只有相关工具的完整描述进入提示词，其余工具只保留一行简介
+"""
+
+import re
+import math
+
+
+class Tool_Registry(dict):
+    """
+    工具注册表类 - {name: {"func", "description", "summary", "keywords", "always"}}
+    继承dict，原有按名称访问工具的代码无需修改
+    """
+    
+    # 英文单词/数字/下划线标识符，以及中日韩字符
+    WORD_PATTERN = re.compile(r"[a-z0-9_]+|[\u4e00-\u9fff]+")
+    
+    # BM25参数
+    K1 = 1.5
+    B = 0.75
+    
+    def Register(self, name: str, func: callable, description: str, summary: str = None,
+                 keywords: list = None, always: bool = False):
+        """
+        注册工具
+        
+        Args:
+            name: 工具名称
+            func: 工具函数
+            description: 完整描述（参数、返回值、示例）
+            summary: 一行简介，默认取完整描述的第一行
+            keywords: 额外的检索关键词（如中文同义词）
+            always: 是否总是附带完整描述
+        """
+        if summary is None:
+            summary = description.strip().splitlines()[0] if description.strip() else name
+        self[name] = {
+            "func": func,
+            "description": description,
+            "summary": summary,
+            "keywords": keywords or [],
+            "always": always
+        }
+    
+    def _Tokenize(self, text: str) -> list:
+        """
+        切分检索词：英文按单词（下划线标识符同时拆分），中文按单字与相邻双字
+        
+        Args:
+            text: 文本
+        
+        Returns:
+            词列表
+        """
+        terms = []
+        for word in self.WORD_PATTERN.findall(text.lower()):
+            if "\u4e00" <= word[0] <= "\u9fff":
+                terms.extend(word)
+                terms.extend(word[index:index + 2] for index in range(len(word) - 1))
+            else:
+                terms.append(word)
+                if "_" in word:
+                    terms.extend(part for part in word.split("_") if part)
+        return terms
+    
+    def _Document(self, name: str) -> list:
+        """获取工具的检索文档词列表"""
+        tool = self[name]
+        return self._Tokenize(" ".join([name, tool["summary"], tool["description"]] + tool["keywords"]))
+    
+    def Score(self, message: str) -> dict:
+        """
+        计算每个工具与消息的BM25相关度
+        
+        Args:
+            message: 用户消息
+        
+        Returns:
+            {name: score}
+        """
+        documents = {name: self._Document(name) for name in self}
+        if not documents:
+            return {}
+        
+        average_length = sum(len(terms) for terms in documents.values()) / len(documents)
+        query = set(self._Tokenize(message))
+        
+        scores = {}
+        for name, terms in documents.items():
+            counts = {}
+            for term in terms:
+                if term in query:
+                    counts[term] = counts.get(term, 0) + 1
+            
+            score = 0.0
+            for term, frequency in counts.items():
+                document_frequency = sum(1 for other in documents.values() if term in other)
+                idf = math.log((len(documents) - document_frequency + 0.5) / (document_frequency + 0.5) + 1)
+                norm = self.K1 * (1 - self.B + self.B * len(terms) / average_length)
+                score += idf * frequency * (self.K1 + 1) / (frequency + norm)
+            scores[name] = score
+        return scores
+    
+    def Select(self, message: str, top_k: int = 3) -> list:
+        """
+        挑选与消息最相关的工具（always工具总是包含，相关度为0的工具不选）
+        
+        Args:
+            message: 用户消息
+            top_k: 最多挑选的工具数（不含always工具）
+        
+        Returns:
+            工具名称列表（按注册顺序）
+        """
+        scores = self.Score(message)
+        ranked = sorted((name for name in scores if scores[name] > 0 and not self[name]["always"]),
+                        key=lambda name: scores[name], reverse=True)
+        chosen = set(ranked[:top_k]) | {name for name in self if self[name]["always"]}
+        return [name for name in self if name in chosen]
+    
+    def Build_Summaries(self) -> str:
+        """
+        构建所有工具的一行简介
+        
+        Returns:
+            简介文本
+        """
+        return "\n".join(f"- {name}: {tool['summary']}" for name, tool in self.items())
+    
+    def Build_Details(self, names: list) -> str:
+        """
+        构建指定工具的完整描述
+        
+        Args:
+            names: 工具名称列表
+        
+        Returns:
+            完整描述文本
+        """
+        return "\n".join(f"- {name}: {self[name]['description']}" for name in names)
@@ -0,0 +1,214 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Tuning - 推理参数调优档案
+Tool/tune_model.py在本机基准测试后写入最优参数，Agent加载模型时自动应用
+档案按 模型文件指纹 + CPU型号 区分
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+MODULE_NAME = "Tuning"
+
+# 档案文件名（位于cache_dir下）
+PROFILE_FILE = "tuning_profiles.json"
+
+# 计算模型指纹时读取的头/尾字节数
+FINGERPRINT_CHUNK = 16 * 1024 * 1024
+
+# 模型指纹缓存文件名（位于cache_dir下），按 路径|大小|修改时间 保存，冷启动时无需重新哈希
+FINGERPRINT_FILE = "model_fingerprints.json"
+
+# 进程内的模型指纹缓存 {(realpath, size, mtime_ns): 指纹}
+_FINGERPRINTS = {}
+
+# KV cache类型名称到ggml类型编号的映射
+KV_CACHE_TYPES = {
+    "f16": 1,
+    "q8_0": 8,
+    "q4_0": 2,
+}
+
+
+def Get_CPU_Model() -> str:
+    """
+    获取CPU型号
+    
+    Returns:
+        CPU型号字符串
+    """
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def Get_Model_Fingerprint(model_path: str, cache_dir: str = None) -> str:
+    """
+    计算模型文件指纹（文件大小 + 头尾各16MB的sha256），避免对数GB文件做全量哈希
+    结果按文件路径/大小/修改时间缓存在进程内，指定cache_dir时同时保存到磁盘
+    
+    Args:
+        model_path: 模型文件路径
+        cache_dir: 缓存目录（None为只使用进程内缓存）
+    
+    Returns:
+        指纹字符串
+    """
+    stat = os.stat(model_path)
+    key = (os.path.realpath(model_path), stat.st_size, stat.st_mtime_ns)
+    fingerprint = _FINGERPRINTS.get(key)
+    if fingerprint is not None:
+        return fingerprint
+    
+    stored = _Read_Json(os.path.join(cache_dir, FINGERPRINT_FILE)) if cache_dir else {}
+    stored_key = "|".join(str(part) for part in key)
+    fingerprint = stored.get(stored_key)
+    if fingerprint is None:
+        fingerprint = _Hash_Model(model_path, stat.st_size)
+        if cache_dir:
+            stored[stored_key] = fingerprint
+            _Write_Json(os.path.join(cache_dir, FINGERPRINT_FILE), stored)
+    _FINGERPRINTS[key] = fingerprint
+    return fingerprint
+
+
+def _Hash_Model(model_path: str, size: int) -> str:
+    """对模型文件的大小与头尾各16MB做sha256"""
+    hasher = hashlib.sha256()
+    hasher.update(str(size).encode("utf-8"))
+    with open(model_path, "rb") as f:
+        hasher.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            hasher.update(f.read(FINGERPRINT_CHUNK))
+    return hasher.hexdigest()[:32]
+
+
+def Get_Profile_Key(model_path: str, cache_dir: str = None) -> str:
+    """
+    获取档案键
+    
+    Args:
+        model_path: 模型文件路径
+        cache_dir: 缓存目录（用于模型指纹缓存）
+    
+    Returns:
+        "模型指纹|CPU型号"
+    """
+    return f"{Get_Model_Fingerprint(model_path, cache_dir)}|{Get_CPU_Model()}"
+
+
+def _Read_Json(path: str) -> dict:
+    """读取JSON字典文件，不存在或损坏时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        Log_Info(MODULE_NAME, f"Failed to read {os.path.basename(path)}: {e}")
+        return {}
+
+
+def _Write_Json(path: str, data: dict):
+    """写入JSON字典文件（先写临时文件再替换）"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        Log_Info(MODULE_NAME, f"Failed to write {os.path.basename(path)}: {e}")
+
+
+def _Read_Profiles(cache_dir: str) -> dict:
+    """读取全部档案"""
+    return _Read_Json(os.path.join(cache_dir, PROFILE_FILE))
+
+
+def Load_Profile(cache_dir: str, model_path: str) -> dict:
+    """
+    加载模型在本机上的调优档案
+    
+    Args:
+        cache_dir: 缓存目录
+        model_path: 模型文件路径
+    
+    Returns:
+        档案字典，不存在时返回None
+    """
+    if not os.path.exists(model_path):
+        return None
+    # 没有任何档案时不计算模型指纹（避免每次加载模型都读取32MB）
+    profiles = _Read_Profiles(cache_dir)
+    if not profiles:
+        return None
+    profile = profiles.get(Get_Profile_Key(model_path, cache_dir))
+    if profile is not None:
+        Log_Info(MODULE_NAME, f"Tuning profile found for {os.path.basename(model_path)}: {profile}")
+    return profile
+
+
+def Save_Profile(cache_dir: str, model_path: str, profile: dict):
+    """
+    保存调优档案
+    
+    Args:
+        cache_dir: 缓存目录
+        model_path: 模型文件路径
+        profile: 档案字典
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    profiles = _Read_Profiles(cache_dir)
+    profile = dict(profile, model_path=model_path, cpu_model=Get_CPU_Model(), created=time.strftime("%Y-%m-%d %H:%M:%S"))
+    profiles[Get_Profile_Key(model_path, cache_dir)] = profile
+    
+    path = os.path.join(cache_dir, PROFILE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+    Log_Info(MODULE_NAME, f"Tuning profile saved for {os.path.basename(model_path)}: {profile}")
+
+
+def Build_Llama_Kwargs(n_threads: int, n_batch: int, kv_cache_type: str, use_mlock: bool = False) -> dict:
+    """
+    构建Llama构造参数（量化V cache需要开启flash attention）
+    
+    Args:
+        n_threads: 推理线程数
+        n_batch: prefill批大小
+        kv_cache_type: KV cache类型名称（f16/q8_0/q4_0）
+        use_mlock: 是否锁定模型内存
+    
+    Returns:
+        Llama构造参数字典
+    """
+    kwargs = {
+        "n_threads": n_threads,
+        "n_threads_batch": n_threads,
+        "n_batch": n_batch,
+        "use_mlock": use_mlock,
+    }
+    if kv_cache_type in KV_CACHE_TYPES and kv_cache_type != "f16":
+        kwargs["type_k"] = KV_CACHE_TYPES[kv_cache_type]
+        kwargs["type_v"] = KV_CACHE_TYPES[kv_cache_type]
+        kwargs["flash_attn"] = True
+    return kwargs
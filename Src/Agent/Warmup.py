@@ -0,0 +1,96 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Warmup - Agent启动预热工具
+预先导入llama_cpp、将模型文件读入页缓存，缩短模型加载时间
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Log.Log import Log_Info
+
+
+MODULE_NAME = "Warmup"
+
+# 预读模型文件的块大小
+PREFETCH_CHUNK = 8 * 1024 * 1024
+
+
+def Get_Model_Paths(config: dict) -> list:
+    """
+    获取配置中所有模型文件的绝对路径（model_path、models、draft_model_path）
+    
+    Args:
+        config: 配置字典
+    
+    Returns:
+        模型文件路径列表
+    """
+    agent_config = config.get("Agent", {})
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    
+    paths = []
+    if agent_config.get("models"):
+        # 只预热默认模型（第一个或default_model）
+        default_name = agent_config.get("default_model", agent_config["models"][0]["name"])
+        for spec in agent_config["models"]:
+            if spec["name"] == default_name:
+                paths.append(spec["model_path"])
+    else:
+        paths.append(agent_config.get("model_path", "Model/Qwen3-0.6B-Q8_0.gguf"))
+    
+    if agent_config.get("speculative_mode", "none") == "draft":
+        paths.append(agent_config.get("draft_model_path", "Model/Qwen3-0.6B-Q8_0.gguf"))
+    
+    return [path if os.path.isabs(path) else os.path.join(base_dir, path) for path in paths]
+
+
+def Prefetch_File(path: str, stop_event=None) -> float:
+    """
+    将文件读入页缓存（顺序读取并丢弃内容），之后mmap加载模型时无需等待磁盘
+    
+    Args:
+        path: 文件路径
+        stop_event: 可选的threading.Event，置位时提前结束
+    
+    Returns:
+        耗时（秒）
+    """
+    start_time = time.time()
+    if not os.path.exists(path):
+        Log_Info(MODULE_NAME, f"Prefetch skipped, file not found: {path}")
+        return 0.0
+    
+    try:
+        with open(path, "rb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            buffer = bytearray(PREFETCH_CHUNK)
+            while f.readinto(buffer):
+                if stop_event is not None and stop_event.is_set():
+                    break
+    except OSError as e:
+        Log_Info(MODULE_NAME, f"Prefetch failed for {path}: {e}")
+    
+    elapsed = time.time() - start_time
+    Log_Info(MODULE_NAME, f"Prefetched {os.path.basename(path)} in {elapsed:.2f}s")
+    return elapsed
+
+
+def Import_Llama_Cpp() -> float:
+    """
+    预先导入llama_cpp（加载共享库）
+    
+    Returns:
+        耗时（秒）
+    """
+    start_time = time.time()
+    import llama_cpp
+    elapsed = time.time() - start_time
+    Log_Info(MODULE_NAME, f"llama_cpp imported in {elapsed:.2f}s")
+    return elapsed
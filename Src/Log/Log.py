@@ -17,11 +17,21 @@ def Log_Info(module, text):
     """
     按照 [时间] [信息] [模组] : 文本 的形式将日志存储到.log/日期.log当中
     """
+    _Write_Log("信息", module, text)
+
+def Log_Warning(module, text):
+    """
+    按照 [时间] [警告] [模组] : 文本 的形式将日志存储到.log/日期.log当中
+    """
+    _Write_Log("警告", module, text)
+
+def _Write_Log(level, module, text):
+    """将一行日志追加到.log/日期.log"""
     now = datetime.now()
     time_str = now.strftime("%Y-%m-%d %H:%M:%S")
     date_str = now.strftime("%Y-%m-%d")
     
-    log_line = f"[{time_str}] [信息] [{module}] : {text}\n"
+    log_line = f"[{time_str}] [{level}] [{module}] : {text}\n"
     
     log_dir_path = Get_Log_Dir()
     
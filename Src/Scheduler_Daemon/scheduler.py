@@ -19,6 +19,8 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Log.Log import Log_Info, Cleanup_Old_Logs
 from Comm.Email import Comm
+from API.Capture import Read_Output, Import_Scan_Cache
+from API.Job import Get_Jobs_Dir, Collect_Finished_Jobs, Cancel_Running_Jobs
 
 
 class Scheduler:
@@ -28,6 +30,9 @@ class Scheduler:
     STATE_IDLE = "Idle"
     STATE_ACTIVE = "Active"
     
+    # 邮件正文为以下内容时取消Agent当前任务
+    CANCEL_COMMANDS = ("stop", "cancel", "停止", "取消")
+    
     def __init__(self, config, agent_target=None):
         """
         根据config配置初始化属性
@@ -45,6 +50,24 @@ class Scheduler:
         self.active_timeout = scheduler_config.get("active_timeout", 300)
         self.agent_persistence = scheduler_config.get("agent_persistence", False)
         self.agent_timeout = scheduler_config.get("agent_timeout", 120)
+        # 发送cancel后等待Agent结束当前任务的时间（秒）
+        self.cancel_grace = scheduler_config.get("cancel_grace", 10)
+        # 直接命令：邮件以这些前缀开头时，第一行的剩余部分直接在Shell中执行，不经过LLM
+        self.direct_command_prefixes = scheduler_config.get("direct_command_prefixes", ["$"])
+        self._direct_shell = None  # Agent未运行时执行直接命令的Shell
+        self._direct_thread = None  # 在主循环之外执行直接命令的线程（长命令不阻塞邮件轮询与停止指令）
+        # Agent与Scheduler的Shell最近一次已知的工作目录，两边执行命令前都先切换到该目录
+        self._last_working_dir = None
+        # 后台任务结束时邮件通知用户（任务状态保存在临时工作目录中，Agent退出后仍可检查）
+        job_config = config.get("Jobs", {})
+        self.job_notify = job_config.get("enabled", False) and job_config.get("notify", True)
+        # 待机Agent预热级别："none" | "warm"（预导入+预读模型文件） | "full"（预先加载完整Agent）
+        self.agent_standby = scheduler_config.get("agent_standby", "none")
+        # 无Agent运行时在后台将模型文件读入页缓存，缩短下次冷启动的加载时间
+        self.prefetch_model = scheduler_config.get("prefetch_model", False)
+        # 共享推理服务：由Scheduler启动并常驻，Agent进程通过Unix socket/命名管道连接
+        self.model_server_enabled = config.get("Model_Server", {}).get("enabled", False)
+        self.model_server = None
         
         # 临时工作目录配置
         tmp_config = config.get("Tmp_WorkingSpace", {})
@@ -55,10 +78,28 @@ class Scheduler:
         self.to_agent_queue = Queue()
         self.from_agent_queue = Queue()
         self.agent = None
+        self._agent_activated = False  # 待机Agent是否已激活
         self.last_email_time = 0
         self.last_agent_response_time = 0
         self.stop_event = threading.Event()
         self._last_log_cleanup_time = 0  # 上次日志清理时间
+        self._pending_emails = []  # 等待Agent响应期间收到的新邮件
+        
+        # Agent计时记录汇总（用于调优n_threads与模型选择）
+        self.telemetry_totals = {
+            "requests": 0,
+            "total_ms": 0.0,
+            "prefill_ms": 0.0,
+            "decode_ms": 0.0,
+            "ttft_ms": 0.0,
+            "tool_ms": 0.0,
+            "email_ms": 0.0,
+            "evaluated_tokens": 0,
+            "generated_tokens": 0,
+            "plan_cache_hits": 0,
+            "plan_cache_saved_ms": 0.0,
+            "response_cache_hits": 0
+        }
         
         # Agent目标函数
         self._agent_target = agent_target
@@ -133,33 +174,110 @@ class Scheduler:
         Log_Info("Scheduler", f"收到信号 {signum}，准备退出")
         self.shutdown()
     
+    def _spawn_agent(self):
+        """创建并启动Agent进程（不等待就绪）"""
+        self.agent = Process(
+            target=self._agent_target,
+            args=(self._config, self.to_agent_queue, self.from_agent_queue)
+        )
+        self.agent.start()
+        self._agent_activated = False
+        Log_Info("Scheduler", f"Agent进程已启动, PID={self.agent.pid}")
+    
+    def _start_standby(self):
+        """
+        启动待机Agent进程（预热后等待激活），使下次唤醒无需等待模型加载
+        """
+        if self.agent_standby == "none" or self._agent_target is None:
+            return
+        
+        if self.agent and self.agent.is_alive():
+            return
+        
+        Log_Info("Scheduler", f"启动待机Agent, 预热级别={self.agent_standby}")
+        self._spawn_agent()
+    
+    def _start_model_server(self):
+        """启动共享推理服务进程（未启用或已在运行时跳过）"""
+        if not self.model_server_enabled:
+            return
+        
+        if self.model_server and self.model_server.is_alive():
+            return
+        
+        from Agent.Model_Server import Model_Server_Main
+        self.model_server = Process(target=Model_Server_Main, args=(self._config,), daemon=True)
+        self.model_server.start()
+        Log_Info("Scheduler", f"推理服务进程已启动, PID={self.model_server.pid}")
+    
+    def _stop_model_server(self):
+        """停止共享推理服务进程"""
+        if self.model_server is None:
+            return
+        
+        if self.model_server.is_alive():
+            self.model_server.terminate()
+            self.model_server.join(timeout=5)
+        Log_Info("Scheduler", "推理服务进程已停止")
+        self.model_server = None
+    
+    def _start_prefetch(self):
+        """
+        在后台线程中预读模型文件（Scheduler继续轮询邮箱），待机Agent已负责预热时跳过
+        """
+        if not self.prefetch_model or self.agent_standby != "none":
+            return
+        
+        from Agent.Warmup import Get_Model_Paths, Prefetch_File
+        
+        def prefetch():
+            for model_path in Get_Model_Paths(self._config):
+                if self.stop_event.is_set():
+                    break
+                Prefetch_File(model_path, self.stop_event)
+        
+        threading.Thread(target=prefetch, daemon=True).start()
+        Log_Info("Scheduler", "开始后台预读模型文件")
+    
     def _start_agent(self):
         """启动Agent进程并等待其就绪"""
         if self._agent_target is None:
             Log_Info("Scheduler", "错误: agent_target未设置")
             return False
         
-        if self.agent and self.agent.is_alive():
+        if self.agent and self.agent.is_alive() and (self._agent_activated or self.agent_standby == "none"):
             Log_Info("Scheduler", "Agent进程已在运行")
             return True
         
-        self.agent = Process(
-            target=self._agent_target,
-            args=(self._config, self.to_agent_queue, self.from_agent_queue)
-        )
-        self.agent.start()
-        Log_Info("Scheduler", f"Agent进程已启动, PID={self.agent.pid}")
+        start_time = time.time()
         
-        # 等待Agent发送ready消息
+        # 推理服务意外退出时重新启动
+        self._start_model_server()
+        
+        if not (self.agent and self.agent.is_alive()):
+            self._spawn_agent()
+        else:
+            Log_Info("Scheduler", "激活待机Agent")
+        
+        # 待机模式下Agent预热后需要activate消息才会继续加载
+        if self.agent_standby != "none":
+            self.to_agent_queue.put({"type": "activate", "timestamp": time.time()})
+        
+        # 等待Agent发送ready消息（跳过待机通知）
         Log_Info("Scheduler", "等待Agent就绪...")
         try:
-            ready_msg = self.from_agent_queue.get(timeout=self.agent_timeout)
-            if ready_msg.get("type") == "ready":
-                Log_Info("Scheduler", "Agent已就绪")
-                return True
-            else:
-                Log_Info("Scheduler", f"收到意外消息: {ready_msg.get('type')}")
-                return False
+            while True:
+                remaining = self.agent_timeout - (time.time() - start_time)
+                ready_msg = self.from_agent_queue.get(timeout=max(remaining, 0.1))
+                if ready_msg.get("type") == "standby":
+                    continue
+                if ready_msg.get("type") == "ready":
+                    self._agent_activated = True
+                    Log_Info("Scheduler", f"Agent已就绪, 耗时{time.time() - start_time:.2f}s, 启动分阶段耗时: {ready_msg.get('startup_profile', {})}")
+                    return True
+                else:
+                    Log_Info("Scheduler", f"收到意外消息: {ready_msg.get('type')}")
+                    return False
         except queue.Empty:
             Log_Info("Scheduler", "等待Agent就绪超时")
             self._stop_agent()
@@ -172,6 +290,7 @@ class Scheduler:
         
         if not self.agent.is_alive():
             self.agent = None
+            self._agent_activated = False
             return
         
         # 发送关闭指令
@@ -185,34 +304,198 @@ class Scheduler:
             self.agent.terminate()
             self.agent.join(timeout=5)
         
+        # 进程被强制终止时可能还没读取shutdown等消息，清空队列，避免下一个Agent进程读到后立即退出
+        stale = 0
+        while True:
+            try:
+                self.to_agent_queue.get_nowait()
+                stale += 1
+            except queue.Empty:
+                break
+        if stale:
+            Log_Info("Scheduler", f"丢弃{stale}条未被读取的Agent消息")
+        
         Log_Info("Scheduler", "Agent进程已停止")
         self.agent = None
+        self._agent_activated = False
     
     def _send_to_agent(self, message):
         """发送消息给Agent"""
         self.to_agent_queue.put({
             "type": "user_message",
             "content": message,
+            "working_dir": self._last_working_dir,
             "timestamp": time.time()
         })
         Log_Info("Scheduler", f"消息已发送给Agent: {message[:50]}...")
     
+    def _is_cancel_command(self, email_content: str) -> bool:
+        """判断邮件是否为停止指令"""
+        return email_content.strip().lower() in self.CANCEL_COMMANDS
+    
+    def _receive_email(self):
+        """获取新邮件，优先返回等待Agent响应期间收到的邮件"""
+        if self._pending_emails:
+            return self._pending_emails.pop(0)
+        return self._comm.Try_Receive()
+    
+    def _cancel_agent(self, reason: str):
+        """
+        通知Agent取消当前任务（中断生成和正在执行的命令）
+        
+        Args:
+            reason: 取消原因
+        """
+        if not (self.agent and self.agent.is_alive()):
+            return
+        self.to_agent_queue.put({"type": "cancel", "reason": reason, "timestamp": time.time()})
+        Log_Info("Scheduler", f"已通知Agent取消当前任务: {reason}")
+    
+    def _parse_direct_command(self, email_content: str):
+        """
+        解析直接命令
+        
+        Args:
+            email_content: 邮件内容
+        
+        Returns:
+            命令字符串，不是直接命令时返回None
+        """
+        text = email_content.strip()
+        for prefix in self.direct_command_prefixes:
+            if prefix and text.startswith(prefix):
+                command = text[len(prefix):].strip().splitlines()
+                return command[0].strip() if command else None
+        return None
+    
+    def _execute_direct_shell(self, command: str):
+        """
+        在Scheduler进程内的Shell中执行直接命令（Agent未运行时使用，无需加载模型）
+        
+        Args:
+            command: 命令
+        
+        Returns:
+            (result, output_files) 元组
+        """
+        from API.Exec import Execute_Command, Set_Shell, Get_Output_Files, Clear_Output_Files, Get_Last_Working_Dir, Sync_Working_Dir
+        from API.Shell import Persistent_Shell
+        
+        if self._direct_shell is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            target_workspace = self._config.get("Target_Workspace", {}).get("target_workspace", base_dir)
+            if self._last_working_dir and os.path.isdir(self._last_working_dir):
+                target_workspace = self._last_working_dir
+            self._direct_shell = Persistent_Shell(
+                working_dir=target_workspace,
+                tmp_workspace=self._tmp_workspace_path,
+                capture_config=self._config.get("Output_Capture", {})
+            )
+            self._direct_shell.Start()
+            Set_Shell(self._direct_shell)
+        
+        # Agent在此期间可能切换过目录
+        Sync_Working_Dir(self._last_working_dir)
+        self._direct_shell.Clear_Interrupt()
+        
+        result = Execute_Command(command)
+        self._last_working_dir = Get_Last_Working_Dir()
+        output_files = Get_Output_Files()
+        Clear_Output_Files()
+        return result, output_files
+    
+    def _run_direct_command(self, command: str):
+        """
+        执行直接命令并回复邮件：Agent在运行时交给Agent的Shell（保持工作目录），
+        否则在Scheduler进程内的轻量Shell中执行
+        
+        Args:
+            command: 命令
+        """
+        start_time = time.time()
+        Log_Info("Scheduler", f"直接命令: {command}")
+        
+        if self.agent and self.agent.is_alive() and self._agent_activated:
+            self.to_agent_queue.put({"type": "direct_command", "command": command,
+                                     "working_dir": self._last_working_dir, "timestamp": time.time()})
+            response = self._check_agent_response()
+            if response and response.get("type") == "response":
+                self._send_response_email(response)
+            else:
+                self._comm.Send("抱歉，命令执行超时，请稍后重试。")
+            Log_Info("Scheduler", f"直接命令已回复, 耗时{time.time() - start_time:.2f}s")
+        else:
+            # 在后台线程中执行，主循环继续轮询邮箱（停止指令中断该命令）
+            def Run():
+                try:
+                    result, output_files = self._execute_direct_shell(command)
+                    self._comm.Send(self._build_email_content(result, output_files))
+                except Exception as e:
+                    Log_Info("Scheduler", f"直接命令执行失败: {e}")
+                    self._comm.Send(f"直接命令执行失败: {e}")
+                Log_Info("Scheduler", f"直接命令已回复, 耗时{time.time() - start_time:.2f}s")
+            
+            self._direct_thread = threading.Thread(target=Run, daemon=True)
+            self._direct_thread.start()
+    
+    def _direct_command_running(self) -> bool:
+        """Scheduler的Shell中是否有直接命令正在执行"""
+        return self._direct_thread is not None and self._direct_thread.is_alive()
+    
+    def _note_working_dir(self, response):
+        """记录Agent响应中带回的工作目录"""
+        if response and response.get("working_dir"):
+            self._last_working_dir = response["working_dir"]
+    
     def _check_agent_response(self):
-        """检查Agent响应"""
+        """
+        检查Agent响应
+        等待期间按poll_interval_active检查邮箱：收到停止指令时取消Agent当前任务，其他邮件留待之后处理；
+        超时后取消Agent当前任务，使其释放CPU而不是在后台继续运行
+        """
+        start_time = time.time()
+        next_poll_time = start_time + self.poll_interval_active
+        
+        while not self.stop_event.is_set():
+            remaining = self.agent_timeout - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            
+            try:
+                response = self.from_agent_queue.get(timeout=max(min(remaining, next_poll_time - time.time()), 0.1))
+                self.last_agent_response_time = time.time()
+                self._note_working_dir(response)
+                Log_Info("Scheduler", f"收到Agent响应: type={response.get('type')}")
+                return response
+            except queue.Empty:
+                pass
+            
+            if time.time() >= next_poll_time:
+                next_poll_time = time.time() + self.poll_interval_active
+                email_content = self._comm.Try_Receive()
+                if email_content:
+                    if self._is_cancel_command(email_content):
+                        self._cancel_agent("用户请求停止")
+                    else:
+                        self._pending_emails.append(email_content)
+        
+        Log_Info("Scheduler", "等待Agent响应超时")
+        self._cancel_agent("响应超时")
         try:
-            response = self.from_agent_queue.get(timeout=self.agent_timeout)
-            self.last_agent_response_time = time.time()
-            Log_Info("Scheduler", f"收到Agent响应: type={response.get('type')}")
-            return response
+            # 丢弃被取消任务的响应
+            response = self.from_agent_queue.get(timeout=self.cancel_grace)
+            self._note_working_dir(response)
+            Log_Info("Scheduler", f"Agent已结束被取消的任务: type={response.get('type')}")
         except queue.Empty:
-            Log_Info("Scheduler", "等待Agent响应超时")
-            return None
+            Log_Info("Scheduler", "Agent未在取消等待时间内结束任务")
+        return None
     
     def _try_get_agent_response(self):
         """非阻塞检查Agent响应"""
         try:
             response = self.from_agent_queue.get_nowait()
             self.last_agent_response_time = time.time()
+            self._note_working_dir(response)
             return response
         except queue.Empty:
             return None
@@ -258,11 +541,15 @@ class Scheduler:
             # Windows使用gbk编码，Unix使用utf-8
             file_encoding = 'gbk' if os.name == 'nt' else 'utf-8'
             
+            # 大文件只读取开头与结尾（附错误行与总行数/字节数），二进制输出不解码
+            capture_config = self._config.get("Output_Capture", {})
+            head_bytes = capture_config.get("email_head_bytes", 32768)
+            tail_bytes = capture_config.get("email_tail_bytes", 32768)
+            
             for i, file_path in enumerate(output_files, 1):
                 try:
                     if os.path.exists(file_path):
-                        with open(file_path, 'r', encoding=file_encoding, errors='replace') as f:
-                            content = f.read()
+                        content = Read_Output(file_path, head_bytes, tail_bytes, capture_config, file_encoding)
                         
                         filename = os.path.basename(file_path)
                         parts.append(f"\n--- [{i}] {filename} ---")
@@ -275,6 +562,97 @@ class Scheduler:
         
         return "\n".join(parts)
     
+    def _check_jobs(self):
+        """检查已结束的后台任务，逐个邮件通知用户（附任务输出），不需要Agent参与"""
+        if not self.job_notify:
+            return
+        
+        for job in Collect_Finished_Jobs(Get_Jobs_Dir(self._tmp_workspace_path)):
+            if job["status"] == "exited":
+                result = f"退出码 {job['exit_code']}"
+            else:
+                result = "进程已结束，但没有记录退出码（可能被系统强制终止）"
+            content = "\n".join([
+                f"后台任务 {job['id']} 已结束：{result}",
+                f"命令: {job['command']}",
+                f"工作目录: {job['working_dir']}",
+                f"耗时: {job['finished_at'] - job['started_at']:.1f}s"
+            ])
+            self._comm.Send(self._build_email_content(content, [job["log_file"]]))
+            Log_Info("Scheduler", f"后台任务{job['id']}已结束，已邮件通知用户: {result}")
+    
+    def _record_telemetry(self, telemetry: dict, email_ms: float):
+        """
+        累计Agent返回的计时记录与邮件发送耗时
+        
+        Args:
+            telemetry: Agent响应中的telemetry字段
+            email_ms: 邮件构建与发送耗时（毫秒）
+        """
+        totals = self.telemetry_totals
+        totals["requests"] += 1
+        totals["email_ms"] += email_ms
+        for key in ("total_ms", "prefill_ms", "decode_ms", "ttft_ms", "tool_ms", "evaluated_tokens", "generated_tokens"):
+            totals[key] += telemetry.get(key, 0)
+        plan_replay = telemetry.get("plan_cache") or {}
+        if plan_replay.get("hit") and not plan_replay.get("failed"):
+            totals["plan_cache_hits"] += 1
+            totals["plan_cache_saved_ms"] += plan_replay.get("saved_ms", 0.0)
+        if (telemetry.get("response_cache") or {}).get("hit"):
+            totals["response_cache_hits"] += 1
+        
+        Log_Info("Scheduler", f"请求计时: total={telemetry.get('total_ms', 0)}ms, prefill={telemetry.get('prefill_ms', 0)}ms, "
+                              f"decode={telemetry.get('decode_ms', 0)}ms, ttft={telemetry.get('ttft_ms', 0)}ms, "
+                              f"tool={telemetry.get('tool_ms', 0)}ms, email={email_ms:.1f}ms")
+        Log_Info("Scheduler", f"累计计时汇总: {self.get_telemetry_summary()}")
+    
+    def get_telemetry_summary(self) -> dict:
+        """
+        获取计时汇总（各阶段平均耗时与整体吞吐）
+        
+        Returns:
+            汇总字典
+        """
+        totals = self.telemetry_totals
+        requests = totals["requests"]
+        if requests == 0:
+            return {"requests": 0}
+        
+        summary = {"requests": requests}
+        for key in ("total_ms", "prefill_ms", "decode_ms", "ttft_ms", "tool_ms", "email_ms"):
+            summary[f"avg_{key}"] = round(totals[key] / requests, 1)
+        summary["prefill_tokens_per_second"] = round(totals["evaluated_tokens"] * 1000 / totals["prefill_ms"], 2) if totals["prefill_ms"] > 0 else 0.0
+        summary["decode_tokens_per_second"] = round(totals["generated_tokens"] * 1000 / totals["decode_ms"], 2) if totals["decode_ms"] > 0 else 0.0
+        summary["plan_cache_hit_rate"] = round(totals["plan_cache_hits"] / requests, 3)
+        summary["plan_cache_saved_ms"] = round(totals["plan_cache_saved_ms"], 1)
+        summary["response_cache_hit_rate"] = round(totals["response_cache_hits"] / requests, 3)
+        return summary
+    
+    def _send_response_email(self, response: dict, proactive: bool = False):
+        """
+        将Agent响应通过邮件发送给用户（包含命令输出文件内容），并记录计时
+        
+        Args:
+            response: Agent响应消息
+            proactive: 是否为Agent主动发来的消息
+        """
+        start_time = time.time()
+        reply_content = response.get("content", "")
+        output_files = response.get("output_files", [])
+        # 复用Agent读取输出文件时的扫描结果，写邮件时不再扫描全文
+        Import_Scan_Cache(response.get("output_scans"))
+        email_content = self._build_email_content(reply_content, output_files)
+        self._comm.Send(email_content)
+        email_ms = (time.time() - start_time) * 1000
+        
+        if proactive:
+            Log_Info("Scheduler", f"已将Agent主动响应通过邮件发送给用户，包含{len(output_files)}个输出文件")
+        else:
+            Log_Info("Scheduler", f"已将响应通过邮件发送给用户，包含{len(output_files)}个输出文件")
+        
+        if response.get("telemetry"):
+            self._record_telemetry(response["telemetry"], email_ms)
+    
     def start(self):
         """
         开始运行Scheduler主循环
@@ -282,6 +660,11 @@ class Scheduler:
         self._setup_signal_handlers()
         Log_Info("Scheduler", "Scheduler开始运行")
         
+        # 启动共享推理服务，预先启动待机Agent
+        self._start_model_server()
+        self._start_standby()
+        self._start_prefetch()
+        
         while not self.stop_event.is_set():
             # 检查日志清理（每24小时执行一次）
             self._check_and_cleanup_logs()
@@ -290,6 +673,8 @@ class Scheduler:
                 self._run_idle_state()
             else:
                 self._run_active_state()
+            
+            self._check_jobs()
         
         Log_Info("Scheduler", "Scheduler主循环结束")
     
@@ -300,7 +685,26 @@ class Scheduler:
             return  # 收到停止信号
         
         # 检查邮件
-        email_content = self._comm.Try_Receive()
+        email_content = self._receive_email()
+        
+        if email_content and self._is_cancel_command(email_content):
+            if self._direct_command_running():
+                Log_Info("Scheduler", "收到停止指令，中断正在执行的直接命令")
+                self._direct_shell.Interrupt()
+            else:
+                Log_Info("Scheduler", "收到停止指令，但当前没有正在执行的任务")
+            email_content = None
+        
+        if email_content:
+            command = self._parse_direct_command(email_content)
+            if command and self._direct_command_running():
+                # 上一条直接命令仍在执行，留到下次轮询
+                self._pending_emails.append(email_content)
+                email_content = None
+            elif command:
+                self.last_email_time = time.time()
+                self._run_direct_command(command)
+                email_content = None
         
         if email_content:
             Log_Info("Scheduler", "收到用户邮件，切换到Active状态")
@@ -322,16 +726,14 @@ class Scheduler:
                 
                 # 将Agent响应通过邮件发送给用户（包含命令输出文件内容）
                 if response.get("type") == "response":
-                    reply_content = response.get("content", "")
-                    output_files = response.get("output_files", [])
-                    email_content = self._build_email_content(reply_content, output_files)
-                    self._comm.Send(email_content)
-                    Log_Info("Scheduler", f"已将响应通过邮件发送给用户，包含{len(output_files)}个输出文件")
+                    self._send_response_email(response)
             else:
                 Log_Info("Scheduler", "Agent响应超时，返回Idle状态")
                 self._comm.Send("抱歉，处理您的请求时超时，请稍后重试。")
                 if not self.agent_persistence:
                     self._stop_agent()
+                    self._start_standby()
+                    self._start_prefetch()
     
     def _run_active_state(self):
         """Active状态处理"""
@@ -340,12 +742,37 @@ class Scheduler:
             return  # 收到停止信号
         
         # 检查邮件
-        email_content = self._comm.Try_Receive()
+        email_content = self._receive_email()
+        
+        if email_content and self._is_cancel_command(email_content):
+            if self._direct_command_running():
+                Log_Info("Scheduler", "收到停止指令，中断正在执行的直接命令")
+                self._direct_shell.Interrupt()
+            else:
+                Log_Info("Scheduler", "收到停止指令，但当前没有正在执行的任务")
+            email_content = None
+        
+        if email_content:
+            command = self._parse_direct_command(email_content)
+            if command and self._direct_command_running():
+                # 上一条直接命令仍在执行，留到下次轮询
+                self._pending_emails.append(email_content)
+                email_content = None
+            elif command:
+                self.last_email_time = time.time()
+                self._run_direct_command(command)
+                email_content = None
         
         if email_content:
             Log_Info("Scheduler", "Active状态收到新邮件")
             self.last_email_time = time.time()
             
+            # Agent可能已按空闲策略自行退出，需要时重新启动
+            if not self._start_agent():
+                Log_Info("Scheduler", "Agent启动失败")
+                self._comm.Send("抱歉，Agent启动失败，请稍后重试。")
+                return
+            
             # 发送消息给Agent
             self._send_to_agent(email_content)
             
@@ -356,11 +783,7 @@ class Scheduler:
                 
                 # 将Agent响应通过邮件发送给用户（包含命令输出文件内容）
                 if response.get("type") == "response":
-                    reply_content = response.get("content", "")
-                    output_files = response.get("output_files", [])
-                    email_content = self._build_email_content(reply_content, output_files)
-                    self._comm.Send(email_content)
-                    Log_Info("Scheduler", f"已将响应通过邮件发送给用户，包含{len(output_files)}个输出文件")
+                    self._send_response_email(response)
         
         # 检查是否有Agent主动发来的消息
         while True:
@@ -369,11 +792,7 @@ class Scheduler:
                 self.last_agent_response_time = time.time()
                 # 将Agent响应通过邮件发送给用户（包含命令输出文件内容）
                 if response.get("type") == "response":
-                    reply_content = response.get("content", "")
-                    output_files = response.get("output_files", [])
-                    email_content = self._build_email_content(reply_content, output_files)
-                    self._comm.Send(email_content)
-                    Log_Info("Scheduler", f"已将Agent主动响应通过邮件发送给用户，包含{len(output_files)}个输出文件")
+                    self._send_response_email(response, proactive=True)
             else:
                 break
         
@@ -384,6 +803,8 @@ class Scheduler:
             
             if not self.agent_persistence:
                 self._stop_agent()
+                self._start_standby()
+                self._start_prefetch()
     
     def shutdown(self):
         """优雅退出"""
@@ -393,6 +814,18 @@ class Scheduler:
         if self.agent and self.agent.is_alive():
             self._stop_agent()
         
+        self._stop_model_server()
+        
+        if self._direct_command_running():
+            self._direct_shell.Interrupt()
+            self._direct_thread.join(timeout=5)
+        if self._direct_shell is not None:
+            self._direct_shell.Stop()
+            self._direct_shell = None
+        
+        # 临时工作目录即将清理，结束仍在运行的后台任务
+        Cancel_Running_Jobs(Get_Jobs_Dir(self._tmp_workspace_path))
+        
         # 清理临时工作目录
         self._cleanup_tmp_workspace()
         
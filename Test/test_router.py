@@ -0,0 +1,73 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+test_router - 测试多模型路由的多步骤判断
+单步骤请求（即使包含"并"/"and"）应路由到小模型，带顺序提示词的请求应路由到大模型
+不需要加载模型
+"""
+
+import os
+import sys
+
+# 添加Src目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Src"))
+
+from Agent.Router import Model_Router
+
+
+# 单步骤请求：应路由到小模型
+SINGLE_STEP_MESSAGES = [
+    "请帮我查看当前的GPU状况",
+    "列出当前目录的文件并按大小排序",
+    "合并这两个日志文件",
+    "查看磁盘和内存使用情况",
+    "show disk and memory usage",
+    "find files larger than 1GB and delete them",
+    "print the first 10 lines of config.json",
+    "再查看一次GPU状况",
+]
+
+# 多步骤请求：应路由到大模型
+MULTI_STEP_MESSAGES = [
+    "先编译项目，然后运行测试",
+    "下载数据集，接着解压并统计文件数",
+    "build the project, then run the tests",
+    "clone the repo and, after that, install dependencies",
+    "1. 查看GPU状况\n2. 查看磁盘空间",
+    "第一步备份数据库，第二步升级",
+    "首先查看日志，并找出错误",
+]
+
+
+def main():
+    """
+    主测试函数
+    """
+    print("=" * 60)
+    print("Model Router Multi-Step Detection Test")
+    print("=" * 60)
+    
+    specs = [
+        {"name": "small", "model_path": "small.gguf", "multi_step": False},
+        {"name": "large", "model_path": "large.gguf", "multi_step": True}
+    ]
+    router = Model_Router(specs, loader=lambda spec: None, unloader=lambda handle: None)
+    
+    failures = 0
+    for expected, messages in (("small", SINGLE_STEP_MESSAGES), ("large", MULTI_STEP_MESSAGES)):
+        for message in messages:
+            chosen = router.Route(message)
+            status = "OK" if chosen == expected else "FAIL"
+            if chosen != expected:
+                failures += 1
+            print(f"[{status}] {chosen:<5} <- {message!r}")
+    
+    print("=" * 60)
+    print(f"{failures} failure(s)")
+    print("\n[Test Completed]")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
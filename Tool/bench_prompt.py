@@ -0,0 +1,127 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+提示词分词基准测试脚本 - 对比每轮迭代整体渲染+分词与按消息缓存token ids的CPU耗时
+只加载模型词表（vocab_only），不加载权重
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+PROJECT_DIR = SCRIPT_DIR.parent
+CONFIG_PATH = PROJECT_DIR / "Src" / "Config" / "config.json"
+
+sys.path.insert(0, str(PROJECT_DIR / "Src"))
+
+from Agent.Agent import Agent
+from Agent.Session import LLM_Session
+from API.Exec import API_DESCRIPTION
+
+# 模拟的命令输出（每轮工具结果）
+SAMPLE_OUTPUT = (
+    "[Exit Code: 0]\n[Working Dir: /home/user/project]\n[STDOUT]\n"
+    + "drwxr-xr-x  5 user user  4096 Jan 20 10:00 Src\n-rw-r--r--  1 user user  2048 Jan 20 10:00 Readme.md\n" * 12
+)
+
+
+def Load_Agent_Config() -> dict:
+    """读取config.json中的Agent配置，不存在时返回空字典"""
+    if not CONFIG_PATH.exists():
+        return {}
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("Agent", {})
+
+
+def Build_Conversation(system_prompt: str, iterations: int, request: int) -> list:
+    """
+    构建每轮迭代的消息列表（系统提示词 + 用户任务 + 逐轮增加的工具调用与结果）
+    
+    Args:
+        system_prompt: 系统提示词
+        iterations: 迭代轮数
+        request: 请求编号（使每次请求的工具结果不同）
+    
+    Returns:
+        每轮迭代的消息列表
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "检查项目目录结构，然后查看git状态和磁盘使用情况"}
+    ]
+    rounds = []
+    for index in range(iterations):
+        rounds.append(list(messages))
+        messages.append({"role": "assistant", "content": json.dumps({"tool": "Execute_Command", "args": {"command": f"ls -la step{index}"}})})
+        messages.append({"role": "user", "content": f"Tool result: [request {request} step {index}]\n{SAMPLE_OUTPUT}"})
+    return rounds
+
+
+def Main():
+    """主函数"""
+    agent_config = Load_Agent_Config()
+    
+    parser = argparse.ArgumentParser(description="对比整体分词与按消息缓存分词的每轮迭代CPU耗时")
+    parser.add_argument("-m", "--model", type=str, default=agent_config.get("model_path"),
+                        help="模型路径 (默认: config.json中的model_path)")
+    parser.add_argument("-i", "--iterations", type=int, default=agent_config.get("max_iterations", 10),
+                        help="每次请求的迭代轮数 (默认: config.json中的max_iterations)")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="重复请求次数 (默认: 20)")
+    args = parser.parse_args()
+    
+    if not args.model:
+        print("未指定模型路径，请使用 -m 参数或在config.json中配置model_path")
+        sys.exit(1)
+    
+    model_path = args.model if os.path.isabs(args.model) else str(PROJECT_DIR / args.model)
+    if not os.path.exists(model_path):
+        print(f"模型文件不存在: {model_path}")
+        sys.exit(1)
+    
+    from llama_cpp import Llama
+    model = Llama(model_path=model_path, vocab_only=True, verbose=False)
+    
+    # 与Agent相同的系统提示词（只需要parallel_tool_calls和system_prompt两个属性）
+    prompt_config = types.SimpleNamespace(
+        parallel_tool_calls=agent_config.get("parallel_tool_calls", False),
+        system_prompt=agent_config.get("system_prompt", "You are a helpful AI assistant.")
+    )
+    tool_descriptions = f"- Execute_Command: {API_DESCRIPTION}"
+    
+    # 原方式：每次请求重新拼接系统提示词，每轮迭代整体渲染并分词
+    session = LLM_Session(model)
+    start_time = time.perf_counter()
+    for request in range(args.repeat):
+        system_prompt = Agent._Build_System_Prompt(prompt_config, tool_descriptions)
+        for messages in Build_Conversation(system_prompt, args.iterations, request):
+            full_tokens = session.Tokenize(session.Format_Messages(messages), add_bos=True)
+    full_seconds = time.perf_counter() - start_time
+    
+    # 缓存方式：系统提示词编译一次，每轮迭代只对新增消息分词
+    session = LLM_Session(model)
+    system_prompt = Agent._Build_System_Prompt(prompt_config, tool_descriptions)
+    start_time = time.perf_counter()
+    for request in range(args.repeat):
+        for messages in Build_Conversation(system_prompt, args.iterations, request):
+            cached_tokens = session.Tokenize_Messages(messages)
+    cached_seconds = time.perf_counter() - start_time
+    
+    total_iterations = args.repeat * args.iterations
+    print(f"模型: {model_path}")
+    print(f"系统提示词: {len(system_prompt)} 字符, 最后一轮prompt: {len(full_tokens)} tokens")
+    print(f"分词结果一致: {full_tokens == cached_tokens}")
+    print("-" * 60)
+    print(f"整体分词:   {full_seconds * 1e6 / total_iterations:10.1f} us/迭代")
+    print(f"缓存分词:   {cached_seconds * 1e6 / total_iterations:10.1f} us/迭代")
+    print(f"每轮节省:   {(full_seconds - cached_seconds) * 1e6 / total_iterations:10.1f} us/迭代 "
+          f"({full_seconds / max(cached_seconds, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,83 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+Shell基准测试脚本 - 测量持久化Shell执行简单命令的单次开销
+分别测量Persistent_Shell.Execute与Exec.Execute_Command（Agent实际调用的工具函数）
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+PROJECT_DIR = SCRIPT_DIR.parent
+
+sys.path.insert(0, str(PROJECT_DIR / "Src"))
+
+from API.Shell import Persistent_Shell
+from API.Exec import Execute_Command, Set_Shell
+
+
+def Measure(func, command: str, repeat: int) -> list:
+    """
+    重复执行命令并记录每次耗时
+    
+    Args:
+        func: 执行函数
+        command: 命令
+        repeat: 重复次数
+    
+    Returns:
+        每次耗时列表（毫秒）
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(command)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return timings
+
+
+def Format_Timings(timings: list) -> str:
+    """格式化耗时统计（平均值/中位数/p95/最大值）"""
+    ordered = sorted(timings)
+    average = sum(ordered) / len(ordered)
+    p50 = ordered[len(ordered) // 2]
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"avg={average:7.2f}ms  p50={p50:7.2f}ms  p95={p95:7.2f}ms  max={ordered[-1]:7.2f}ms"
+
+
+def Main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="测量持久化Shell执行简单命令的单次开销")
+    parser.add_argument("-r", "--repeat", type=int, default=200, help="每条命令的重复次数 (默认: 200)")
+    parser.add_argument("-c", "--commands", type=str, default="true,pwd,echo hello",
+                        help="测试命令，逗号分隔 (默认: true,pwd,echo hello)")
+    args = parser.parse_args()
+    
+    tmp_workspace = tempfile.mkdtemp(prefix="columba_bench_shell_")
+    shell = Persistent_Shell(working_dir=str(PROJECT_DIR), tmp_workspace=tmp_workspace)
+    
+    start_time = time.perf_counter()
+    shell.Start()
+    print(f"Shell启动: {(time.perf_counter() - start_time) * 1000:.2f}ms")
+    Set_Shell(shell)
+    
+    try:
+        print("-" * 80)
+        for command in args.commands.split(","):
+            print(f"[{command}]")
+            print(f"  Persistent_Shell.Execute: {Format_Timings(Measure(shell.Execute, command, args.repeat))}")
+            print(f"  Exec.Execute_Command:     {Format_Timings(Measure(Execute_Command, command, args.repeat))}")
+    finally:
+        shell.Stop()
+        shutil.rmtree(tmp_workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,181 @@
+#Presented by KeJi
+#Date : 2026-01-20
+
+"""
+推理参数调优脚本 - 在本机上对GGUF模型做基准测试
+遍历线程数、批大小和KV cache量化类型，将最快的组合写入调优档案，Agent加载模型时自动应用
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+PROJECT_DIR = SCRIPT_DIR.parent
+CONFIG_PATH = PROJECT_DIR / "Src" / "Config" / "config.json"
+
+sys.path.insert(0, str(PROJECT_DIR / "Src"))
+
+from Agent.Tuning import Save_Profile, Build_Llama_Kwargs, Get_CPU_Model, KV_CACHE_TYPES
+
+# 基准测试使用的文本（中英混合，接近实际的系统提示词与命令输出）
+SAMPLE_TEXT = (
+    "你是Columba，是一个服务器上运行的agent，能够通过电子邮件与用户交流，并执行各种任务来帮助用户完成目标。\n"
+    "Filesystem      Size  Used Avail Use% Mounted on\n/dev/sda1       100G   42G   58G  42% /\n"
+    '{"tool": "Execute_Command", "args": {"command": "nvidia-smi"}}\n'
+)
+
+
+def Parse_Int_List(text: str) -> list:
+    """解析逗号分隔的整数列表"""
+    return [int(item) for item in text.split(",") if item.strip()]
+
+
+def Default_Thread_Counts() -> list:
+    """根据CPU核数生成默认的线程数候选"""
+    cpu_count = os.cpu_count() or 4
+    candidates = {max(1, cpu_count // 4), max(1, cpu_count // 2), max(1, cpu_count * 3 // 4), cpu_count}
+    return sorted(candidates)
+
+
+def Load_Agent_Config() -> dict:
+    """读取config.json中的Agent配置，不存在时返回空字典"""
+    if not CONFIG_PATH.exists():
+        return {}
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("Agent", {})
+
+
+def Benchmark(model_path: str, n_ctx: int, n_threads: int, n_batch: int, kv_cache_type: str,
+              prompt_tokens: int, gen_tokens: int) -> dict:
+    """
+    对一组参数做基准测试
+    
+    Args:
+        model_path: 模型路径
+        n_ctx: 上下文长度
+        n_threads: 线程数
+        n_batch: 批大小
+        kv_cache_type: KV cache类型
+        prompt_tokens: prefill测试的token数
+        gen_tokens: decode测试的token数
+    
+    Returns:
+        {"prefill_tokens_per_second", "decode_tokens_per_second", "seconds"}
+    """
+    from llama_cpp import Llama
+    
+    model = Llama(
+        model_path=model_path,
+        n_ctx=n_ctx,
+        verbose=False,
+        **Build_Llama_Kwargs(n_threads, n_batch, kv_cache_type)
+    )
+    try:
+        sample = model.tokenize(SAMPLE_TEXT.encode("utf-8"), add_bos=False)
+        tokens = (sample * (prompt_tokens // len(sample) + 1))[:prompt_tokens]
+        
+        # prefill：一次评估整段prompt
+        start_time = time.time()
+        model.eval(tokens)
+        prefill_seconds = time.time() - start_time
+        
+        # decode：逐token评估
+        start_time = time.time()
+        for index in range(gen_tokens):
+            model.eval([sample[index % len(sample)]])
+        decode_seconds = time.time() - start_time
+    finally:
+        close = getattr(model, "close", None)
+        if close is not None:
+            close()
+        del model
+    
+    return {
+        "prefill_tokens_per_second": prompt_tokens / prefill_seconds,
+        "decode_tokens_per_second": gen_tokens / decode_seconds,
+        "seconds": prefill_seconds + decode_seconds
+    }
+
+
+def Main():
+    """主函数"""
+    agent_config = Load_Agent_Config()
+    
+    parser = argparse.ArgumentParser(description="在本机上基准测试GGUF模型并生成调优档案")
+    parser.add_argument("-m", "--model", type=str, default=agent_config.get("model_path"),
+                        help="模型路径 (默认: config.json中的model_path)")
+    parser.add_argument("-t", "--threads", type=str, default=None,
+                        help="线程数候选，逗号分隔 (默认: 根据CPU核数生成)")
+    parser.add_argument("-b", "--batch", type=str, default="128,256,512",
+                        help="批大小候选，逗号分隔 (默认: 128,256,512)")
+    parser.add_argument("-k", "--kv", type=str, default="f16,q8_0",
+                        help=f"KV cache类型候选，逗号分隔，可选{','.join(KV_CACHE_TYPES)} (默认: f16,q8_0)")
+    parser.add_argument("--ctx", type=int, default=agent_config.get("context_length", 2048),
+                        help="上下文长度 (默认: config.json中的context_length)")
+    parser.add_argument("--prompt-tokens", type=int, default=512, help="prefill测试token数 (默认: 512)")
+    parser.add_argument("--gen-tokens", type=int, default=64, help="decode测试token数 (默认: 64)")
+    parser.add_argument("--cache-dir", type=str, default=agent_config.get("cache_dir", ".columba_cache"),
+                        help="调优档案目录 (默认: config.json中的cache_dir)")
+    args = parser.parse_args()
+    
+    if not args.model:
+        print("未指定模型路径，请使用 -m 参数或在config.json中配置model_path")
+        sys.exit(1)
+    
+    model_path = args.model if os.path.isabs(args.model) else str(PROJECT_DIR / args.model)
+    cache_dir = args.cache_dir if os.path.isabs(args.cache_dir) else str(PROJECT_DIR / args.cache_dir)
+    if not os.path.exists(model_path):
+        print(f"模型文件不存在: {model_path}")
+        sys.exit(1)
+    
+    threads = Parse_Int_List(args.threads) if args.threads else Default_Thread_Counts()
+    batches = Parse_Int_List(args.batch)
+    kv_types = [item.strip() for item in args.kv.split(",") if item.strip() in KV_CACHE_TYPES]
+    
+    print(f"模型: {model_path}")
+    print(f"CPU: {Get_CPU_Model()}")
+    print(f"线程数: {threads}, 批大小: {batches}, KV cache: {kv_types}")
+    print("-" * 60)
+    
+    best = None
+    for kv_cache_type in kv_types:
+        for n_batch in batches:
+            for n_threads in threads:
+                try:
+                    result = Benchmark(model_path, args.ctx, n_threads, n_batch, kv_cache_type,
+                                       args.prompt_tokens, args.gen_tokens)
+                except Exception as e:
+                    print(f"threads={n_threads:<3} batch={n_batch:<4} kv={kv_cache_type:<5} 失败: {e}")
+                    continue
+                
+                print(f"threads={n_threads:<3} batch={n_batch:<4} kv={kv_cache_type:<5} "
+                      f"prefill={result['prefill_tokens_per_second']:8.1f} t/s  "
+                      f"decode={result['decode_tokens_per_second']:6.2f} t/s  "
+                      f"total={result['seconds']:.2f}s")
+                
+                if best is None or result["seconds"] < best["seconds"]:
+                    best = dict(result, n_threads=n_threads, n_batch=n_batch, kv_cache_type=kv_cache_type)
+    
+    print("-" * 60)
+    if best is None:
+        print("没有可用的参数组合")
+        sys.exit(1)
+    
+    profile = {
+        "n_threads": best["n_threads"],
+        "n_batch": best["n_batch"],
+        "kv_cache_type": best["kv_cache_type"],
+        "prefill_tokens_per_second": round(best["prefill_tokens_per_second"], 2),
+        "decode_tokens_per_second": round(best["decode_tokens_per_second"], 2),
+    }
+    Save_Profile(cache_dir, model_path, profile)
+    print(f"最优参数: threads={best['n_threads']}, batch={best['n_batch']}, kv={best['kv_cache_type']}")
+    print(f"调优档案已写入: {os.path.join(cache_dir, 'tuning_profiles.json')}")
+
+
+if __name__ == "__main__":
+    Main()